@@ -1,8 +1,13 @@
+import csv
+import json
 from os.path import abspath
+import resource
+import time
 
 import tensorflow as tf
 import numpy as np
-import matplotlib.pyplot as plt
+
+from chesspos.preprocessing.sample_generator import SampleGenerator
 
 class SkMetrics(tf.keras.callbacks.Callback):
 	'''
@@ -34,7 +39,92 @@ class SkMetrics(tf.keras.callbacks.Callback):
 		self.frac_correct.append(frac.numpy())
 		print(f" triplet_acc: {self.frac_correct[-1]}")
 
+class StepTimeMonitor(tf.keras.callbacks.Callback):
+	'''
+	Callback that records for every step the time waiting for input and computing, samples/sec and peak RSS.
+	Steps are written to step_times.csv and epoch summaries to epoch_times.json in save_dir, and every
+	epoch ends with a one line verdict whether training is input or compute bound.
+	Input time is the time the train step spent in input_generator, without one it is not recorded.
+	'''
+	def __init__(self, save_dir, batch_size, input_generator: SampleGenerator = None, input_bound_fraction=0.3):
+		super(StepTimeMonitor, self).__init__()
+		self.save_dir = abspath(save_dir)
+		self.batch_size = batch_size
+		self.input_generator = input_generator
+		# verdict input bound from this fraction of step time spent waiting for input
+		self.input_bound_fraction = input_bound_fraction
+		self.epochs = []
+
+	@staticmethod
+	def peak_rss_mb():
+		# ru_maxrss is in kilobytes on linux
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+	def _wait_seconds(self):
+		# The native tf.data pipeline reads outside of the generator
+		if self.input_generator is None or self.input_generator.native:
+			return np.nan
+		return self.input_generator.wait_seconds
+
+	def on_train_begin(self, logs=None):
+		self.epochs = []
+		with open(f"{self.save_dir}/step_times.csv", 'w', newline='') as step_file:
+			csv.writer(step_file).writerow(
+				["epoch", "step", "steps", "step_seconds", "input_seconds", "compute_seconds", "samples_per_second", "peak_rss_mb"]
+			)
+
+	def on_epoch_begin(self, epoch, logs=None):
+		self._steps = []
+		self._last_step = -1
+
+	def on_train_batch_begin(self, batch, logs=None):
+		self._step_start = time.perf_counter()
+		self._wait_start = self._wait_seconds()
+
+	def on_train_batch_end(self, batch, logs=None):
+		step_seconds = time.perf_counter() - self._step_start
+		# batch is the last step of the execution, with steps_per_execution one call covers several steps
+		steps = batch - self._last_step
+		self._last_step = batch
+		input_seconds = min(self._wait_seconds() - self._wait_start, step_seconds)
+		self._steps.append([
+			len(self.epochs), batch, steps, step_seconds, input_seconds, step_seconds - input_seconds,
+			steps * self.batch_size / step_seconds, self.peak_rss_mb()
+		])
+
+	def on_epoch_end(self, epoch, logs=None):
+		with open(f"{self.save_dir}/step_times.csv", 'a', newline='') as step_file:
+			csv.writer(step_file).writerows(self._steps)
+
+		steps = np.asarray(self._steps, dtype=np.float64).reshape((-1, 8))
+		step_seconds, input_seconds = np.sum(steps[:, 3]), np.sum(steps[:, 4])
+		summary = {
+			"epoch": epoch,
+			"steps": int(np.sum(steps[:, 2])),
+			"step_seconds": step_seconds,
+			"input_seconds": None if np.isnan(input_seconds) else input_seconds,
+			"compute_seconds": None if np.isnan(input_seconds) else step_seconds - input_seconds,
+			"samples_per_second": np.sum(steps[:, 2]) * self.batch_size / step_seconds if step_seconds > 0 else 0.0,
+			"peak_rss_mb": self.peak_rss_mb()
+		}
+		if summary["input_seconds"] is None:
+			summary["verdict"] = "unknown"
+		elif input_seconds >= self.input_bound_fraction * step_seconds:
+			summary["verdict"] = "input bound"
+		else:
+			summary["verdict"] = "compute bound"
+		self.epochs.append(summary)
+		with open(f"{self.save_dir}/epoch_times.json", 'w') as epoch_file:
+			json.dump(self.epochs, epoch_file, indent=2)
+
+		input_share = "unknown share" if summary["input_seconds"] is None else f"{input_seconds / max(step_seconds, 1e-12):.0%}"
+		print(
+			f" step times: {input_share} waiting for input, {summary['samples_per_second']:.0f} samples/s, "
+			f"peak RSS {summary['peak_rss_mb']:.0f} MB -> {summary['verdict']}"
+		)
+
 def plot_metrics(save_dir, loss_arr, loss_labels, other_metric=None, other_label=None):
+	import matplotlib.pyplot as plt
 	assert len(loss_arr) == len(loss_labels)
 
 	fig, ax1 = plt.subplots()
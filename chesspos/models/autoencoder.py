@@ -1,46 +1,94 @@
 from abc import abstractmethod
-from functools import cmp_to_key, wraps
-from typing import Callable, List, overload
+from functools import wraps
+import heapq
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Tuple, Union, overload
 from colorama import Fore, Style
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers, Model
 
+import h5py
 import numpy as np
 import chess
 
+from chesspos.models.export import convert_to_tflite, export_encoder
 from chesspos.models.trainable_model import TrainableModel
+from chesspos.preprocessing.flat_storage import describe_flat
+from chesspos.preprocessing.packing import PACKBITS, decode_encodings, unpack_encodings
 
 class AutoencoderModel(TrainableModel):
+	# Encoders with ops that TFLite has no builtin kernel for are exported with tensorflow ops, see convert_to_tflite
+	tflite_select_tf_ops = False
+
 	@wraps(TrainableModel.__init__)
 	def __init__(
 		self,
 		output_to_board: Callable[[np.ndarray], chess.Board] = None,
 		**kwargs
 	) -> None:
+		# encoder, decoder and autoencoder of _model_helper, built once by _define_model
+		self._graph = None
 		super(AutoencoderModel, self).__init__(**kwargs)
 
-		self.encoder = self._define_encoder()
-		self.decoder = self._define_decoder()
+		with self.distribute_strategy.scope(), self.performance_profile.policy():
+			self.encoder = self._define_encoder()
+			self.decoder = self._define_decoder()
 		self.output_to_board = output_to_board
+		self._encode = None
+		self._sample_loss = None
 
 		self._compile()
 
 	def _compile(self) -> None:
 		super()._compile()
-		self.encoder.compile(optimizer=self.optimizer, loss=None, metrics=None)
-		keras.utils.plot_model(self.encoder, to_file=f"{self.save_dir}/encoder.png", show_shapes=True)
+		self.encoder.compile(optimizer=self.optimizer, loss=None, metrics=None, **self.performance_profile.compile_options())
+		self._plot(self.encoder, "encoder")
 
-		self.decoder.compile(optimizer=self.optimizer, loss=None, metrics=None)
-		keras.utils.plot_model(self.decoder, to_file=f"{self.save_dir}/decoder.png", show_shapes=True)
+		self.decoder.compile(optimizer=self.optimizer, loss=None, metrics=None, **self.performance_profile.compile_options())
+		self._plot(self.decoder, "decoder")
 
 	@abstractmethod
-	def _define_encoder(self) -> Model:
+	def _model_helper(self) -> dict:
+		"""Build the graph: a dict of the encoder, the decoder and the autoencoder that chains them"""
 		pass
 
-	@abstractmethod
+	def _get_graph(self) -> dict:
+		if self._graph is None:
+			self._graph = self._model_helper()
+		return self._graph
+
+	def _define_encoder(self) -> Model:
+		return self._get_graph()['encoder']
+
 	def _define_decoder(self) -> Model:
-		pass
+		return self._get_graph()['decoder']
+
+	def _define_model(self) -> Model:
+		return self._get_graph()['autoencoder']
+
+	def load(self) -> None:
+		super().load()
+		# the loaded autoencoder holds the encoder and decoder as its layers
+		self.encoder = self.model.get_layer('encoder')
+		self.decoder = self.model.get_layer('decoder')
+		self._encode = None
+		self._sample_loss = None
+
+	def export_encoder(self, quantization: str = None, export_dir: str = None) -> str:
+		"""
+		Export the encoder alone for serving, to save_dir/encoder by default: a SavedModel with a fixed
+		signature, and with quantization float32, float16 or int8 an encoder.tflite next to it, that
+		chesspos.serving.tflite_encoder.TFLiteEncoder runs. int8 ranges are calibrated on the test generator.
+		"""
+		export_dir = export_dir or f"{self.save_dir}/encoder"
+		export_encoder(self.encoder, export_dir)
+		if quantization is None:
+			return export_dir
+		return convert_to_tflite(
+			self.encoder, export_dir, quantization=quantization, calibration_generator=self.test_generator,
+			select_tf_ops=self.tflite_select_tf_ops
+		)
 
 	def get_encoder(self):
 		return self.encoder
@@ -49,6 +97,61 @@ class AutoencoderModel(TrainableModel):
 	def get_decoder(self):
 		return self.decoder
 
+	def _embed_block(self, inputs: np.ndarray) -> np.ndarray:
+		"""Run the encoder alone on a block of inputs, in a function that is traced once per block shape"""
+		if self._encode is None:
+			self._encode = tf.function(lambda x: self.encoder(x, training=False), reduce_retracing=True)
+		# keras 3 input dtypes are strings, keras 2 ones tf.DTypes
+		input_dtype = tf.as_dtype(self.encoder.inputs[0].dtype).as_numpy_dtype
+		inputs = np.asarray(inputs, dtype=input_dtype).reshape((-1, *self.encoder.input_shape[1:]))
+		return self._encode(inputs).numpy()
+
+	def embed_array(
+		self,
+		encodings: Union[np.ndarray, h5py.Dataset],
+		batch_size: int = 4096,
+		packed_shape: Tuple[int, ...] = None
+	) -> Iterator[np.ndarray]:
+		"""
+		Yield the embeddings of stored encodings in blocks of batch_size rows. encodings is an array,
+		a memory mapped flat file or an h5 dataset, only one block of it is read at a time. Bit-packed
+		datasets and flat files are unpacked, a packed array needs the shape of a single encoding, packed_shape.
+		"""
+		if packed_shape is None and isinstance(encodings, np.memmap) and encodings.filename is not None:
+			description = describe_flat(encodings.filename)
+			if description["codec"] == PACKBITS:
+				packed_shape = tuple(description["encoding_shape"])
+		for start in range(0, encodings.shape[0], batch_size):
+			block = encodings[start:start+batch_size]
+			if isinstance(encodings, h5py.Dataset):
+				block = decode_encodings(block, encodings)
+			elif packed_shape is not None:
+				block = unpack_encodings(np.asarray(block), packed_shape)
+			embeddings = self._embed_block(block)
+			if embeddings.shape[0] != block.shape[0]:
+				raise ValueError(f"Encodings of shape {block.shape[1:]} do not fit the encoder input {self.encoder.input_shape[1:]}")
+			yield embeddings
+
+	def embed_boards(
+		self,
+		boards: Iterable[chess.Board],
+		batch_size: int = 4096,
+		boards_to_input: Callable[[List[chess.Board]], np.ndarray] = None
+	) -> Iterator[np.ndarray]:
+		"""
+		Yield the embeddings of a stream of boards in blocks of batch_size boards, only one block is held at a time.
+		Blocks are converted with a batched converter like position_processors.boards_to_tensors or board by
+		board with board_to_input, so every position needs a board object of its own, e.g. a copy.
+		"""
+		if boards_to_input is None:
+			self._check_input_converter()
+			boards_to_input = lambda block: np.stack([self.board_to_input(board) for board in block])
+		boards = iter(boards)
+		block = list(islice(boards, batch_size))
+		while len(block) > 0:
+			yield self._embed_block(boards_to_input(block))
+			block = list(islice(boards, batch_size))
+
 	@staticmethod
 	def binarize_array(array, threshold=0.5):
 		return np.where(array > threshold, True, False)
@@ -75,50 +178,68 @@ class AutoencoderModel(TrainableModel):
 
 	def evaluate_from_board(self, boards: List[chess.Board]) -> np.float32:
 		self._check_input_converter()
-		inputs = np.empty((len(boards), *self.train_generator.sample_shape))
+		inputs = np.empty((len(boards), *self.train_generator.sample_shape), dtype=self.train_generator.sample_type)
 		for i, board in enumerate(boards):
 			inputs[i] = self.board_to_input(board)
 		return self.evaluate(inputs)
 
-	def _get_sorted_losses(self, sort_fn: Callable, number_samples: int = 1000) -> List[dict]:
+	def _sample_losses(self, inputs: np.ndarray) -> np.ndarray:
+		"""Reconstruction loss of every sample of a batch in one forward pass, the loss evaluate reports for the sample alone"""
+		if self._sample_loss is None:
+			if self.loss is None:
+				raise ValueError("Per sample losses require a loss")
+			loss_fn = keras.losses.get(self.loss)
+			# Loss.call is the unreduced loss function of a keras Loss
+			loss_fn = loss_fn.call if isinstance(loss_fn, keras.losses.Loss) else loss_fn
+			def sample_loss(x):
+				losses = tf.cast(loss_fn(x, self.model(x, training=False)), tf.float32)
+				return tf.reduce_mean(tf.reshape(losses, (tf.shape(losses)[0], -1)), axis=1)
+			self._sample_loss = tf.function(sample_loss, reduce_retracing=True)
+		return self._sample_loss(inputs).numpy()
+
+	def _get_sorted_losses(self, number_samples: int, test_samples: int, worst: bool = False) -> List[dict]:
+		"""
+		The number_samples test samples with the lowest, or with worst=True the highest, loss out of the first
+		test_samples samples, sorted from best to worst or from worst to best.
+		Only the candidates of every batch are pushed to a heap that holds number_samples samples at most.
+		"""
 		test_generator = self.test_generator.get_generator()
 		batch_size = self.test_generator.batch_size
-		batches = max(number_samples // batch_size, 1)
-		samples = []
+		batches = max(test_samples // batch_size, 1)
+		# heapq is a min-heap, the sample that is dropped first has the smallest key
+		sign = 1.0 if worst else -1.0
+		heap = []
 
-		for _ in range(batches):
+		for i in range(batches):
 			x, __ = next(test_generator)
-			print(x.shape)
-			for j in range(batch_size):
-				input = x[j].reshape(1, *x[j].shape)
-				loss = self.model.evaluate(input, input, verbose=0)
-				samples.append({'input':input, 'loss':loss})
-
-			sort_wrapper = lambda a, b: sort_fn(a['loss'], b['loss'])
-			samples.sort(key=cmp_to_key(sort_wrapper))
+			keys = sign * self._sample_losses(x)
+			candidates = np.argpartition(keys, -number_samples)[-number_samples:] if keys.shape[0] > number_samples else np.arange(keys.shape[0])
+			for j in candidates:
+				# the batch position breaks ties, inputs are never compared
+				item = (keys[j], i * batch_size + j, x[j:j+1].copy())
+				if len(heap) < number_samples:
+					heapq.heappush(heap, item)
+				elif item[0] > heap[0][0]:
+					heapq.heapreplace(heap, item)
 
-		return samples
+		return [{'input': input, 'loss': sign * key} for key, _, input in sorted(heap, reverse=True)]
 
-	def plot_best_samples(self, number_samples: int)-> None:
-		max_loss = lambda x, y : x - y
-		best_samples = self._get_sorted_losses(max_loss, number_samples=10*number_samples)[:number_samples]
+	def plot_best_samples(self, number_samples: int, test_samples: int = None)-> None:
+		best_samples = self._get_sorted_losses(number_samples, test_samples or 10*number_samples)
 		examples_out = ""
 		print("Best reconstruction examples:")
-		for i in range(number_samples):
-			best_sample_input = best_samples[i]['input']
-			examples_out += str(best_samples[i]['loss']) + '\n\n'
-			examples_out += self._compare_input_to_prediction(best_sample_input)
+		for sample in best_samples:
+			examples_out += str(sample['loss']) + '\n\n'
+			examples_out += self._compare_input_to_prediction(sample['input'])
 		print(examples_out)
 
-	def plot_worst_samples(self, number_samples: int)-> None:
-		min_loss = lambda x, y : y - x
-		worst_samples = self._get_sorted_losses(min_loss, number_samples=10*number_samples)[:number_samples]
+	def plot_worst_samples(self, number_samples: int, test_samples: int = None)-> None:
+		worst_samples = self._get_sorted_losses(number_samples, test_samples or 10*number_samples, worst=True)
 		examples_out = ""
 		print("Worst reconstruction examples:")
-		for i in range(number_samples):
-			worst_sample_input = worst_samples[i]['input']
-			examples_out += str(worst_samples[i]['loss']) + '\n'
-			examples_out += self._compare_input_to_prediction(worst_sample_input)
+		for sample in worst_samples:
+			examples_out += str(sample['loss']) + '\n'
+			examples_out += self._compare_input_to_prediction(sample['input'])
 		print(examples_out)
 
 	def _compare_input_to_prediction(self, input: np.ndarray) -> None:
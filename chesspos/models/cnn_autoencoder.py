@@ -7,6 +7,9 @@ from tensorflow.keras import layers, Model
 from chesspos.models.autoencoder import AutoencoderModel
 
 class CnnAutoencoder(AutoencoderModel):
+	# TFLite has no builtin MaxPool3D
+	tflite_select_tf_ops = True
+
 	@wraps(AutoencoderModel.__init__)
 	def __init__(self, **kwargs):
 		self._final_conv_shape = None
@@ -26,19 +29,12 @@ class CnnAutoencoder(AutoencoderModel):
 		decoder_input = layers.Input(shape=(2,2,15,32), dtype=tf.float16)
 		y = layers.Conv3DTranspose(32, (3, 3, 15), strides=(2,2,1), activation="relu", padding="same")(decoder_input)
 		y = layers.Conv3DTranspose(32, (3, 3, 15), strides=(2,2,1), activation="relu", padding="same")(y)
-		y = layers.Conv3D(1, (8, 8, 15), activation="sigmoid", padding="same")(y)
+		y = layers.Conv3D(1, (8, 8, 15), padding="same")(y)
+		# float32 outputs, such that mixed precision losses are not computed in half precision
+		y = layers.Activation("sigmoid", dtype="float32")(y)
 
 		encoder = keras.Model(inputs=encoder_input, outputs=x, name='encoder')
 		decoder = keras.Model(inputs=decoder_input, outputs=y, name='decoder')
 		autoencoder = keras.Model(inputs=encoder_input, outputs=decoder(encoder(encoder_input)), name='autoencoder')
 
-		return {'encoder': encoder, 'decoder': decoder, 'autoencoder': autoencoder}
-
-	def _define_encoder(self) -> Model:
-		return self._model_helper()['encoder']
-
-	def _define_decoder(self):
-		return self._model_helper()['decoder']
-
-	def _define_model(self) -> Model:
-		return self._model_helper()['autoencoder']
\ No newline at end of file
+		return {'encoder': encoder, 'decoder': decoder, 'autoencoder': autoencoder}
\ No newline at end of file
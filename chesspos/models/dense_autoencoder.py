@@ -21,19 +21,11 @@ class DenseAutoencoder(AutoencoderModel):
 		decoder_input = layers.Input(shape=(self.embedding_size,))
 		decoder = layers.Dense(2*self.embedding_size, activation='relu')(decoder_input)
 		decoder = layers.Dense(8*8*15, activation='relu')(decoder_input)
-		decoder = layers.Reshape((8,8,15,1))(decoder)
+		# float32 outputs, such that mixed precision losses are not computed in half precision
+		decoder = layers.Reshape((8,8,15,1), dtype='float32')(decoder)
 
 		encoder = keras.Model(inputs=encoder_input, outputs=encoder, name='encoder')
 		decoder = keras.Model(inputs=decoder_input, outputs=decoder, name='decoder')
 		autoencoder = keras.Model(inputs=encoder_input, outputs=decoder(encoder(encoder_input)), name='autoencoder')
 
-		return {'encoder': encoder, 'decoder': decoder, 'autoencoder': autoencoder}
-
-	def _define_encoder(self) -> Model:
-		return self._model_helper()['encoder']
-
-	def _define_decoder(self):
-		return self._model_helper()['decoder']
-
-	def _define_model(self) -> Model:
-		return self._model_helper()['autoencoder']
\ No newline at end of file
+		return {'encoder': encoder, 'decoder': decoder, 'autoencoder': autoencoder}
\ No newline at end of file
@@ -0,0 +1,34 @@
+import os
+from typing import Tuple
+
+import tensorflow as tf
+
+def _task(strategy: tf.distribute.Strategy) -> Tuple[str, int, int]:
+	"""Task type and index of this process and the number of workers, a single worker without a cluster"""
+	resolver = getattr(strategy, "cluster_resolver", None)
+	if resolver is None or resolver.task_type is None:
+		return None, 0, 1
+	cluster = resolver.cluster_spec().as_dict()
+	number_workers = sum(len(cluster.get(task_type, [])) for task_type in ["chief", "worker"])
+	# Workers are numbered after the chief
+	task_index = resolver.task_id + (len(cluster.get("chief", [])) if resolver.task_type == "worker" else 0)
+	return resolver.task_type, task_index, number_workers
+
+def worker_shard(strategy: tf.distribute.Strategy = None) -> Tuple[int, int]:
+	"""worker_index and num_workers of the SampleGenerator shard of this process"""
+	_, task_index, number_workers = _task(strategy or tf.distribute.get_strategy())
+	return task_index, number_workers
+
+def is_chief(strategy: tf.distribute.Strategy = None) -> bool:
+	"""The chief, or the first worker of a cluster without chief, writes results to save_dir"""
+	task_type, task_index, _ = _task(strategy or tf.distribute.get_strategy())
+	return task_type in (None, "chief") or task_index == 0
+
+def write_dir(save_dir: str, strategy: tf.distribute.Strategy = None) -> str:
+	"""save_dir on the chief, a directory of its own on other workers, which take part in saving as well"""
+	if is_chief(strategy):
+		return save_dir
+	_, task_index, _ = _task(strategy or tf.distribute.get_strategy())
+	path = f"{save_dir}/workers/{task_index}"
+	os.makedirs(path, exist_ok=True)
+	return path
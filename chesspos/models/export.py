@@ -0,0 +1,101 @@
+import os
+from typing import Dict, Iterator, List
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+from chesspos.preprocessing.sample_generator import SampleGenerator
+from chesspos.serving.tflite_encoder import TFLITE_FILE, TFLiteEncoder
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+SIGNATURE_KEY = "serving_default"
+
+def _serving_function(encoder: keras.Model) -> tf.types.experimental.ConcreteFunction:
+	"""float32 inputs of any batch size to float32 embeddings, whatever precision the encoder computes in"""
+	input_dtype = encoder.inputs[0].dtype
+
+	@tf.function(input_signature=[tf.TensorSpec([None, *encoder.input_shape[1:]], tf.float32, name="inputs")])
+	def serve(inputs):
+		embeddings = encoder(tf.cast(inputs, input_dtype), training=False)
+		return {"embeddings": tf.cast(embeddings, tf.float32)}
+	return serve.get_concrete_function()
+
+def export_encoder(encoder: keras.Model, export_dir: str) -> str:
+	"""Save the encoder alone as a SavedModel with a fixed serving_default signature in export_dir"""
+	os.makedirs(export_dir, exist_ok=True)
+	tf.saved_model.save(encoder, export_dir, signatures={SIGNATURE_KEY: _serving_function(encoder)})
+	return export_dir
+
+def _float32_inputs(encoder: keras.Model) -> keras.Model:
+	"""
+	The encoder with a float32 input layer and the same weights. TFLite has no builtin cast of float16
+	inputs, the 0/1 board inputs are exact in either precision.
+	"""
+	if encoder.inputs[0].dtype == tf.float32:
+		return encoder
+	clone = keras.models.clone_model(encoder, input_tensors=keras.Input(encoder.input_shape[1:], dtype=tf.float32))
+	clone.set_weights(encoder.get_weights())
+	return clone
+
+def _calibration_samples(generator: SampleGenerator, number_batches: int) -> Iterator[List[np.ndarray]]:
+	"""Representative inputs for int8 quantization, the first number_batches batches of generator"""
+	for _, batch in zip(range(number_batches), generator.get_generator()):
+		inputs = batch[0] if isinstance(batch, (tuple, list)) else batch
+		yield [np.asarray(inputs, dtype=np.float32)]
+
+def convert_to_tflite(
+	encoder: keras.Model,
+	export_dir: str,
+	quantization: str = "float32",
+	calibration_generator: SampleGenerator = None,
+	calibration_batches: int = 100,
+	select_tf_ops: bool = False
+) -> str:
+	"""
+	Convert the encoder to a TFLite flatbuffer export_dir/encoder.tflite. quantization is float32,
+	float16 for float16 weights or int8 for int8 weights and activations, whose ranges are
+	calibrated on calibration_batches batches of calibration_generator. Inputs and outputs stay float32.
+	Only encoders with ops without a builtin TFLite kernel, like the MaxPool3D of CnnAutoencoder, need
+	select_tf_ops. They run as tensorflow ops, which requires the tf.lite interpreter of the full tensorflow package.
+	"""
+	if quantization not in QUANTIZATIONS:
+		raise ValueError(f"Unknown quantization {quantization}, use one of {QUANTIZATIONS}")
+	# The weights are frozen into constants, the converter does not find the variables of keras 3 models
+	serve = convert_variables_to_constants_v2(_serving_function(_float32_inputs(encoder)))
+	converter = tf.lite.TFLiteConverter.from_concrete_functions([serve])
+	if select_tf_ops:
+		converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+	if quantization != "float32":
+		converter.optimizations = [tf.lite.Optimize.DEFAULT]
+	if quantization == "float16":
+		converter.target_spec.supported_types = [tf.float16]
+	elif quantization == "int8":
+		if calibration_generator is None:
+			raise ValueError("int8 quantization requires a calibration_generator")
+		converter.representative_dataset = lambda: _calibration_samples(calibration_generator, calibration_batches)
+
+	os.makedirs(export_dir, exist_ok=True)
+	path = f"{export_dir}/{TFLITE_FILE}"
+	with open(path, 'wb') as tflite_file:
+		tflite_file.write(converter.convert())
+	return path
+
+def embedding_fidelity(reference: np.ndarray, embeddings: np.ndarray) -> Dict[str, float]:
+	"""
+	Cosine similarity and largest absolute difference of embeddings to the reference embeddings, and that
+	difference relative to the largest reference value. Cosines of embeddings close to zero are noisy.
+	"""
+	reference, embeddings = reference.astype(np.float64), embeddings.astype(np.float64)
+	reference_norms, norms = np.linalg.norm(reference, axis=1), np.linalg.norm(embeddings, axis=1)
+	# two zero embeddings, e.g. of dead relu units, are the same embedding
+	same_zero = (reference_norms == 0) & (norms == 0)
+	cosine = np.sum(reference * embeddings, axis=1) / np.maximum(reference_norms * norms, 1e-12)
+	cosine = np.where(same_zero, 1.0, cosine)
+	return {
+		"mean_cosine": float(np.mean(cosine)),
+		"min_cosine": float(np.min(cosine)),
+		"max_abs_error": float(np.max(np.abs(reference - embeddings))),
+		"relative_error": float(np.max(np.abs(reference - embeddings)) / max(np.max(np.abs(reference)), 1e-12))
+	}
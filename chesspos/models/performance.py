@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import json
+import os
+from typing import Dict, List, Optional, Type, Union
+
+from tensorflow import keras
+
+@dataclass
+class PerformanceProfile():
+	"""
+	Settings that trade numerical precision or compile time for training throughput.
+	precision is a keras dtype policy: float32, mixed_float16 or mixed_bfloat16.
+	"""
+	name: str = "default"
+	precision: str = "float32"
+	jit_compile: bool = False
+	steps_per_execution: int = 1
+
+	@contextmanager
+	def policy(self):
+		"""Keras dtype policy for the layers built inside, the previous global policy is restored afterwards"""
+		previous = keras.mixed_precision.global_policy()
+		keras.mixed_precision.set_global_policy(self.precision)
+		try:
+			yield
+		finally:
+			keras.mixed_precision.set_global_policy(previous)
+
+	def compile_options(self) -> Dict:
+		"""Keyword arguments of keras.Model.compile"""
+		return {"jit_compile": self.jit_compile, "steps_per_execution": self.steps_per_execution}
+
+PROFILES = {profile.name: profile for profile in [
+	PerformanceProfile("default"),
+	PerformanceProfile("xla", jit_compile=True),
+	PerformanceProfile("steps_per_execution", steps_per_execution=32),
+	PerformanceProfile("xla_steps_per_execution", jit_compile=True, steps_per_execution=32),
+	PerformanceProfile("mixed_bfloat16", precision="mixed_bfloat16", steps_per_execution=32),
+	PerformanceProfile("mixed_float16", precision="mixed_float16", steps_per_execution=32)
+]}
+
+def get_profile(profile: Optional[Union[PerformanceProfile, str]]) -> PerformanceProfile:
+	if profile is None:
+		return PROFILES["default"]
+	if isinstance(profile, str):
+		if profile not in PROFILES:
+			raise ValueError(f"Unknown performance profile {profile}, use one of {list(PROFILES)}")
+		return PROFILES[profile]
+	return profile
+
+def compare_profiles(
+	model_class: Type,
+	profiles: List[Union[PerformanceProfile, str]] = None,
+	steps: int = 100,
+	**model_kwargs
+) -> Dict[str, float]:
+	"""
+	Build model_class once per profile and measure its training steps/sec. The results are
+	merged into performance_profiles.json in save_dir, under the name of the architecture.
+	"""
+	profiles = [get_profile(profile) for profile in (profiles or list(PROFILES))]
+	results = {}
+	for profile in profiles:
+		model = model_class(performance_profile=profile, **model_kwargs)
+		results[profile.name] = {**asdict(profile), "steps_per_second": model.measure_steps_per_second(steps)}
+		print(f"{model_class.__name__} {profile.name}: {results[profile.name]['steps_per_second']:.1f} steps/s")
+
+	path = f"{os.path.abspath(model_kwargs['save_dir'])}/performance_profiles.json"
+	recorded = {}
+	if os.path.isfile(path):
+		with open(path, 'r') as profile_file:
+			recorded = json.load(profile_file)
+	recorded[model_class.__name__] = {**recorded.get(model_class.__name__, {}), **results}
+	with open(path, 'w') as profile_file:
+		json.dump(recorded, profile_file, indent=2)
+	return {name: result["steps_per_second"] for name, result in results.items()}
@@ -37,12 +37,13 @@ class ResnetAutoencoder(AutoencoderModel):
 		embedding = layers.Dense(self.embedding_size, activation="relu")(embedding)
 
 		decoder_input = layers.Input(shape=(self.embedding_size,))
-		decoder_dense = layers.Dense(np.prod(self._final_conv_shape), activation="relu")(decoder_input)
+		decoder_dense = layers.Dense(int(np.prod(self._final_conv_shape)), activation="relu")(decoder_input)
 		decoder_dense = layers.Reshape(self._final_conv_shape)(decoder_dense)
 		decoder_conv_1 = layers.Conv3DTranspose(32, (3,3,15), activation="relu", padding="same")(decoder_dense)
 		decoder_conv_1 = layers.BatchNormalization()(decoder_conv_1)
 		decoder_conv_2 = layers.Conv3DTranspose(16, (3,3,15), activation="relu", padding="same")(decoder_conv_1)
-		decoder_conv_2 = layers.BatchNormalization()(decoder_conv_2)
+		# float32 outputs, such that mixed precision losses are not computed in half precision
+		decoder_conv_2 = layers.BatchNormalization(dtype="float32")(decoder_conv_2)
 		#decoder_conv_3 = layers.Conv3DTranspose(1, (3,3,15), activation="relu", padding="same")(decoder_conv_2)
 		#decoder_conv_3 = layers.BatchNormalization()(decoder_conv_3)
 		#decoder_conv_4 = layers.Conv3DTranspose(1, (2,2,15), activation="sigmoid", padding="same")(decoder_conv_3)
@@ -58,13 +59,4 @@ class ResnetAutoencoder(AutoencoderModel):
 		decoder = keras.Model(inputs=decoder_input, outputs=reconstructed_input, name='decoder')
 		autoencoder = keras.Model(inputs=encoder_input, outputs=decoder(encoder(encoder_input)), name='autoencoder')
 
-		return {'encoder': encoder, 'decoder': decoder, 'autoencoder': autoencoder}
-
-	def _define_encoder(self) -> Model:
-		return self._model_helper()['encoder']
-
-	def _define_decoder(self):
-		return self._model_helper()['decoder']
-
-	def _define_model(self) -> Model:
-		return self._model_helper()['autoencoder']
\ No newline at end of file
+		return {'encoder': encoder, 'decoder': decoder, 'autoencoder': autoencoder}
\ No newline at end of file
@@ -1,18 +1,22 @@
 from abc import abstractmethod
 from functools import wraps
-from typing import Callable, Dict, List, overload
+from typing import Callable, Dict, List, Union, overload
 import os
 import math
 import pickle
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 import chess
 
 
 import tensorflow as tf
 from tensorflow import keras
 
+from chesspos.evaluation.monitoring import StepTimeMonitor
+from chesspos.models.distributed import write_dir
+from chesspos.models.performance import PerformanceProfile, get_profile
 from chesspos.models.saveable_model import SaveableModel
+from chesspos.models.training_checkpoint import TrainingCheckpoint, fit_resumable
 from chesspos.preprocessing.sample_generator import SampleGenerator
 
 class TrainableModel(SaveableModel):
@@ -29,6 +33,9 @@ class TrainableModel(SaveableModel):
 		metrics = None,
 		hide_tf_warnings: bool = True,
 		tf_callbacks = None,
+		performance_profile: Union[PerformanceProfile, str] = None,
+		distribute_strategy: tf.distribute.Strategy = None,
+		plot_models: bool = False,
 		**kwargs
 	) -> None:
 
@@ -44,9 +51,18 @@ class TrainableModel(SaveableModel):
 		self.train_steps_per_epoch = train_steps_per_epoch
 		self.test_steps_per_epoch = test_steps_per_epoch
 		self.hide_tf_warnings = hide_tf_warnings
-
-		super(TrainableModel, self).__init__(**kwargs)
-
+		# draw the model graphs to save_dir, which requires pydot and graphviz
+		self.plot_models = plot_models
+		# precision, XLA and steps_per_execution of model, encoder and decoder, see models.performance
+		self.performance_profile = get_profile(performance_profile)
+		# e.g. tf.distribute.MultiWorkerMirroredStrategy, every worker then reads a shard, see distributed.worker_shard
+		self.distribute_strategy = distribute_strategy or tf.distribute.get_strategy()
+
+		with self.distribute_strategy.scope(), self.performance_profile.policy():
+			super(TrainableModel, self).__init__(**kwargs)
+
+		# resumable state of the training, saved with the 'checkpoints' callback
+		self.training_checkpoint = None
 		self.tf_callbacks = self._set_tf_callbacks(tf_callbacks)
 		print(self.loss)
 
@@ -74,11 +90,21 @@ class TrainableModel(SaveableModel):
 							verbose=0, mode='min', restore_best_weights=True)
 						)
 					elif callback == 'checkpoints':
-						save_dir = os.path.abspath(self.save_dir)
+						save_dir = os.path.abspath(write_dir(self.save_dir, self.distribute_strategy))
 						callbacks.append(
 							keras.callbacks.ModelCheckpoint(filepath=save_dir+"/checkpoints/cp-{epoch:04d}.ckpt",
 							save_weights_only=False, save_best_only=True, mode='min', verbose=1)
 						)
+						self.training_checkpoint = TrainingCheckpoint(
+							save_dir+"/training_state", self.train_generator, self.train_steps_per_epoch
+						)
+					elif callback == 'step_times':
+						callbacks.append(
+							StepTimeMonitor(
+								write_dir(self.save_dir, self.distribute_strategy), self.train_generator.batch_size,
+								input_generator=self.train_generator
+							)
+						)
 					else:
 						print(f"WARNING: illegal argument {callback} in tf_callbacks, skipping.")
 		else:
@@ -87,6 +113,11 @@ class TrainableModel(SaveableModel):
 		return callbacks
 
 
+	def save(self) -> None:
+		# All workers take part in saving a distributed model, only the chief writes to save_dir
+		self.model.save(f"{write_dir(self.save_dir, self.distribute_strategy)}/model")
+
+
 	def _train_samples(self) -> int:
 		return  1.0 * self.train_generator.number_samples
 
@@ -108,10 +139,17 @@ class TrainableModel(SaveableModel):
 
 
 	def _compile(self) -> None:
-		self.model.compile(optimizer=self.optimizer, loss=self.loss, metrics=self.metrics)
-		keras.utils.plot_model(self.model, to_file=f"{self.save_dir}/model.png", show_shapes=True)
+		self.model.compile(
+			optimizer=self.optimizer, loss=self.loss, metrics=self.metrics,
+			**self.performance_profile.compile_options()
+		)
+		self._plot(self.model, "model")
 		self.model.summary()
 
+	def _plot(self, model: keras.Model, name: str) -> None:
+		if self.plot_models:
+			keras.utils.plot_model(model, to_file=f"{self.save_dir}/{name}.png", show_shapes=True)
+
 
 	def _check_train_test_ratio(self):
 		train_epochs = self._train_epochs()
@@ -127,6 +165,7 @@ class TrainableModel(SaveableModel):
 				print("WARNING: your are providing much more validation samples than necessary. Those could be used for training instead.")
 
 	def _plot_train_history(self, history: keras.callbacks.History) -> None:
+		import matplotlib.pyplot as plt
 		# summarize history for loss
 		plt.plot(history.history['loss'])
 		plt.plot(history.history['val_loss'])
@@ -136,27 +175,44 @@ class TrainableModel(SaveableModel):
 		plt.legend(['train', 'test'], loc='upper left')
 		plt.savefig(self.save_dir+'/loss.png')
 
-	def train(self) -> Dict:
+	def train(self, resume: bool = False) -> Dict:
 		if self.hide_tf_warnings:
 			os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
 		# TODO: benchmark
 		#train_generator = self.train_generator.get_generator()
 		#test_generator = self.test_generator.get_generator()
-		train_generator = self.train_generator.get_tf_dataset()
 		test_generator = self.test_generator.get_tf_dataset()
 
 		self._check_train_test_ratio()
 
-		history = self.model.fit(
-			train_generator,
+		histories = fit_resumable(
+			self.model,
+			self.train_generator,
 			steps_per_epoch = self.train_steps_per_epoch,
 			epochs = math.floor(self._train_epochs()),
+			checkpoint = self.training_checkpoint,
+			resume = resume,
 			validation_data = test_generator,
 			validation_steps = self.test_steps_per_epoch,
 			callbacks = self.tf_callbacks
 		)
-		return history
+		return histories[-1] if len(histories) > 0 else None
+
+	def resume(self) -> Dict:
+		"""Continue the training where the last state saved with the 'checkpoints' callback stopped"""
+		if self.training_checkpoint is None:
+			raise ValueError("Resuming requires 'checkpoints' in tf_callbacks")
+		return self.train(resume=True)
+
+	def measure_steps_per_second(self, steps: int = 100) -> float:
+		"""Training steps/sec, after a first epoch of a few steps that traces and compiles the train function"""
+		train_generator = self.train_generator.get_tf_dataset().repeat()
+		warmup_steps = 2 * self.performance_profile.steps_per_execution
+		self.model.fit(train_generator, steps_per_epoch=warmup_steps, epochs=1, verbose=0)
+		start = time.perf_counter()
+		self.model.fit(train_generator, steps_per_epoch=steps, epochs=1, verbose=0)
+		return steps / (time.perf_counter() - start)
 
 	def predict(self, samples: np.ndarray) -> np.ndarray:
 		return self.model.predict(samples)
@@ -175,7 +231,7 @@ class TrainableModel(SaveableModel):
 
 	def predict_from_board(self, boards: List[chess.Board]) -> np.ndarray:
 		self._check_input_converter()
-		inputs = np.empty((len(boards), *self.train_generator.sample_shape))
+		inputs = np.empty((len(boards), *self.train_generator.sample_shape), dtype=self.train_generator.sample_type)
 		for i, board in enumerate(boards):
 			inputs[i] = self.board_to_input(board)
 		return self.predict(inputs)
@@ -185,7 +241,7 @@ class TrainableModel(SaveableModel):
 
 	def evaluate_from_board(self, boards: List[chess.Board], labels) -> np.float32:
 		self._check_input_converter()
-		inputs = np.empty((len(boards), *self.train_generator.sample_shape))
+		inputs = np.empty((len(boards), *self.train_generator.sample_shape), dtype=self.train_generator.sample_type)
 		for i, board in enumerate(boards):
 			inputs[i] = self.board_to_input(board)
 		return self.evaluate(inputs, labels)
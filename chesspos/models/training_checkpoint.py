@@ -0,0 +1,129 @@
+import json
+import os
+import random
+from typing import Dict, List, Optional
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from chesspos.preprocessing.sample_generator import SampleGenerator
+
+STATE_FILE = "training_state.json"
+
+class TrainingCheckpoint(keras.callbacks.Callback):
+	"""
+	Callback that saves the resumable state of a training: model weights, optimizer state and the global
+	tf random generator in a tf checkpoint, and epoch, step, python and numpy random states and the
+	position of the train generator in training_state.json next to it.
+	The state is saved after every epoch and, with save_steps, every save_steps steps.
+	"""
+	def __init__(self, directory: str, train_generator: SampleGenerator, steps_per_epoch: int, save_steps: int = None, max_to_keep: int = 2):
+		super(TrainingCheckpoint, self).__init__()
+		self.directory = os.path.abspath(directory)
+		self.train_generator = train_generator
+		self.steps_per_epoch = steps_per_epoch
+		self.save_steps = save_steps
+		self.max_to_keep = max_to_keep
+		# steps of the epoch done before the current fit, when a fit resumes within an epoch
+		self.step_offset = 0
+		self._manager = None
+
+	def _checkpoint_manager(self, model: keras.Model) -> tf.train.CheckpointManager:
+		if self._manager is None:
+			checkpoint = tf.train.Checkpoint(model=model, optimizer=model.optimizer, rng=tf.random.get_global_generator())
+			self._manager = tf.train.CheckpointManager(checkpoint, self.directory, max_to_keep=self.max_to_keep)
+		return self._manager
+
+	def save(self, epoch: int, step: int) -> None:
+		"""Save the state after step steps of epoch epoch"""
+		batches = epoch * self.steps_per_epoch + step
+		path = self._checkpoint_manager(self.model).save(checkpoint_number=batches)
+		python_version, python_state, python_gauss = random.getstate()
+		numpy_state = np.random.get_state()
+		state = {
+			"checkpoint": os.path.basename(path),
+			"epoch": epoch,
+			"step": step,
+			"python_random": [python_version, list(python_state), python_gauss],
+			"numpy_random": [numpy_state[0], numpy_state[1].tolist(), *numpy_state[2:]],
+			"input": self.train_generator.position(batches)
+		}
+		with open(f"{self.directory}/{STATE_FILE}.tmp", 'w') as state_file:
+			json.dump(state, state_file)
+		os.replace(f"{self.directory}/{STATE_FILE}.tmp", f"{self.directory}/{STATE_FILE}")
+
+	def restore(self, model: keras.Model) -> Optional[Dict]:
+		"""Restore the last saved state into model and the random generators, None if there is none"""
+		if not os.path.isfile(f"{self.directory}/{STATE_FILE}"):
+			return None
+		with open(f"{self.directory}/{STATE_FILE}", 'r') as state_file:
+			state = json.load(state_file)
+		# Optimizer slots that do not exist yet are restored when they are created
+		self._checkpoint_manager(model).checkpoint.restore(f"{self.directory}/{state['checkpoint']}")
+		python_version, python_state, python_gauss = state["python_random"]
+		random.setstate((python_version, tuple(python_state), python_gauss))
+		name, keys, *numpy_state = state["numpy_random"]
+		np.random.set_state((name, np.asarray(keys, dtype=np.uint32), *numpy_state))
+		return state
+
+	def on_train_begin(self, logs=None):
+		os.makedirs(self.directory, exist_ok=True)
+
+	def on_epoch_begin(self, epoch, logs=None):
+		self._epoch = epoch
+		self._saved_step = self.step_offset
+
+	def on_train_batch_end(self, batch, logs=None):
+		if self.save_steps is None:
+			return
+		# batch is the last step of the execution, with steps_per_execution one call covers several steps
+		step = self.step_offset + batch + 1
+		if step < self.steps_per_epoch and step // self.save_steps > self._saved_step // self.save_steps:
+			self.save(self._epoch, step)
+			self._saved_step = step
+
+	def on_epoch_end(self, epoch, logs=None):
+		self.save(epoch + 1, 0)
+		self.step_offset = 0
+
+def fit_resumable(
+	model: keras.Model,
+	train_generator: SampleGenerator,
+	steps_per_epoch: int,
+	epochs: int,
+	checkpoint: TrainingCheckpoint = None,
+	resume: bool = False,
+	callbacks: List[keras.callbacks.Callback] = None,
+	**fit_kwargs
+) -> List[keras.callbacks.History]:
+	"""
+	Fit model on the tf dataset of train_generator. With resume=True training continues from the last
+	state saved by checkpoint: an interrupted epoch is finished by a fit of its remaining steps, that
+	reads on from the saved position of train_generator, then the other epochs follow.
+	"""
+	initial_epoch, initial_step = 0, 0
+	if resume:
+		if checkpoint is None:
+			raise ValueError("Resuming requires a TrainingCheckpoint")
+		state = checkpoint.restore(model)
+		if state is not None:
+			initial_epoch, initial_step = state["epoch"], state["step"]
+	callbacks = [*(callbacks or []), *([checkpoint] if checkpoint is not None else [])]
+
+	histories = []
+	while initial_epoch < epochs:
+		train_generator.set_position(initial_epoch * steps_per_epoch + initial_step)
+		if checkpoint is not None:
+			checkpoint.step_offset = initial_step
+		last_epoch = initial_epoch + 1 if initial_step > 0 else epochs
+		histories.append(model.fit(
+			train_generator.get_tf_dataset(),
+			steps_per_epoch=steps_per_epoch - initial_step,
+			initial_epoch=initial_epoch,
+			epochs=last_epoch,
+			callbacks=callbacks,
+			**fit_kwargs
+		))
+		initial_epoch, initial_step = last_epoch, 0
+	return histories
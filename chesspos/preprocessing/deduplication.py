@@ -0,0 +1,168 @@
+import math
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+def _occurrence_ranks(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+	"""
+	Return the unique keys, the index of every key in them and how many equal keys precede every key.
+	"""
+	unique_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+	order = np.argsort(inverse, kind="stable")
+	first = np.cumsum(counts) - counts
+	ranks = np.empty(keys.shape[0], dtype=np.int64)
+	ranks[order] = np.arange(keys.shape[0]) - np.repeat(first, counts)
+	return unique_keys, inverse, ranks
+
+@dataclass
+class ZobristSet():
+	"""
+	Exact multiset of 64 bit zobrist hashes, stored in flat uint64 and uint32 arrays with open addressing
+	and linear probing. Zobrist hashes are uniformly distributed, so their low bits serve as slot index.
+	"""
+	capacity: int = 2**20
+	max_load: float = 0.5
+	_keys: np.ndarray = None
+	_counts: np.ndarray = None
+	_size: int = 0
+
+	def __post_init__(self):
+		capacity = 1 << max(4, (self.capacity - 1).bit_length())
+		self._keys = np.zeros(capacity, dtype=np.uint64)
+		# a slot is empty while its count is zero, so that the hash 0 needs no special case
+		self._counts = np.zeros(capacity, dtype=np.uint32)
+
+	def __len__(self) -> int:
+		return self._size
+
+	def _probe(self, keys: np.ndarray, slots: np.ndarray) -> np.ndarray:
+		"""Continue linear probing from slots until each key finds its own slot or an empty one"""
+		mask = np.uint64(self._keys.shape[0] - 1)
+		active = np.arange(keys.shape[0])
+		while active.shape[0] > 0:
+			occupied = (self._counts[slots[active]] != 0) & (self._keys[slots[active]] != keys[active])
+			active = active[occupied]
+			slots[active] = (slots[active] + np.uint64(1)) & mask
+		return slots
+
+	def _slots(self, keys: np.ndarray) -> np.ndarray:
+		return self._probe(keys, keys & np.uint64(self._keys.shape[0] - 1))
+
+	def _insert(self, keys: np.ndarray, counts: np.ndarray) -> None:
+		"""Insert distinct keys that are not in the set yet"""
+		while self._size + keys.shape[0] > self.max_load * self._keys.shape[0]:
+			self._grow()
+		slots = self._slots(keys)
+		while keys.shape[0] > 0:
+			# Several new keys may probe to the same empty slot, the first one takes it and the others probe on
+			_, winners = np.unique(slots, return_index=True)
+			self._keys[slots[winners]] = keys[winners]
+			self._counts[slots[winners]] = counts[winners]
+			self._size += winners.shape[0]
+			losers = np.ones(keys.shape[0], dtype=bool)
+			losers[winners] = False
+			keys, counts, slots = keys[losers], counts[losers], slots[losers]
+			slots = self._probe(keys, slots)
+
+	def _grow(self) -> None:
+		occupied = self._counts != 0
+		keys, counts = self._keys[occupied], self._counts[occupied]
+		self._keys = np.zeros(2 * self._keys.shape[0], dtype=np.uint64)
+		self._counts = np.zeros(self._keys.shape[0], dtype=np.uint32)
+		self._size = 0
+		self._insert(keys, counts)
+
+	def counts(self, keys: np.ndarray) -> np.ndarray:
+		"""Number of times each key was added"""
+		return self._counts[self._slots(np.asarray(keys, dtype=np.uint64))]
+
+	def add(self, keys: np.ndarray, limit: int = 2**32 - 1) -> np.ndarray:
+		"""
+		Add keys in order, each only if it was added less than limit times before.
+		Return a mask of the keys that were added.
+		"""
+		unique_keys, inverse, ranks = _occurrence_ranks(np.asarray(keys, dtype=np.uint64))
+		slots = self._slots(unique_keys)
+		counts = self._counts[slots].astype(np.int64)
+		added = counts[inverse] + ranks < limit
+
+		new_counts = np.minimum(counts + np.bincount(inverse, minlength=unique_keys.shape[0]), np.maximum(counts, limit))
+		existing = counts > 0
+		self._counts[slots[existing]] = new_counts[existing]
+		self._insert(unique_keys[~existing], new_counts[~existing].astype(np.uint32))
+		return added
+
+	def nbytes(self) -> int:
+		return self._keys.nbytes + self._counts.nbytes
+
+@dataclass
+class BloomFilter():
+	"""
+	Counting Bloom filter of 64 bit hashes with saturating uint8 counters, memory stays fixed at
+	about -capacity * ln(false_positive_rate) / ln(2)**2 bytes. Counts are never underestimated,
+	up to false_positive_rate of the hashes that were never added report a count > 0.
+	"""
+	capacity: int = 2**24
+	false_positive_rate: float = 1e-3
+	_counters: np.ndarray = None
+	_steps: np.ndarray = None
+
+	def __post_init__(self):
+		size = math.ceil(-self.capacity * math.log(self.false_positive_rate) / math.log(2)**2)
+		number_hashes = max(1, round(size / self.capacity * math.log(2)))
+		self._counters = np.zeros(size, dtype=np.uint8)
+		self._steps = np.arange(number_hashes, dtype=np.uint64)
+
+	def _slots(self, keys: np.ndarray) -> np.ndarray:
+		"""Counter indices of every key, shape (keys, number of hashes), by double hashing with both key halves"""
+		low, high = keys & np.uint64(0xffffffff), (keys >> np.uint64(32)) | np.uint64(1)
+		return (low[:, None] + self._steps[None, :] * high[:, None]) % np.uint64(self._counters.shape[0])
+
+	def counts(self, keys: np.ndarray) -> np.ndarray:
+		return self._counters[self._slots(np.asarray(keys, dtype=np.uint64))].min(axis=1)
+
+	def add(self, keys: np.ndarray, limit: int = 255) -> np.ndarray:
+		"""Add keys in order, each only if its count is below limit. Return a mask of the keys that were added."""
+		keys = np.asarray(keys, dtype=np.uint64)
+		_, _, ranks = _occurrence_ranks(keys)
+		slots = self._slots(keys)
+		added = self._counters[slots].min(axis=1).astype(np.int64) + ranks < limit
+
+		slots, increments = np.unique(slots[added], return_counts=True)
+		self._counters[slots] = np.minimum(self._counters[slots] + increments, 255)
+		return added
+
+	def nbytes(self) -> int:
+		return self._counters.nbytes
+
+@dataclass
+class PositionDeduplicator():
+	"""
+	Keep only the first keep_first occurrences of every position, identified by its zobrist hash.
+	exact=True stores all hashes in a ZobristSet, exact=False bounds memory with a BloomFilter sized for
+	expected_positions distinct positions, which may drop a small fraction of unique positions.
+	"""
+	keep_first: int = 1
+	exact: bool = True
+	expected_positions: int = 2**24
+	false_positive_rate: float = 1e-3
+	dropped: int = 0
+
+	def __post_init__(self):
+		if not 1 <= self.keep_first <= 254:
+			raise ValueError(f"keep_first must be between 1 and 254, not {self.keep_first}")
+		if self.exact:
+			self._seen = ZobristSet()
+		else:
+			self._seen = BloomFilter(capacity=self.expected_positions, false_positive_rate=self.false_positive_rate)
+
+	def __call__(self, hashes: np.ndarray) -> np.ndarray:
+		"""Return a mask of the positions to keep and remember them, positions count in order"""
+		keep = self._seen.add(hashes, self.keep_first)
+		self.dropped += int(hashes.shape[0] - np.count_nonzero(keep))
+		return keep
+
+	def add(self, hashes: np.ndarray) -> None:
+		"""Remember positions that were kept before, e.g. when resuming an extraction"""
+		self._seen.add(hashes)
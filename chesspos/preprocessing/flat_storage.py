@@ -0,0 +1,91 @@
+"""
+Flat, uncompressed storage of extracted arrays as .npy files that can be appended to.
+Every array gets its own file with a header of fixed size, which is rewritten when rows are appended.
+Readers open the files with np.load(path, mmap_mode='r'), such that processes share the page cache.
+"""
+import json
+import os
+import struct
+from typing import Dict, Tuple
+
+import numpy as np
+
+from chesspos.preprocessing.packing import CODEC_ATTRIBUTE, SHAPE_ATTRIBUTE
+
+FLAT_ENDING = "npy"
+# npy format version 1.0 with a header padded to a fixed size, large enough for any row count
+HEADER_SIZE = 128
+MAGIC = b"\x93NUMPY\x01\x00"
+
+def flat_path(save_path: str, key: str) -> str:
+	"""Path of the flat file of an array, e.g. data/games.encodings.npy for save_path data/games(.h5)"""
+	base = save_path[:-3] if save_path.endswith(".h5") else save_path
+	return f"{base}.{key}.{FLAT_ENDING}"
+
+def _header(dtype: np.dtype, shape: Tuple[int, ...]) -> bytes:
+	header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": tuple(shape)})
+	header = header.encode("latin1").ljust(HEADER_SIZE - len(MAGIC) - 3) + b"\n"
+	if len(header) + len(MAGIC) + 2 != HEADER_SIZE:
+		raise ValueError(f"Header of shape {shape} does not fit into {HEADER_SIZE} bytes")
+	return MAGIC + struct.pack("<H", len(header)) + header
+
+def read_header(path: str) -> Tuple[np.dtype, Tuple[int, ...]]:
+	with open(path, 'rb') as flat_file:
+		np.lib.format.read_magic(flat_file)
+		shape, _, dtype = np.lib.format.read_array_header_1_0(flat_file)
+	return dtype, shape
+
+def append_rows(path: str, rows: np.ndarray) -> None:
+	"""Append rows to a flat file, creating it on the first call"""
+	rows = np.ascontiguousarray(rows)
+	number_rows = 0
+	if os.path.isfile(path):
+		dtype, shape = read_header(path)
+		if dtype != rows.dtype or shape[1:] != rows.shape[1:]:
+			raise ValueError(f"Cannot append rows of {rows.dtype} {rows.shape[1:]} to {path} with {dtype} {shape[1:]}")
+		number_rows = shape[0]
+
+	row_bytes = rows.dtype.itemsize * int(np.prod(rows.shape[1:]))
+	with open(path, 'r+b' if os.path.isfile(path) else 'wb') as flat_file:
+		# Rows first and the header last, a header never counts rows that are not written yet
+		flat_file.seek(HEADER_SIZE + number_rows * row_bytes)
+		flat_file.write(rows.tobytes())
+		flat_file.seek(0)
+		flat_file.write(_header(rows.dtype, (number_rows + rows.shape[0], *rows.shape[1:])))
+		flat_file.flush()
+		os.fsync(flat_file.fileno())
+
+def truncate_rows(path: str, number_rows: int) -> None:
+	"""Drop all rows after the first number_rows rows"""
+	dtype, shape = read_header(path)
+	row_bytes = dtype.itemsize * int(np.prod(shape[1:]))
+	with open(path, 'r+b') as flat_file:
+		flat_file.write(_header(dtype, (min(number_rows, shape[0]), *shape[1:])))
+		flat_file.truncate(HEADER_SIZE + min(number_rows, shape[0]) * row_bytes)
+
+def open_flat(path: str) -> np.ndarray:
+	"""Memory map a flat file read-only"""
+	return np.load(path, mmap_mode='r')
+
+def write_attributes(path: str, attributes: Dict) -> None:
+	with open(f"{path}.json", 'w') as attribute_file:
+		json.dump(attributes, attribute_file)
+
+def read_attributes(path: str) -> Dict:
+	if not os.path.isfile(f"{path}.json"):
+		return {}
+	with open(f"{path}.json", 'r') as attribute_file:
+		return json.load(attribute_file)
+
+def describe_flat(path: str) -> Dict:
+	"""Description of a flat file in the format of manifest.describe_dataset"""
+	dtype, shape = read_header(path)
+	attributes = read_attributes(path)
+	return {
+		"length": shape[0],
+		"shape": list(shape),
+		"dtype": dtype.str,
+		"encoding_shape": list(attributes.get(SHAPE_ATTRIBUTE, shape[1:])),
+		"codec": attributes.get(CODEC_ATTRIBUTE),
+		"compression": None
+	}
@@ -15,16 +15,17 @@ def elo_filter(white_elo_range: Tuple[int, int], black_elo_range: Tuple[int, int
 		#headers are often non-standard, try..except!
 		process_game = True
 		try:
-			if not white_elo_range[0] < header.get("WhiteElo") < white_elo_range[1]:
+			if not white_elo_range[0] < int(header.get("WhiteElo")) < white_elo_range[1]:
 				process_game = False
-			elif not black_elo_range[0] < header.get("BlackElo") < black_elo_range[1]:
+			elif not black_elo_range[0] < int(header.get("BlackElo")) < black_elo_range[1]:
 				process_game = False
 		except Exception as e:
 			if debug:
-				logger.error(f"Exception in filter_by_elo", exec_info=True)
+				logger.error(f"Exception in filter_by_elo", exc_info=True)
 			process_game = False
 		finally:
 			return process_game
+	return filter
 
 def time_control_filter(time_range_minutes: Tuple[int, int], debug: bool = False) -> ct.GameFilter:
 	def filter(header: chess.pgn.Headers) -> bool:
@@ -38,7 +39,7 @@ def time_control_filter(time_range_minutes: Tuple[int, int], debug: bool = False
 				process_game = False
 		except Exception as e:
 			if debug:
-				logger.error(f"Exception in filter_by_time_control", exec_info=True)
+				logger.error(f"Exception in filter_by_time_control", exc_info=True)
 			process_game = False
 		finally:
 			return process_game
@@ -13,6 +13,7 @@ import chess.pgn
 import numpy as np
 
 import chesspos.custom_types as ct
+from chesspos.preprocessing.position_processors import zobrist_hashes
 
 
 @dataclass
@@ -20,7 +21,14 @@ class GameProcessor():
 	is_process_position: ct.PositionFilter
 	position_processor: ct.PositionProcessor
 	position_aggregator: ct.PositionAggregator = lambda position_encodings: position_encodings
+	position_updater: ct.PositionUpdater = None
+	validate_updates: bool = False
+	hash_positions: bool = False
 	_board: chess.Board = chess.Board()
+	_buffer: np.ndarray = None
+	_ply_buffer: np.ndarray = None
+	_plies: np.ndarray = None
+	_hashes: np.ndarray = None
 	
 	def __call__(self, game: chess.pgn.Game) -> np.ndarray:
 		self._board = chess.Board()
@@ -36,15 +44,67 @@ class GameProcessor():
 			logger.error(f"Exception occurred in position number {move_nr}")
 			raise Exception(e)
 
+	def _reserve(self, number_encodings: int) -> np.ndarray:
+		"""Return the reusable encoding buffer, grown to hold at least number_encodings encodings"""
+		if self._buffer is None or self._buffer.shape[0] < number_encodings:
+			sample_encoding = self.get_sample_encoding()
+			capacity = 256 if self._buffer is None else self._buffer.shape[0]
+			while capacity < number_encodings:
+				capacity *= 2
+			buffer = np.empty((capacity, *sample_encoding.shape[1:]), dtype=sample_encoding.dtype)
+			ply_buffer = np.empty((capacity,), dtype=np.int16)
+			if self._buffer is not None:
+				buffer[:self._buffer.shape[0]] = self._buffer
+				ply_buffer[:self._ply_buffer.shape[0]] = self._ply_buffer
+			self._buffer = buffer
+			self._ply_buffer = ply_buffer
+		return self._buffer
+
+	def _validate_encoding(self, encoding: np.ndarray, move_nr: int) -> None:
+		"""Compare an incrementally updated encoding to the full encoding of the current board"""
+		if not np.array_equal(encoding, self.position_processor(self._board)):
+			logger.error(f"Incremental encoding differs from full encoding in position number {move_nr}")
+			raise ValueError(f"position_updater and position_processor disagree on position {self._board.fen()}")
+
 	def game_processor(self, game: chess.pgn.Game) -> np.ndarray:
-		"""Process a game and return a numpy array of the processed positions"""
-		encodings = self.get_sample_encoding()
+		"""
+		Process a game and return a numpy array of the processed positions. With a position_updater
+		the encoding is updated from each move instead of encoding every position from scratch.
+		"""
+		buffer = self._reserve(0)
+		number_encodings = 0
+		boards = []
+		encoding = None
+		if self.position_updater is not None:
+			encoding = self.position_processor(self._board)
+
 		for i, move in enumerate(game.mainline_moves()):
 			self._push_move(move, i)
+			if encoding is not None:
+				self.position_updater(encoding, self._board, move)
+				if self.validate_updates:
+					self._validate_encoding(encoding, i)
+
 			if self.is_process_position(self._board):
-				encoding = self.position_processor(self._board).reshape(1, -1)
-				encodings = np.append(encodings, encoding, axis=0)
-		return encodings
+				buffer = self._reserve(number_encodings + 1)
+				buffer[number_encodings] = encoding if encoding is not None else self.position_processor(self._board)
+				self._ply_buffer[number_encodings] = self._board.ply()
+				number_encodings += 1
+				if self.hash_positions:
+					boards.append(self._board.copy(stack=False))
+
+		self._plies = self._ply_buffer[:number_encodings].copy()
+		if self.hash_positions:
+			self._hashes = zobrist_hashes(boards)
+		return buffer[:number_encodings].copy()
+
+	def get_plies(self) -> np.ndarray:
+		"""Ply of every position encoded in the last processed game, before aggregation"""
+		return self._plies
+
+	def get_hashes(self) -> np.ndarray:
+		"""Zobrist hash of every position encoded in the last processed game, requires hash_positions"""
+		return self._hashes
 
 	def get_sample_encoding(self) -> np.ndarray:
 		"""Process a game and return a dummy encoding, to get its shape and dtype"""
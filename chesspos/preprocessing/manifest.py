@@ -0,0 +1,75 @@
+import json
+import os
+import zlib
+from typing import Dict, Optional
+
+import h5py
+import numpy as np
+
+from chesspos.preprocessing.packing import CODEC_ATTRIBUTE, encoding_shape
+from chesspos.utils.file_utils import correct_file_ending
+
+MANIFEST_VERSION = 1
+# rows read at once to compute checksums
+CHECKSUM_BLOCK_ROWS = 2**16
+
+def manifest_path(h5_file: str) -> str:
+	return f"{correct_file_ending(h5_file, 'h5')}.manifest.json"
+
+def _file_stat(h5_file: str) -> Dict[str, int]:
+	stat = os.stat(correct_file_ending(h5_file, 'h5'))
+	return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def dataset_checksum(dataset: h5py.Dataset) -> str:
+	"""crc32 of the stored bytes of a dataset, read in blocks"""
+	checksum = 0
+	for start in range(0, dataset.shape[0], CHECKSUM_BLOCK_ROWS):
+		checksum = zlib.crc32(np.ascontiguousarray(dataset[start:start+CHECKSUM_BLOCK_ROWS]).tobytes(), checksum)
+	return f"{checksum:08x}"
+
+def describe_dataset(dataset: h5py.Dataset, checksum: bool = True) -> Dict:
+	description = {
+		"length": dataset.shape[0],
+		"shape": list(dataset.shape),
+		"dtype": dataset.dtype.str,
+		"encoding_shape": list(encoding_shape(dataset)),
+		"codec": dataset.attrs.get(CODEC_ATTRIBUTE),
+		"compression": dataset.compression
+	}
+	if checksum:
+		description["crc32"] = dataset_checksum(dataset)
+	return description
+
+def write_manifest(h5_file: str) -> Dict:
+	"""Describe every dataset of an h5 file in a json sidecar, stamped with the modification time of the file"""
+	with h5py.File(correct_file_ending(h5_file, 'h5'), 'r') as hf:
+		datasets = {key: describe_dataset(hf[key]) for key in hf.keys()}
+	manifest = {"version": MANIFEST_VERSION, **_file_stat(h5_file), "datasets": datasets}
+	with open(f"{manifest_path(h5_file)}.tmp", 'w') as manifest_file:
+		json.dump(manifest, manifest_file)
+	os.replace(f"{manifest_path(h5_file)}.tmp", manifest_path(h5_file))
+	return manifest
+
+def read_manifest(h5_file: str) -> Optional[Dict]:
+	"""Return the manifest of an h5 file, or None if there is none or the file changed after it was written"""
+	try:
+		with open(manifest_path(h5_file), 'r') as manifest_file:
+			manifest = json.load(manifest_file)
+	except (OSError, ValueError):
+		return None
+	if manifest.get("version") != MANIFEST_VERSION:
+		return None
+	stat = _file_stat(h5_file)
+	if manifest["mtime_ns"] != stat["mtime_ns"] or manifest["size"] != stat["size"]:
+		return None
+	return manifest
+
+def verify_manifest(h5_file: str) -> bool:
+	"""Recompute all checksums of an h5 file and compare them to its manifest"""
+	manifest = read_manifest(h5_file)
+	if manifest is None:
+		return False
+	with h5py.File(correct_file_ending(h5_file, 'h5'), 'r') as hf:
+		if set(hf.keys()) != set(manifest["datasets"]):
+			return False
+		return all(dataset_checksum(hf[key]) == manifest["datasets"][key]["crc32"] for key in hf.keys())
@@ -0,0 +1,89 @@
+import os
+from typing import Dict, List
+
+import chess.pgn
+import h5py
+import numpy as np
+
+from chesspos.preprocessing.flat_storage import flat_path, open_flat
+from chesspos.utils.file_utils import correct_file_ending
+
+# dtype of every per-position metadata column, game_id is always written
+METADATA_COLUMNS = {
+	"ply": np.int16,
+	"white_elo": np.int16,
+	"black_elo": np.int16,
+	"result": np.int8,
+	"time_control": np.int8,
+	"game_offset": np.int64
+}
+
+# result codes, 0 marks a missing or unfinished result
+RESULT_UNKNOWN = 0
+WHITE_WINS = 1
+DRAW = 2
+BLACK_WINS = 3
+RESULT_CODES = {"1-0": WHITE_WINS, "1/2-1/2": DRAW, "0-1": BLACK_WINS}
+
+# time control buckets as used by lichess, 0 marks a missing or malformed time control
+TIME_CONTROL_UNKNOWN = 0
+ULTRABULLET = 1
+BULLET = 2
+BLITZ = 3
+RAPID = 4
+CLASSICAL = 5
+CORRESPONDENCE = 6
+# upper limits of the estimated game duration in seconds, base time + 40 * increment
+TIME_CONTROL_LIMITS = [(29, ULTRABULLET), (179, BULLET), (479, BLITZ), (1499, RAPID)]
+
+def _elo(header: chess.pgn.Headers, key: str) -> int:
+	try:
+		return int(header.get(key))
+	except (TypeError, ValueError):
+		return 0
+
+def time_control_bucket(time_control: str) -> int:
+	"""Bucket a TimeControl header like 300+3 (seconds + increment) by estimated game duration"""
+	if time_control == "-":
+		return CORRESPONDENCE
+	try:
+		base, increment = time_control.split("+")
+		duration = int(base) + 40 * int(increment)
+	except (AttributeError, ValueError):
+		return TIME_CONTROL_UNKNOWN
+	for limit, bucket in TIME_CONTROL_LIMITS:
+		if duration <= limit:
+			return bucket
+	return CLASSICAL
+
+def metadata_columns(header: chess.pgn.Headers, game_offset: int, plies: np.ndarray) -> Dict[str, np.ndarray]:
+	"""Metadata columns of all encodings of a game, plies holds the ply of each encoding"""
+	number_encodings = plies.shape[0]
+	values = {
+		"white_elo": _elo(header, "WhiteElo"),
+		"black_elo": _elo(header, "BlackElo"),
+		"result": RESULT_CODES.get(header.get("Result"), RESULT_UNKNOWN),
+		"time_control": time_control_bucket(header.get("TimeControl")),
+		"game_offset": game_offset
+	}
+	columns = {"ply": plies.astype(METADATA_COLUMNS["ply"])}
+	for key, value in values.items():
+		columns[key] = np.full(number_encodings, value, dtype=METADATA_COLUMNS[key])
+	return columns
+
+def read_metadata(file: str, columns: List[str] = None) -> Dict[str, np.ndarray]:
+	"""
+	Read metadata columns of an extracted h5 file, in the order of its encodings.
+	Works for the chunked and the single dataset layout, and for flat files written next to file.
+	"""
+	columns = columns or ["game_id", *METADATA_COLUMNS]
+	if all(os.path.isfile(flat_path(file, column)) for column in columns):
+		return {column: np.array(open_flat(flat_path(file, column))) for column in columns}
+	with h5py.File(correct_file_ending(file, 'h5'), 'r') as hf:
+		if all(column in hf for column in columns):
+			return {column: hf[column][:] for column in columns}
+		number_chunks = sum(1 for key in hf.keys() if key.startswith("encoding_"))
+		return {
+			column: np.concatenate([hf[f"{column}_{i}"][:] for i in range(number_chunks)])
+			for column in columns
+		}
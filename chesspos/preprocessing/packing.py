@@ -0,0 +1,54 @@
+from typing import Tuple
+
+import h5py
+import numpy as np
+
+# hdf5 attributes of bit-packed encoding datasets
+CODEC_ATTRIBUTE = "codec"
+SHAPE_ATTRIBUTE = "encoding_shape"
+PACKBITS = "packbits"
+
+def bitboard_to_uint8(bitboard: np.ndarray) -> np.ndarray:
+	"""Pack the last axis of a boolean array into bytes, padding the last byte with zeros"""
+	return np.packbits(bitboard, axis=-1)
+
+def uint8_to_bitboard(packed: np.ndarray, trim_last_bits: int = 0) -> np.ndarray:
+	"""Unpack bytes to booleans, dropping the trim_last_bits padding bits"""
+	bitboard = np.unpackbits(packed, axis=-1)
+	if trim_last_bits > 0:
+		bitboard = bitboard[..., :-trim_last_bits]
+	return bitboard.astype(bool)
+
+def pack_encodings(encodings: np.ndarray) -> np.ndarray:
+	"""Pack boolean encodings of any shape into an array of shape (encodings, bytes)"""
+	if encodings.dtype != bool:
+		raise TypeError(f"Only boolean encodings can be bit-packed, not {encodings.dtype}")
+	return bitboard_to_uint8(encodings.reshape((encodings.shape[0], -1)))
+
+def unpack_encodings(packed: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+	"""Inverse of pack_encodings, shape is the shape of a single encoding"""
+	bits = np.unpackbits(packed, axis=-1, count=int(np.prod(shape)))
+	return bits.view(bool).reshape((packed.shape[0], *shape))
+
+def is_packed(dataset: h5py.Dataset) -> bool:
+	return dataset.attrs.get(CODEC_ATTRIBUTE) == PACKBITS
+
+def encoding_shape(dataset: h5py.Dataset) -> Tuple[int, ...]:
+	"""Shape of a single encoding stored in dataset, packed or not"""
+	if is_packed(dataset):
+		return tuple(int(i) for i in dataset.attrs[SHAPE_ATTRIBUTE])
+	return dataset.shape[1:]
+
+def write_packed_attributes(dataset: h5py.Dataset, shape: Tuple[int, ...]) -> None:
+	dataset.attrs[CODEC_ATTRIBUTE] = PACKBITS
+	dataset.attrs[SHAPE_ATTRIBUTE] = np.asarray(shape, dtype=np.int64)
+
+def decode_encodings(samples: np.ndarray, dataset: h5py.Dataset) -> np.ndarray:
+	"""Return samples read from dataset as encodings, unpacking them if the dataset is packed"""
+	if is_packed(dataset):
+		return unpack_encodings(samples, encoding_shape(dataset))
+	return samples
+
+def read_encodings(dataset: h5py.Dataset) -> np.ndarray:
+	"""Read all encodings of a dataset, packed or not"""
+	return decode_encodings(dataset[:], dataset)
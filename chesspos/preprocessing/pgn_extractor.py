@@ -1,6 +1,12 @@
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import asdict, dataclass
+import io
+import json
 import logging
-from typing import Tuple
+import multiprocessing as mp
+import os
+import re
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
 import h5py
@@ -8,7 +14,14 @@ import chess
 import chess.pgn
 
 import chesspos.custom_types as ct
+from chesspos.preprocessing.deduplication import PositionDeduplicator
+from chesspos.preprocessing.flat_storage import append_rows, flat_path, truncate_rows, write_attributes
 from chesspos.preprocessing.game_processors import GameProcessor
+from chesspos.preprocessing.manifest import write_manifest
+from chesspos.preprocessing.metadata import METADATA_COLUMNS, metadata_columns, read_metadata
+from chesspos.preprocessing.packing import CODEC_ATTRIBUTE, PACKBITS, SHAPE_ATTRIBUTE, pack_encodings, write_packed_attributes
+from chesspos.preprocessing.pgn_scanner import game_offsets, iter_games, read_headers
+from chesspos.preprocessing.pgn_stream import is_compressed, open_pgn, pgn_file_path
 from chesspos.utils.file_utils import correct_file_ending
 
 logger = logging.getLogger(__name__)
@@ -18,6 +31,63 @@ logging.basicConfig(
 	filename="pgn_extract.log"
 )
 
+# first game index, start and end byte offset of the games and, for streamed files, the games themselves
+Task = Tuple[int, int, int, Optional[bytes]]
+# one row per extracted game: game id, byte offset, number of accepted games before it
+GameRecords = np.ndarray
+# per-position columns written next to the encodings, game_id, optionally the metadata columns and zobrist_hash
+Columns = Dict[str, np.ndarray]
+
+CHUNK_KEY = re.compile(rf"^(encoding|game_id|zobrist_hash|{'|'.join(METADATA_COLUMNS)})_(\d+)$")
+# datasets of the single dataset layout, all of them have one row per position
+SINGLE_DATASET_KEYS = ("encodings", "game_id", "zobrist_hash", *METADATA_COLUMNS)
+# hdf5 chunks of the single dataset layout hold about this many bytes
+HDF5_CHUNK_BYTES = 2**20
+# h5 writes one compressed hdf5 file, npy one flat file per dataset of the single dataset layout
+STORAGE_FORMATS = ("h5", "npy")
+
+def compression_options(codec: str) -> dict:
+	"""
+	Translate a codec name to h5py dataset options. Valid codecs are none, lzf,
+	gzip, shuffle+gzip and the gzip variants with a level, e.g. gzip:1 or shuffle+gzip:4.
+	"""
+	if codec == "none":
+		return {}
+	if codec == "lzf":
+		return {"compression": "lzf"}
+
+	name, _, level = codec.partition(":")
+	options = {"compression": "gzip", "compression_opts": int(level) if level else 4}
+	if name == "shuffle+gzip":
+		options["shuffle"] = True
+	elif name != "gzip":
+		raise ValueError(f"Unknown codec {codec}, use none, lzf, gzip[:level] or shuffle+gzip[:level]")
+	if not 0 <= options["compression_opts"] <= 9:
+		raise ValueError(f"gzip level must be between 0 and 9, not {level}")
+	return options
+
+@dataclass
+class ExtractionCheckpoint():
+	"""Where to continue an extraction: the first game with positions that are not saved yet"""
+	pgn_offset: int = 0
+	game_counter: int = 0
+	processed_games: int = 0
+	discarded_games: int = 0
+	chunk_counter: int = 0
+	skip_encodings: int = 0
+	finished: bool = False
+
+	def save(self, path: str) -> None:
+		"""Replace the checkpoint file atomically"""
+		with open(f"{path}.tmp", 'w') as checkpoint_file:
+			json.dump(asdict(self), checkpoint_file)
+		os.replace(f"{path}.tmp", path)
+
+	@classmethod
+	def load(cls, path: str) -> "ExtractionCheckpoint":
+		with open(path, 'r') as checkpoint_file:
+			return cls(**json.load(checkpoint_file))
+
 @dataclass
 class PgnExtractor():
 	pgn_path: str
@@ -25,6 +95,15 @@ class PgnExtractor():
 	is_process_game: ct.GameFilter
 	game_processor: GameProcessor | ct.GameProcessor
 	chunk_size: int = 100000
+	processes: int = 1
+	games_per_task: int = 1000
+	pack_bits: bool = False
+	single_dataset: bool = False
+	codec: str = "gzip:9"
+	metadata: bool = False
+	deduplicator: PositionDeduplicator = None
+	manifest: bool = True
+	storage: str = "h5"
 	_game_counter: int = 0
 	_chunk_counter: int = 0
 	_encoding_counter: int = 0
@@ -32,10 +111,25 @@ class PgnExtractor():
 	_encoding_type: np.dtype = None
 	_discarded_games: int = 0
 	_processed_games: int = 0
+	_encoding_chunk: np.ndarray = None
+	_column_chunks: Columns = None
+	_skip_encodings: int = 0
+	_skip_game: int = 0
+	_skip_base: int = 0
+	_save_file: h5py.File = None
 
 	def __post_init__(self):
 		self._encoding_shape = self._get_encoding_shape()
 		self._encoding_type = self._get_encoding_type()
+		if self.pack_bits and self._encoding_type != bool:
+			raise TypeError(f"pack_bits requires boolean encodings, not {self._encoding_type}")
+		self._compression = compression_options(self.codec)
+		if self.storage not in STORAGE_FORMATS:
+			raise ValueError(f"Unknown storage {self.storage}, use one of {STORAGE_FORMATS}")
+		if self.deduplicator is not None:
+			if type(self.game_processor) is not GameProcessor:
+				raise TypeError("Deduplication requires a GameProcessor, that hashes the positions it encodes")
+			self.game_processor.hash_positions = True
 
 	def _get_encoding_shape(self):
 		_, shape = self._get_encoding_type_and_shape()
@@ -51,7 +145,7 @@ class PgnExtractor():
 			logger.info(f"Type of encoding: {sample_encoding.dtype}, shape of encoding: {sample_encoding.shape[1:]}")
 			return sample_encoding.dtype, sample_encoding.shape[1:]
 		elif type(self.game_processor) is ct.GameProcessor:
-			with open(correct_file_ending(self.pgn_path, "pgn"), 'r') as f:
+			with io.TextIOWrapper(open_pgn(self.pgn_path)) as f:
 				game = chess.pgn.read_game(f)
 				encoding = self.game_processor(game)
 				logger.info(f"Type of encoding: {encoding.dtype}, shape of encoding: {encoding.shape[1:]}")
@@ -59,15 +153,94 @@ class PgnExtractor():
 		else:
 			raise TypeError(f"Type of game_processor must be GameProcessor or GameProcessor, not {type(self.game_processor)}")
 
-	def _write_chunk_to_file(self, chunk: np.ndarray, metadata: np.ndarray):
+	def _column_dtypes(self) -> Dict[str, np.dtype]:
+		dtypes = {"game_id": np.int32}
+		if self.deduplicator is not None:
+			dtypes["zobrist_hash"] = np.uint64
+		if self.metadata:
+			dtypes.update(METADATA_COLUMNS)
+		return dtypes
+
+	def _columns(self, game: chess.pgn.Game, game_id: int, offset: int, number_encodings: int) -> Columns:
+		"""Columns of all encodings of a game"""
+		columns = {"game_id": np.full(number_encodings, game_id, dtype=np.int32)}
+		if self.deduplicator is not None:
+			columns["zobrist_hash"] = self.game_processor.get_hashes()
+			if columns["zobrist_hash"].shape[0] != number_encodings:
+				raise ValueError("Deduplication does not work with position aggregators that change the number of encodings")
+		if self.metadata:
+			plies = None
+			if type(self.game_processor) is GameProcessor:
+				plies = self.game_processor.get_plies()
+			if plies is None or plies.shape[0] != number_encodings:
+				# The position aggregator changed the number of encodings, their plies are unknown
+				plies = np.full(number_encodings, -1)
+			columns.update(metadata_columns(game.headers, offset, plies))
+		return columns
+
+	def _checkpoint_path(self) -> str:
+		return f"{correct_file_ending(self.save_path, 'h5')}.checkpoint.json"
+
+	def _open_save_file(self) -> h5py.File:
+		"""The h5 file stays open until the extraction ends, it is opened on the first write"""
+		if self._save_file is None:
+			self._save_file = h5py.File(correct_file_ending(self.save_path, "h5"), "a")
+		return self._save_file
+
+	def _close_save_file(self) -> None:
+		if self._save_file is not None:
+			self._save_file.close()
+			self._save_file = None
+
+	def _append_to_dataset(self, save_file: h5py.File, key: str, data: np.ndarray) -> h5py.Dataset:
+		"""Append rows to a resizable dataset, creating it on the first call"""
+		if key not in save_file:
+			row_bytes = max(1, data.dtype.itemsize * int(np.prod(data.shape[1:])))
+			chunk_rows = max(1, min(self.chunk_size, HDF5_CHUNK_BYTES // row_bytes))
+			save_file.create_dataset(
+				key, shape=(0, *data.shape[1:]), maxshape=(None, *data.shape[1:]), dtype=data.dtype,
+				chunks=(chunk_rows, *data.shape[1:]), **self._compression
+			)
+		dataset = save_file[key]
+		rows = dataset.shape[0]
+		dataset.resize(rows + data.shape[0], axis=0)
+		dataset[rows:] = data
+		return dataset
+
+	def _write_chunk_to_flat_files(self, encodings: np.ndarray, columns: Columns) -> None:
+		"""Append a chunk to the flat files, which are uncompressed and always have the single dataset layout"""
+		path = flat_path(self.save_path, "encodings")
+		if self.pack_bits and not os.path.isfile(path):
+			write_attributes(path, {CODEC_ATTRIBUTE: PACKBITS, SHAPE_ATTRIBUTE: list(self._encoding_shape)})
+		append_rows(path, encodings)
+		for key, column in columns.items():
+			append_rows(flat_path(self.save_path, key), column)
+
+	def _write_chunk_to_h5_file(self, encodings: np.ndarray, columns: Columns) -> None:
+		save_file = self._open_save_file()
+		if self.single_dataset:
+			data1 = self._append_to_dataset(save_file, "encodings", encodings)
+			for key, column in columns.items():
+				self._append_to_dataset(save_file, key, column)
+		else:
+			data1 = save_file.create_dataset(f"encoding_{self._chunk_counter}", data=encodings, **self._compression)
+			for key, column in columns.items():
+				save_file.create_dataset(f"{key}_{self._chunk_counter}", data=column, **self._compression)
+		if self.pack_bits:
+			write_packed_attributes(data1, self._encoding_shape)
+		# The chunk must be on disk before the checkpoint names it
+		save_file.flush()
+
+	def _write_chunk_to_file(self, chunk: np.ndarray, columns: Columns):
 		logger.info(f"Saving chunk {self._chunk_counter}")
-		fname = correct_file_ending(self.save_path, "h5")
+		encodings = pack_encodings(chunk) if self.pack_bits else chunk
 
 		try:
-			with h5py.File(fname, "a") as save_file:
-				data1 = save_file.create_dataset(f"encoding_{self._chunk_counter}", data=chunk, compression="gzip", compression_opts=9)
-				data2 = save_file.create_dataset(f"game_id_{self._chunk_counter}", data=metadata, compression="gzip", compression_opts=9)
-				logger.info(f"Saved encodings with shape {chunk.shape}")
+			if self.storage == "npy":
+				self._write_chunk_to_flat_files(encodings, columns)
+			else:
+				self._write_chunk_to_h5_file(encodings, columns)
+			logger.info(f"Saved encodings with shape {chunk.shape}")
 		except Exception as e:
 			logger.error(f"Could not save chunk {self._chunk_counter}", exc_info=True)
 			raise e
@@ -75,58 +248,339 @@ class PgnExtractor():
 		self._chunk_counter += 1
 		self._encoding_counter = 0
 
-	def _games(self, number_games):
-		with open(correct_file_ending(self.pgn_path, "pgn"), 'r') as pgn_file:
-			while True:
-				header = chess.pgn.read_headers(pgn_file)
-				self._game_counter += 1
-
-				# Get next suitable game or finish extraction
-				if header is None:
-					logger.info(f"Processed {self._game_counter} games in total")
-					yield None
-				elif not self.is_process_game(header):
-					self._discarded_games += 1
-					continue
-				elif self._game_counter >= number_games:
-					logger.info(f"Processed {self._game_counter} games in total")
-					yield None
-				else:
-					self._processed_games += 1
-					yield chess.pgn.read_game(pgn_file)
-
-	def extract(self, number_games: int = int(1e18)):
-		encoding_chunk = np.empty((self.chunk_size, *self._encoding_shape), dtype=self._encoding_type)
-		game_id = np.empty((self.chunk_size,), dtype=np.int32)
-
-		for game in self._games(number_games):
-			if game is None:
-				chunk = encoding_chunk[:self._encoding_counter]
-				metadata = game_id[:self._encoding_counter]
-				self._write_chunk_to_file(chunk, metadata)
-				break
+	def _commit_chunk(self, chunk: np.ndarray, columns: Columns, checkpoint: ExtractionCheckpoint) -> None:
+		"""Save a chunk, then record where to resume, a chunk only counts once the checkpoint names it"""
+		self._write_chunk_to_file(chunk, columns)
+		checkpoint.chunk_counter = self._chunk_counter
+		checkpoint.save(self._checkpoint_path())
 
-			# Extract information from that game
-			encodings = self.game_processor(game)
-			# Edge case: chunksize reached
-			number_encodings = min(encodings.shape[0], self.chunk_size - self._encoding_counter)
-			#logger.info(f"Extracted {number_encodings} encodings from game {self._game_counter}")
+	def _resume_checkpoint(self, game_ids: np.ndarray, position: int, records: GameRecords, end: ExtractionCheckpoint) -> ExtractionCheckpoint:
+		"""Checkpoint after the first position encodings of a batch are saved"""
+		last_game = game_ids[position-1]
+		if position < game_ids.shape[0] and game_ids[position] == last_game:
+			# The chunk ends within a game, resume at that game and skip its saved positions
+			game_id, offset, processed_before = records[records[:, 0] == last_game][0]
+			saved = np.count_nonzero(game_ids[:position] == last_game)
+			if last_game == self._skip_game:
+				saved += self._skip_base
+		else:
+			next_games = records[records[:, 0] > last_game]
+			if next_games.shape[0] == 0:
+				return ExtractionCheckpoint(**asdict(end))
+			game_id, offset, processed_before = next_games[0]
+			saved = 0
+		return ExtractionCheckpoint(
+			pgn_offset=int(offset),
+			game_counter=int(game_id) - 1,
+			processed_games=int(processed_before),
+			discarded_games=int(game_id) - 1 - int(processed_before),
+			skip_encodings=int(saved)
+		)
+
+	def _add_encodings(self, encodings: np.ndarray, columns: Columns, records: GameRecords, end: ExtractionCheckpoint) -> None:
+		"""
+		Copy encodings into the current chunk and save the chunk to file whenever it is full.
+		records describe the games in this batch and end the state after the batch, both for checkpoints.
+		"""
+		if self.deduplicator is not None:
+			keep = self.deduplicator(columns["zobrist_hash"])
+			encodings = encodings[keep]
+			columns = {key: column[keep] for key, column in columns.items()}
+
+		if self._skip_encodings > 0:
+			# Positions saved before resuming the extraction
+			skip = min(self._skip_encodings, encodings.shape[0])
+			encodings = encodings[skip:]
+			columns = {key: column[skip:] for key, column in columns.items()}
+			self._skip_encodings -= skip
+
+		position = 0
+		while position < encodings.shape[0]:
+			number_encodings = min(encodings.shape[0] - position, self.chunk_size - self._encoding_counter)
 			new_encoding_counter = self._encoding_counter + number_encodings
-			encoding_chunk[self._encoding_counter:new_encoding_counter, ...] = encodings[:number_encodings, ...]
-			game_id[self._encoding_counter:new_encoding_counter] = self._game_counter*np.ones(number_encodings, dtype=np.int32)
+			self._encoding_chunk[self._encoding_counter:new_encoding_counter, ...] = encodings[position:position+number_encodings, ...]
+			for key, column in columns.items():
+				self._column_chunks[key][self._encoding_counter:new_encoding_counter] = column[position:position+number_encodings]
 			self._encoding_counter = new_encoding_counter
+			position += number_encodings
 
 			# Save chunk if it is full
 			if self._encoding_counter == self.chunk_size:
-				logger.info(f"Processed {self._processed_games} games in this chunk")
-				logger.info(f"Filtered {self._discarded_games} games in this chunk")
-				self._processed_games = 0
-				self._discarded_games = 0
-				self._write_chunk_to_file(encoding_chunk, game_id)
-		
-		# Log file headers
+				logger.info(f"Processed {self._processed_games} games so far")
+				logger.info(f"Filtered {self._discarded_games} games so far")
+				checkpoint = self._resume_checkpoint(columns["game_id"], position, records, end)
+				self._commit_chunk(self._encoding_chunk, self._column_chunks, checkpoint)
+
+	def _games(self, pgn_file: BinaryIO, number_games: int) -> Iterator[Tuple[int, int, int, chess.pgn.Game]]:
+		"""Yield game id, start and end byte offset and game for every game in pgn_file that passes the game filter"""
+		for offset, raw_game in iter_games(pgn_file):
+			if self._game_counter >= number_games:
+				break
+
+			self._game_counter += 1
+			# Only the tag pairs are parsed to filter, rejected games never reach python-chess
+			if not self.is_process_game(read_headers(raw_game)):
+				self._discarded_games += 1
+				continue
+
+			self._processed_games += 1
+			game = chess.pgn.read_game(io.StringIO(raw_game.decode("utf-8", errors="replace")))
+			yield self._game_counter, offset, offset + len(raw_game), game
+
+		logger.info(f"Processed {self._game_counter} games in total")
+
+	def _extract_games(self, pgn_file: BinaryIO, number_games: int) -> Iterator[Tuple[np.ndarray, Columns, GameRecords, ExtractionCheckpoint]]:
+		"""Yield encodings, their columns, game records and the state after the game for every game that passes the game filter"""
+		for game_id, offset, end_offset, game in self._games(pgn_file, number_games):
+			encodings = self.game_processor(game)
+			records = np.array([[game_id, offset, self._processed_games - 1]], dtype=np.int64)
+			end = ExtractionCheckpoint(
+				pgn_offset=end_offset,
+				game_counter=game_id,
+				processed_games=self._processed_games,
+				discarded_games=self._discarded_games
+			)
+			yield encodings, self._columns(game, game_id, offset, encodings.shape[0]), records, end
+
+	def _extract_range(self, task: Task) -> Tuple[np.ndarray, Columns, GameRecords, int, int]:
+		"""Extract all games of a task, runs inside a worker process. Game records count accepted games within the task."""
+		first_game, start, end, data = task
+		if data is None:
+			with open(pgn_file_path(self.pgn_path), 'rb') as pgn_file:
+				pgn_file.seek(start)
+				data = pgn_file.read(end - start)
+
+		self._game_counter = first_game
+		self._processed_games = 0
+		self._discarded_games = 0
+		encodings = [np.empty((0, *self._encoding_shape), dtype=self._encoding_type)]
+		columns = {key: [np.empty((0,), dtype=dtype)] for key, dtype in self._column_dtypes().items()}
+		records = [np.empty((0, 3), dtype=np.int64)]
+		pgn_file = io.BytesIO(data)
+		for game_encodings, game_columns, game_records, _ in self._extract_games(pgn_file, number_games=int(1e18)):
+			encodings.append(game_encodings)
+			for key, column in game_columns.items():
+				columns[key].append(column)
+			records.append(game_records)
+
+		records = np.concatenate(records)
+		records[:, 1] += start
+		columns = {key: np.concatenate(column) for key, column in columns.items()}
+		if "game_offset" in columns:
+			columns["game_offset"] += start
+		return (
+			np.concatenate(encodings), columns, records,
+			self._game_counter, self._processed_games
+		)
+
+	def _tasks(self, number_games: int, start_offset: int) -> Iterator[Task]:
+		"""Split the pgn file into byte ranges of games_per_task games, workers read them from the file"""
+		offsets = game_offsets(self.pgn_path)
+		file_end = os.path.getsize(pgn_file_path(self.pgn_path))
+		if number_games < len(offsets):
+			file_end = offsets[number_games]
+			offsets = offsets[:number_games]
+
+		ends = np.append(offsets, file_end)
+		for first_game in range(np.searchsorted(offsets, start_offset), len(offsets), self.games_per_task):
+			last_game = min(first_game + self.games_per_task, len(offsets))
+			yield first_game, int(ends[first_game]), int(ends[last_game]), None
+
+	def _stream_tasks(self, number_games: int, start_offset: int) -> Iterator[Task]:
+		"""Split a compressed pgn file into tasks of games_per_task games, which carry the decompressed games"""
+		with open_pgn(self.pgn_path) as pgn_file:
+			_skip_bytes(pgn_file, start_offset)
+			games = []
+			first_game = self._game_counter
+			start = end = start_offset
+			for offset, raw_game in iter_games(pgn_file):
+				if first_game + len(games) >= number_games:
+					break
+				if len(games) == 0:
+					start = offset
+				games.append(raw_game)
+				end = offset + len(raw_game)
+				if len(games) == self.games_per_task:
+					yield first_game, start, end, b"".join(games)
+					first_game += len(games)
+					games = []
+			if len(games) > 0:
+				yield first_game, start, end, b"".join(games)
+
+	def _collect_task(self, task: Task, result: Tuple[np.ndarray, Columns, GameRecords, int, int]) -> None:
+		encodings, columns, records, game_counter, processed_games = result
+		# Worker count accepted games from the start of their task
+		records[:, 2] += self._processed_games
+		self._processed_games += processed_games
+		self._game_counter = game_counter
+		self._discarded_games = self._game_counter - self._processed_games
+		end = ExtractionCheckpoint(
+			pgn_offset=task[2],
+			game_counter=self._game_counter,
+			processed_games=self._processed_games,
+			discarded_games=self._discarded_games
+		)
+		self._add_encodings(encodings, columns, records, end)
+
+	def _extract_parallel(self, number_games: int, start_offset: int) -> ExtractionCheckpoint:
+		if is_compressed(self.pgn_path):
+			tasks = self._stream_tasks(number_games, start_offset)
+		else:
+			tasks = self._tasks(number_games, start_offset)
+		logger.info(f"Extracting on {self.processes} processes")
+
+		pgn_offset = start_offset
+		with mp.Pool(self.processes, initializer=_init_worker, initargs=(self,)) as pool:
+			# Collect results in task order, this makes game ids and chunks deterministic.
+			# Only a few tasks are submitted ahead, so that streamed games do not pile up in memory.
+			pending = deque()
+			for task in tasks:
+				pending.append((task, pool.apply_async(_extract_task, (task,))))
+				if len(pending) >= 2 * self.processes:
+					task, result = pending.popleft()
+					self._collect_task(task, result.get())
+					pgn_offset = task[2]
+			while len(pending) > 0:
+				task, result = pending.popleft()
+				self._collect_task(task, result.get())
+				pgn_offset = task[2]
+
+		logger.info(f"Processed {self._game_counter} games in total")
+		return self._current_checkpoint(pgn_offset)
+
+	def _extract_serial(self, number_games: int, start_offset: int) -> ExtractionCheckpoint:
+		with open_pgn(self.pgn_path) as pgn_file:
+			_skip_bytes(pgn_file, start_offset)
+			for encodings, columns, records, end in self._extract_games(pgn_file, number_games):
+				self._add_encodings(encodings, columns, records, end)
+			return self._current_checkpoint(pgn_file.tell())
+
+	def _current_checkpoint(self, pgn_offset: int) -> ExtractionCheckpoint:
+		return ExtractionCheckpoint(
+			pgn_offset=pgn_offset,
+			game_counter=self._game_counter,
+			processed_games=self._processed_games,
+			discarded_games=self._discarded_games
+		)
+
+	def _resume(self) -> ExtractionCheckpoint:
+		"""Restore the counters of the last checkpoint and remove positions saved after it"""
+		checkpoint = ExtractionCheckpoint()
+		if os.path.isfile(self._checkpoint_path()):
+			checkpoint = ExtractionCheckpoint.load(self._checkpoint_path())
+		self._game_counter = checkpoint.game_counter
+		self._processed_games = checkpoint.processed_games
+		self._discarded_games = checkpoint.discarded_games
+		self._chunk_counter = checkpoint.chunk_counter
+		self._skip_encodings = checkpoint.skip_encodings
+		self._skip_game = checkpoint.game_counter + 1
+		self._skip_base = checkpoint.skip_encodings
+
+		fname = correct_file_ending(self.save_path, "h5")
+		for key in SINGLE_DATASET_KEYS:
+			if os.path.isfile(flat_path(self.save_path, key)):
+				truncate_rows(flat_path(self.save_path, key), self._chunk_counter * self.chunk_size)
+		if os.path.isfile(fname):
+			with h5py.File(fname, "a") as save_file:
+				for key in list(save_file.keys()):
+					match = CHUNK_KEY.match(key)
+					if match and int(match.group(2)) >= self._chunk_counter:
+						logger.info(f"Rolling back incomplete dataset {key}")
+						del save_file[key]
+					elif key in SINGLE_DATASET_KEYS:
+						# All chunks before the last one are full
+						save_file[key].resize(self._chunk_counter * self.chunk_size, axis=0)
+
+		if self.deduplicator is not None and self._chunk_counter > 0:
+			# Positions of the game to resume are deduplicated again, when its saved positions are skipped
+			saved = read_metadata(fname, ["game_id", "zobrist_hash"])
+			self.deduplicator.add(saved["zobrist_hash"][saved["game_id"] < self._skip_game])
+		logger.info(f"Resuming extraction at game {self._game_counter} from chunk {self._chunk_counter}")
+		return checkpoint
+
+	def _write_manifest(self) -> None:
+		if self.manifest and self.storage == "h5":
+			# Lets readers skip opening the h5 file to find its datasets
+			write_manifest(self.save_path)
+
+	def _existing_outputs(self) -> List[str]:
+		"""Datasets and flat files of an earlier extraction to save_path"""
+		existing = [flat_path(self.save_path, key) for key in SINGLE_DATASET_KEYS if os.path.isfile(flat_path(self.save_path, key))]
 		fname = correct_file_ending(self.save_path, "h5")
-		with h5py.File(fname, 'r') as hf:
-			logger.info(f"Keys: {hf.keys()}")
-			logger.info(f"Shape of encoding: {hf['encoding_0'].shape}")
-			logger.info(f"Shape of game_id: {hf['game_id_0'].shape}")
+		if os.path.isfile(fname):
+			with h5py.File(fname, "r") as save_file:
+				existing += [f"{fname}/{key}" for key in save_file.keys() if key in SINGLE_DATASET_KEYS or CHUNK_KEY.match(key)]
+		return existing
+
+	def _start(self) -> None:
+		"""A new extraction neither appends to the output of an earlier one nor resumes from its checkpoint"""
+		existing = self._existing_outputs()
+		if len(existing) > 0:
+			raise FileExistsError(f"{existing[0]} exists already, resume the extraction or remove its output first")
+		if os.path.isfile(self._checkpoint_path()):
+			os.remove(self._checkpoint_path())
+
+	def extract(self, number_games: int = int(1e18), resume: bool = False):
+		"""
+		Extract up to number_games games from the pgn file. A checkpoint is saved next to the
+		h5 file after every chunk, with resume=True an interrupted extraction continues from it.
+		Without resume the output must not exist yet.
+		"""
+		start_offset = 0
+		if resume:
+			checkpoint = self._resume()
+			if checkpoint.finished:
+				logger.info("Extraction already finished, nothing to resume")
+				# The extraction may have stopped between its last checkpoint and the manifest
+				self._write_manifest()
+				return
+			start_offset = checkpoint.pgn_offset
+		else:
+			self._start()
+
+		self._encoding_chunk = np.empty((self.chunk_size, *self._encoding_shape), dtype=self._encoding_type)
+		self._column_chunks = {key: np.empty((self.chunk_size,), dtype=dtype) for key, dtype in self._column_dtypes().items()}
+
+		try:
+			if self.processes > 1:
+				end = self._extract_parallel(number_games, start_offset)
+			else:
+				end = self._extract_serial(number_games, start_offset)
+
+			# Save the last, partially filled chunk
+			end.finished = True
+			columns = {key: column[:self._encoding_counter] for key, column in self._column_chunks.items()}
+			self._commit_chunk(self._encoding_chunk[:self._encoding_counter], columns, end)
+
+			if self.deduplicator is not None:
+				logger.info(f"Dropped {self.deduplicator.dropped} duplicate positions")
+
+			# Log file headers
+			if self._save_file is not None:
+				for key, dataset in self._save_file.items():
+					logger.info(f"Shape of {key}: {dataset.shape}")
+		finally:
+			self._close_save_file()
+
+		self._write_manifest()
+
+
+def _skip_bytes(pgn_file: BinaryIO, offset: int) -> None:
+	"""Move to offset, streams of compressed files that cannot seek are read up to it"""
+	if pgn_file.seekable():
+		pgn_file.seek(offset)
+		return
+	while pgn_file.tell() < offset:
+		if not pgn_file.read(min(2**20, offset - pgn_file.tell())):
+			break
+
+
+# Extractor of the current worker process, set once by the pool initializer
+_worker_extractor: PgnExtractor = None
+
+def _init_worker(extractor: PgnExtractor) -> None:
+	global _worker_extractor
+	_worker_extractor = extractor
+
+def _extract_task(task: Task) -> Tuple[np.ndarray, Columns, GameRecords, int, int]:
+	return _worker_extractor._extract_range(task)
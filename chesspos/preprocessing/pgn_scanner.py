@@ -0,0 +1,83 @@
+import re
+from typing import BinaryIO, Iterator, Tuple
+
+import chess.pgn
+import numpy as np
+
+from chesspos.utils.file_utils import correct_file_ending
+
+# A new game starts with a tag pair line directly after an empty line
+GAME_START = re.compile(rb"\n\r?\n\[")
+# Same tag pair syntax as chess.pgn.TAG_REGEX, applied to all lines of a header block at once
+TAG_PAIR = re.compile(rb'^\[([A-Za-z0-9][A-Za-z0-9_+#=:-]*)\s+"([^\r\n]*)"\][ \t]*\r?$', re.MULTILINE)
+# The header block ends with the first line that is not a tag pair
+HEADER_END = re.compile(rb"\n[^\[]")
+
+def game_offsets(pgn_path: str, block_size: int = 2**24) -> np.ndarray:
+	"""Return the byte offsets of all games in a pgn file, without parsing any of them"""
+	offsets = []
+	with open(correct_file_ending(pgn_path, "pgn"), 'rb') as pgn_file:
+		head = pgn_file.read(block_size)
+		stripped = head.lstrip()
+		if stripped.startswith(b"["):
+			offsets.append(len(head) - len(stripped))
+
+		# Keep the last bytes of each block, so that boundaries spanning two blocks are found
+		overlap = b""
+		block_offset = 0
+		block = head
+		while block:
+			data = overlap + block
+			data_offset = block_offset - len(overlap)
+			offsets.extend(
+				data_offset + match.end() - 1 for match in GAME_START.finditer(data)
+				if match.end() > len(overlap)
+			)
+			overlap = data[-3:]
+			block_offset += len(block)
+			block = pgn_file.read(block_size)
+
+	return np.asarray(offsets, dtype=np.int64)
+
+def iter_games(pgn_file: BinaryIO, block_size: int = 2**20) -> Iterator[Tuple[int, bytes]]:
+	"""Yield the byte offset and the raw bytes of every game in a pgn file opened in binary mode"""
+	buffer = b""
+	buffer_offset = pgn_file.tell()
+	game_start = None
+	search_start = 0
+	while True:
+		block = pgn_file.read(block_size)
+		buffer += block
+		if game_start is None:
+			stripped = buffer.lstrip()
+			if not stripped:
+				if not block:
+					return
+				continue
+			game_start = len(buffer) - len(stripped)
+			search_start = game_start
+
+		for match in GAME_START.finditer(buffer, search_start):
+			game_end = match.end() - 1
+			yield buffer_offset + game_start, buffer[game_start:game_end]
+			game_start = game_end
+
+		if not block:
+			if buffer[game_start:].strip():
+				yield buffer_offset + game_start, buffer[game_start:]
+			return
+
+		# Drop finished games from the buffer, keep enough bytes to find a boundary spanning two blocks
+		buffer_offset += game_start
+		buffer = buffer[game_start:]
+		search_start = max(len(buffer) - 3, 1)
+		game_start = 0
+
+def read_headers(raw_game: bytes) -> chess.pgn.Headers:
+	"""Parse only the tag pairs of a raw game, skipping the movetext like chess.pgn.read_headers"""
+	header_end = HEADER_END.search(raw_game)
+	header_block = raw_game if header_end is None else raw_game[:header_end.start()]
+	return chess.pgn.Headers({
+		name.decode(): value.decode("utf-8", errors="replace")
+		for name, value in TAG_PAIR.findall(header_block)
+	})
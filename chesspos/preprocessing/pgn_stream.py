@@ -0,0 +1,109 @@
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+from typing import BinaryIO
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+from chesspos.utils.file_utils import correct_file_ending
+
+COMPRESSED_ENDINGS = {
+	"pgn.gz": gzip.open,
+	"pgn.bz2": bz2.open,
+	"pgn.xz": lzma.open,
+	"pgn.zst": lambda path, mode: _open_zstd(path)
+}
+
+def _open_zstd(path: str) -> BinaryIO:
+	if zstandard is None:
+		raise ImportError(f"Reading {path} requires the zstandard package (pip install zstandard)")
+	return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+
+def pgn_file_path(pgn_path: str) -> str:
+	"""Return the path of a plain or compressed pgn file, adding the .pgn ending if it is missing"""
+	if is_compressed(pgn_path):
+		return pgn_path
+	return correct_file_ending(pgn_path, "pgn")
+
+def is_compressed(pgn_path: str) -> bool:
+	return any(pgn_path.endswith(ending) for ending in COMPRESSED_ENDINGS)
+
+class BackgroundReader(io.RawIOBase):
+	"""
+	Read a stream on a background thread, such that decompression overlaps with parsing.
+	At most max_blocks blocks of block_size bytes are buffered.
+	"""
+	def __init__(self, stream: BinaryIO, block_size: int = 2**20, max_blocks: int = 16) -> None:
+		super().__init__()
+		self._stream = stream
+		self._block_size = block_size
+		self._blocks = queue.Queue(maxsize=max_blocks)
+		self._stop = threading.Event()
+		self._block = memoryview(b"")
+		self._offset = 0
+		self._eof = False
+		self._thread = threading.Thread(target=self._fill, daemon=True)
+		self._thread.start()
+
+	def _fill(self) -> None:
+		try:
+			while not self._stop.is_set():
+				block = self._stream.read(self._block_size)
+				self._put(block)
+				if not block:
+					break
+		except Exception as e:
+			self._put(e)
+
+	def _put(self, item) -> None:
+		while not self._stop.is_set():
+			try:
+				self._blocks.put(item, timeout=0.1)
+				return
+			except queue.Full:
+				continue
+
+	def readable(self) -> bool:
+		return True
+
+	def readinto(self, buffer) -> int:
+		if len(self._block) == 0 and not self._eof:
+			block = self._blocks.get()
+			if isinstance(block, Exception):
+				raise block
+			self._eof = len(block) == 0
+			self._block = memoryview(block)
+
+		size = min(len(buffer), len(self._block))
+		buffer[:size] = self._block[:size]
+		self._block = self._block[size:]
+		self._offset += size
+		return size
+
+	def tell(self) -> int:
+		"""Number of decompressed bytes read so far"""
+		return self._offset
+
+	def close(self) -> None:
+		if not self.closed:
+			self._stop.set()
+			self._thread.join()
+			self._stream.close()
+		super().close()
+
+def open_pgn(pgn_path: str, block_size: int = 2**20, max_blocks: int = 16) -> BinaryIO:
+	"""
+	Open a pgn file for binary reading. Files ending in .pgn.gz, .pgn.bz2, .pgn.xz or .pgn.zst
+	are decompressed on a background thread while they are read.
+	"""
+	path = pgn_file_path(pgn_path)
+	for ending, open_compressed in COMPRESSED_ENDINGS.items():
+		if path.endswith(ending):
+			return BackgroundReader(open_compressed(path, 'rb'), block_size=block_size, max_blocks=max_blocks)
+	return open(path, 'rb')
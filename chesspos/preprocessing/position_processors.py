@@ -1,4 +1,7 @@
+from typing import Iterable, List, Tuple
+
 import chess
+import chess.polyglot
 import numpy as np
 
 def board_to_bitboard(board: chess.Board) -> np.ndarray:
@@ -47,8 +50,44 @@ def bitboard_to_board(bb: np.ndarray) -> chess.Board:
 	reconstructed_board.set_castling_fen(castling_rights)
 	return reconstructed_board
 
+def _changed_squares(planes: np.ndarray, board: chess.Board, move: chess.Move) -> List[chess.Square]:
+	"""
+	Return the squares whose piece changed with move. planes are the 12 piece planes of
+	the position before the move, board is the position after the move.
+	"""
+	mover = not board.turn
+	from_rank, from_file = chess.square_rank(move.from_square), chess.square_file(move.from_square)
+	to_file = chess.square_file(move.to_square)
+	if planes[(1-mover)*6 + chess.KING - 1, move.from_square]:
+		# castling moves the king by more than one file or onto its own rook
+		if abs(to_file - from_file) > 1 or board.king(mover) != move.to_square:
+			return [chess.square(file, from_rank) for file in range(8)]
+	elif planes[(1-mover)*6 + chess.PAWN - 1, move.from_square] and to_file != from_file:
+		# en passant captures a pawn beside the from square
+		return [move.from_square, move.to_square, chess.square(to_file, from_rank)]
+	return [move.from_square, move.to_square]
+
+def _update_piece_planes(planes: np.ndarray, board: chess.Board, move: chess.Move) -> None:
+	for square in _changed_squares(planes, board, move):
+		planes[:, square] = False
+		piece = board.piece_at(square)
+		if piece is not None:
+			planes[(1-piece.color)*6 + piece.piece_type - 1, square] = True
+
+def update_bitboard(bitboard: np.ndarray, board: chess.Board, move: chess.Move) -> None:
+	"""
+	Update the bitboard of the position before move in place, such that it equals
+	board_to_bitboard(board). board is the position after move.
+	"""
+	_update_piece_planes(bitboard[:768].reshape((12, 64)), board, move)
+	bitboard[768] = board.turn
+	bitboard[769] = board.has_kingside_castling_rights(chess.WHITE)
+	bitboard[770] = board.has_queenside_castling_rights(chess.WHITE)
+	bitboard[771] = board.has_kingside_castling_rights(chess.BLACK)
+	bitboard[772] = board.has_queenside_castling_rights(chess.BLACK)
+
 def board_to_tensor(board: chess.Board) -> np.ndarray:
-	embedding = np.empty((8,8,15), dtype=bool)
+	embedding = np.zeros((8,8,15), dtype=bool)
 	# one plane per piece
 	for color in [1, 0]:
 		for i in range(1, 7): # P N B R Q K / white
@@ -76,6 +115,25 @@ def board_to_tensor(board: chess.Board) -> np.ndarray:
 	embedding[0,0,14] = board.turn
 	return embedding
 
+def update_tensor(tensor: np.ndarray, board: chess.Board, move: chess.Move) -> None:
+	"""
+	Update the tensor of the position before move in place, such that it equals
+	board_to_tensor(board). board is the position after move.
+	"""
+	planes = tensor.reshape((64, 15)).T
+	_update_piece_planes(planes[:12], board, move)
+
+	planes[12, chess.A1] = board.has_queenside_castling_rights(chess.WHITE)
+	planes[12, chess.H1] = board.has_kingside_castling_rights(chess.WHITE)
+	planes[12, chess.A8] = board.has_queenside_castling_rights(chess.BLACK)
+	planes[12, chess.H8] = board.has_kingside_castling_rights(chess.BLACK)
+
+	planes[13, :] = False
+	if board.ep_square is not None and board.has_legal_en_passant():
+		planes[13, board.ep_square] = True
+
+	planes[14, chess.A1] = board.turn
+
 def tensor_to_board(tensor: np.ndarray, threshold: float = 0.5) -> chess.Board:
 	assert tensor.shape == (8,8,15), f"tensor_to_board encounterer an input with invalid shape {tensor.shape}, expected shape (8,8,15)"
 	tensor = np.where(tensor > threshold, 1, 0)
@@ -110,3 +168,90 @@ def tensor_to_board(tensor: np.ndarray, threshold: float = 0.5) -> chess.Board:
 	# set turn
 	reconstructed_board.turn = tensor[0,0,14]
 	return reconstructed_board
+
+
+def _board_masks(board: chess.Board) -> Tuple[int, ...]:
+	return (
+		board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+		board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK], board.promoted,
+		board.clean_castling_rights(), board.turn
+	)
+
+def _boards_to_masks(boards: Iterable[chess.Board]) -> np.ndarray:
+	"""Collect the bitboard integers of many boards in one uint64 array of shape (boards, 11)"""
+	masks = np.array([_board_masks(board) for board in boards], dtype=np.uint64)
+	return masks.reshape((-1, 11))
+
+def _masks_to_piece_planes(masks: np.ndarray) -> np.ndarray:
+	"""Expand the masks of _boards_to_masks to 12 piece planes of 64 squares, white pieces first"""
+	pieces, white, black = masks[:, 0:6], masks[:, 6:7], masks[:, 7:8]
+	piece_masks = np.concatenate((pieces & white, pieces & black), axis=1).astype("<u8")
+	planes = np.unpackbits(piece_masks.view(np.uint8), axis=1, bitorder="little")
+	return planes.view(bool).reshape((-1, 12, 64))
+
+def _masks_to_castling_rights(masks: np.ndarray) -> np.ndarray:
+	"""
+	Return white kingside, white queenside, black kingside and black queenside castling rights.
+	Equivalent to Board.has_kingside_castling_rights and Board.has_queenside_castling_rights:
+	a side may castle towards every rook with castling rights on its backrank, that is on the
+	far side of the king.
+	"""
+	kings, white, black, promoted, castling = masks[:, 5], masks[:, 6], masks[:, 7], masks[:, 8], masks[:, 9]
+	rights = np.empty((masks.shape[0], 4), dtype=bool)
+	for i, (color, backrank) in enumerate([(white, chess.BB_RANK_1), (black, chess.BB_RANK_8)]):
+		backrank = np.uint64(backrank)
+		king_mask = kings & color & backrank & ~promoted
+		rooks = castling & backrank
+		lowest_rook = rooks & (~rooks + np.uint64(1))
+		rights[:, 2*i] = (king_mask != 0) & (rooks > king_mask)
+		rights[:, 2*i+1] = (king_mask != 0) & (lowest_rook != 0) & (lowest_rook < king_mask)
+	return rights
+
+def boards_to_bitboards(boards: Iterable[chess.Board]) -> np.ndarray:
+	"""Batched version of board_to_bitboard, returns an array of shape (boards, 773)"""
+	masks = _boards_to_masks(boards)
+	embedding = np.empty((masks.shape[0], 773), dtype=bool)
+	embedding[:, :768] = _masks_to_piece_planes(masks).reshape((-1, 768))
+	embedding[:, 768] = masks[:, 10] != 0
+	embedding[:, 769:] = _masks_to_castling_rights(masks)
+	return embedding
+
+def boards_to_tensors(boards: Iterable[chess.Board]) -> np.ndarray:
+	"""Batched version of board_to_tensor, returns an array of shape (boards, 8, 8, 15)"""
+	boards = list(boards)
+	masks = _boards_to_masks(boards)
+	planes = np.zeros((masks.shape[0], 15, 64), dtype=bool)
+	planes[:, :12, :] = _masks_to_piece_planes(masks)
+
+	# castling rights at plane 12
+	castling_rights = _masks_to_castling_rights(masks)
+	planes[:, 12, chess.A1] = castling_rights[:, 1]
+	planes[:, 12, chess.H1] = castling_rights[:, 0]
+	planes[:, 12, chess.A8] = castling_rights[:, 3]
+	planes[:, 12, chess.H8] = castling_rights[:, 2]
+
+	# en passant squares at plane 13
+	for i, board in enumerate(boards):
+		if board.ep_square is not None and board.has_legal_en_passant():
+			planes[i, 13, board.ep_square] = True
+
+	# turn at plane 14
+	planes[:, 14, chess.A1] = masks[:, 10] != 0
+	return np.ascontiguousarray(planes.transpose((0, 2, 1))).reshape((-1, 8, 8, 15))
+
+# polyglot keys of the 12 piece planes of _masks_to_piece_planes, polyglot orders pieces black pawn, white pawn, black knight, ...
+_POLYGLOT_KEYS = np.array(chess.polyglot.POLYGLOT_RANDOM_ARRAY, dtype=np.uint64)
+_POLYGLOT_PIECE_KEYS = _POLYGLOT_KEYS[:768].reshape((6, 2, 64))[:, ::-1, :].transpose((1, 0, 2)).reshape((12, 64))
+_POLYGLOT_HASHER = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+
+def zobrist_hashes(boards: Iterable[chess.Board]) -> np.ndarray:
+	"""Batched version of chess.polyglot.zobrist_hash, returns a uint64 array of shape (boards,)"""
+	boards = list(boards)
+	masks = _boards_to_masks(boards)
+	planes = _masks_to_piece_planes(masks)
+	hashes = np.bitwise_xor.reduce(np.where(planes, _POLYGLOT_PIECE_KEYS, np.uint64(0)).reshape((-1, 768)), axis=1)
+	castling_rights = _masks_to_castling_rights(masks)
+	hashes ^= np.bitwise_xor.reduce(np.where(castling_rights, _POLYGLOT_KEYS[768:772], np.uint64(0)), axis=1)
+	hashes ^= np.array([_POLYGLOT_HASHER.hash_ep_square(board) for board in boards], dtype=np.uint64)
+	hashes ^= np.where(masks[:, 10] != 0, _POLYGLOT_KEYS[780], np.uint64(0))
+	return hashes
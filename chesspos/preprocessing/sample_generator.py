@@ -1,11 +1,24 @@
 import os
+import threading
+import time
 import h5py
-from typing import Callable, List, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple, Union
 import numpy as np
-import tensorflow as tf
 
 from chesspos.utils.file_utils import correct_file_ending, files_from_directory
-from chesspos.preprocessing.utils import sample_generator_from_file_array
+from chesspos.utils.prefetch import prefetch
+from chesspos.preprocessing.flat_storage import FLAT_ENDING, HEADER_SIZE, describe_flat, open_flat
+from chesspos.preprocessing.manifest import describe_dataset, read_manifest
+from chesspos.preprocessing.packing import PACKBITS, unpack_encodings
+
+# tensorflow is imported by the methods that build tf datasets, extraction and plain generators run without it
+if TYPE_CHECKING:
+	import tensorflow as tf
+
+# flat files of encodings, written by PgnExtractor with storage="npy", end with this
+FLAT_ENCODINGS = f".encodings.{FLAT_ENDING}"
+# flat files and h5 files are both opened as a mapping from dataset key to array
+SampleFile = Union[h5py.File, Dict[str, np.ndarray]]
 
 
 class SampleGenerator():
@@ -15,31 +28,245 @@ class SampleGenerator():
 		sample_preprocessor: Callable[[np.ndarray], np.ndarray],
 		batch_size=16,
 		sample_type=np.float32,
+		read_batches=256,
+		shuffle=False,
+		seed=None,
+		shuffle_block_size=1024,
+		shuffle_buffer_blocks=64,
+		prefetch_blocks=2,
+		native=False,
+		tf_preprocessor: Callable[['tf.Tensor'], 'tf.Tensor'] = None,
+		parallel_reads=4,
+		worker_index=0,
+		num_workers=1
 	):
 		self.H5_COL_KEY = 'encoding'
 		self.sample_dir = sample_dir
 		self.sample_preprocessor = sample_preprocessor
 		self.batch_size = batch_size
 		self.sample_type = sample_type
+		# number of batches read from a dataset at once, such that single large datasets are not loaded as a whole
+		self.read_batches = read_batches
+		# shuffled sampling reads blocks of consecutive samples from random places of all datasets,
+		# at most shuffle_buffer_blocks blocks are held and mixed in memory at a time
+		self.shuffle = shuffle
+		self.seed = seed
+		self.shuffle_block_size = shuffle_block_size
+		self.shuffle_buffer_blocks = shuffle_buffer_blocks
+		# number of sample blocks read and decoded ahead on a background thread, 0 reads them on demand
+		self.prefetch_blocks = prefetch_blocks
+		# native tf.data pipeline: samples stay bool or packed until the graph decodes them, tf_preprocessor
+		# replaces sample_preprocessor there and defaults to it, which then has to work on tensors
+		self.native = native
+		self.tf_preprocessor = tf_preprocessor or sample_preprocessor
+		self.parallel_reads = parallel_reads
+		# data parallel training: every worker reads a disjoint hyperslab of equal length of every dataset
+		if not 0 <= worker_index < num_workers:
+			raise ValueError(f"worker_index must be between 0 and num_workers - 1, not {worker_index}")
+		self.worker_index = worker_index
+		self.num_workers = num_workers
+		self._open_files: Dict[str, SampleFile] = {}
+		self._open_files_lock = threading.Lock()
+		self._epoch = 0
+		# batches the next pass over the samples leaves out, see set_position
+		self._skip_batches = 0
+		# seconds the consumer of get_generator spent waiting for batches, including preprocessing
+		self.wait_seconds = 0.0
+		self._datasets, self._descriptions = self._build_index()
+		self._dataset_starts, self._dataset_lengths = self._shard()
 		self.number_samples, self.sample_shape = self._get_sample_dimensions()
 		self.generator_function = self._construct_generator_function()
 
 
 	def _construct_generator_function(self):
 		def generator_function():
-			assert(self.sample_shape is not None, "SampleGenerator has not been initialized with a sample shape.")
-			sample_files = files_from_directory(os.path.abspath(self.sample_dir), file_type="h5")
-			for samples in sample_generator_from_file_array(sample_files, self.H5_COL_KEY, self.sample_type):
-				tmp_samples = samples
-				i = 0
-				while len(tmp_samples) >= self.batch_size:
-					yield self.sample_preprocessor(samples[:self.batch_size, ...])
-					samples = samples[self.batch_size:, ...]
+			assert self.sample_shape is not None, "SampleGenerator has not been initialized with a sample shape."
+			skip, self._skip_batches = self._skip_batches, 0
+			blocks = self._shuffled_blocks_of_batches(skip) if self.shuffle else self._blocks_of_batches(skip)
+			requested = time.perf_counter()
+			for block in prefetch(blocks, self.prefetch_blocks):
+				# Batches are views into the block, walking through it by offset
+				for start in range(0, block.shape[0], self.batch_size):
+					batch = self.sample_preprocessor(block[start:start+self.batch_size])
+					self.wait_seconds += time.perf_counter() - requested
+					yield batch
+					requested = time.perf_counter()
 		return generator_function
 
 
+	@staticmethod
+	def _open_sample_file(file: str) -> SampleFile:
+		"""Open an h5 file, or memory map a flat file, such that processes reading it share the page cache"""
+		if file.endswith(FLAT_ENCODINGS):
+			return {"encodings": open_flat(file)}
+		return h5py.File(correct_file_ending(file, 'h5'), 'r')
+
+	@staticmethod
+	def _close_sample_file(sample_file: SampleFile) -> None:
+		if isinstance(sample_file, h5py.File):
+			sample_file.close()
+
+	def _decode(self, samples: np.ndarray, description: Dict) -> np.ndarray:
+		"""Encodings of samples read from a dataset, unpacked if it is bit-packed"""
+		if description["codec"] == PACKBITS:
+			samples = unpack_encodings(samples, tuple(description["encoding_shape"]))
+		return np.asarray(samples, dtype=self.sample_type)
+
+	def _blocks_of_batches(self, skip: int = 0):
+		"""Yield decoded blocks of read_batches batches of every dataset in index order, after the first skip batches"""
+		sample_file, opened = None, None
+		try:
+			for (file, key), description, shard_start, shard_length in zip(
+				self._datasets, self._descriptions, self._dataset_starts, self._dataset_lengths
+			):
+				number_batches = shard_length // self.batch_size
+				if skip >= number_batches:
+					skip -= number_batches
+					continue
+				if opened != file:
+					if sample_file is not None:
+						self._close_sample_file(sample_file)
+					sample_file, opened = self._open_sample_file(file), file
+				dataset = sample_file[key]
+				first_batches, skip = range(skip, number_batches, self.read_batches), 0
+				for first_batch in first_batches:
+					last_batch = min(first_batch + self.read_batches, number_batches)
+					samples = dataset[shard_start+first_batch*self.batch_size:shard_start+last_batch*self.batch_size]
+					yield self._decode(samples, description)
+		finally:
+			if sample_file is not None:
+				self._close_sample_file(sample_file)
+
+
+	def _file_index(self, file: str) -> List[Tuple[str, Dict]]:
+		"""Sample datasets of a file and their descriptions, taken from its manifest if that is up to date"""
+		if file.endswith(FLAT_ENCODINGS):
+			return [("encodings", describe_flat(file))]
+		manifest = read_manifest(file)
+		if manifest is not None:
+			descriptions = manifest["datasets"]
+		else:
+			with h5py.File(correct_file_ending(file, 'h5'), 'r') as hf:
+				descriptions = {key: describe_dataset(hf[key], checksum=False) for key in hf.keys() if self.H5_COL_KEY in key}
+		return [(key, descriptions[key]) for key in sorted(descriptions) if self.H5_COL_KEY in key]
+
+	def _build_index(self) -> Tuple[List[Tuple[str, str]], List[Dict]]:
+		"""Global index of all sample datasets: their file and key, and their descriptions"""
+		datasets = []
+		descriptions = []
+		files = files_from_directory(os.path.abspath(self.sample_dir), file_type="h5")
+		files += files_from_directory(os.path.abspath(self.sample_dir), file_type=FLAT_ENCODINGS)
+		for file in sorted(files):
+			for key, description in self._file_index(file):
+				datasets.append((file, key))
+				descriptions.append(description)
+		return datasets, descriptions
+
+	def _shard(self) -> Tuple[np.ndarray, np.ndarray]:
+		"""First row and number of rows of the hyperslab of every dataset that this worker reads"""
+		lengths = np.asarray([description["length"] for description in self._descriptions], dtype=np.int64)
+		# Rows that do not divide among the workers are left out, such that all workers run equally many steps
+		shard_lengths = lengths // self.num_workers
+		return self.worker_index * shard_lengths, shard_lengths
+
+	def _blocks(self, block_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+		"""Split the hyperslabs of all datasets into blocks of consecutive samples: their dataset, first and end row"""
+		starts = [
+			np.arange(start, start + length, block_size, dtype=np.int64)
+			for start, length in zip(self._dataset_starts, self._dataset_lengths)
+		]
+		block_datasets = np.repeat(np.arange(len(self._datasets)), [len(s) for s in starts])
+		block_starts = np.concatenate(starts) if len(starts) > 0 else np.empty((0,), dtype=np.int64)
+		block_stops = np.minimum(block_starts + block_size, (self._dataset_starts + self._dataset_lengths)[block_datasets])
+		return block_datasets, block_starts, block_stops
+
+	def _shuffled_blocks(self, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+		"""Split all datasets into blocks of consecutive samples and return them in random order"""
+		block_datasets, block_starts, block_stops = self._blocks(self.shuffle_block_size)
+		order = rng.permutation(block_datasets.shape[0])
+		return block_datasets[order], block_starts[order], block_stops[order]
+
+	def _shuffled_blocks_of_batches(self, skip: int = 0):
+		"""
+		Yield the samples of one epoch in a random order, that is reproducible for a seed and changes every epoch.
+		Blocks of the buffer are read as hyperslabs and their samples are mixed, samples that do not fill
+		a batch are carried over to the next buffer. Buffers of the first skip batches are shuffled as
+		row indices and not read, only the samples they carry over are.
+		"""
+		seed = None if self.seed is None else [self.seed, self._epoch]
+		self._epoch += 1
+		rng = np.random.default_rng(seed)
+		block_datasets, block_starts, block_stops = self._shuffled_blocks(rng)
+
+		files = {}
+		def read(index: int, start: int, stop: int) -> np.ndarray:
+			file, key = self._datasets[index]
+			if file not in files:
+				files[file] = self._open_sample_file(file)
+			return self._decode(files[file][key][start:stop], self._descriptions[index])
+
+		try:
+			leftover = np.empty((0, *self.sample_shape), dtype=self.sample_type)
+			# dataset and row of the samples carried over from skipped buffers
+			leftover_rows = np.empty((0, 2), dtype=np.int64)
+			for first_block in range(0, block_datasets.shape[0], self.shuffle_buffer_blocks):
+				blocks = range(first_block, min(first_block + self.shuffle_buffer_blocks, block_datasets.shape[0]))
+				buffer_size = leftover.shape[0] + leftover_rows.shape[0] + int(np.sum(block_stops[blocks] - block_starts[blocks]))
+				number_batches = buffer_size // self.batch_size
+				if skip > 0 and skip >= number_batches:
+					rows = np.concatenate([leftover_rows] + [
+						np.stack([np.full(block_stops[block] - block_starts[block], block_datasets[block]), np.arange(block_starts[block], block_stops[block])], axis=1)
+						for block in blocks
+					])
+					leftover_rows = rows[rng.permutation(rows.shape[0])][number_batches * self.batch_size:]
+					skip -= number_batches
+					continue
+				if leftover_rows.shape[0] > 0:
+					leftover = np.concatenate([read(index, row, row + 1) for index, row in leftover_rows])
+					leftover_rows = leftover_rows[:0]
+
+				buffer = np.concatenate([leftover] + [read(block_datasets[block], block_starts[block], block_stops[block]) for block in blocks])
+				buffer = buffer[rng.permutation(buffer.shape[0])]
+				yield buffer[skip * self.batch_size:number_batches * self.batch_size]
+				leftover = buffer[number_batches * self.batch_size:]
+				skip = 0
+		finally:
+			for sample_file in files.values():
+				self._close_sample_file(sample_file)
+
+	def batches_per_epoch(self) -> int:
+		"""Batches of one pass over the samples, samples that do not fill a batch are left out"""
+		if self.shuffle:
+			return self.number_samples // self.batch_size
+		return int(np.sum(self._dataset_lengths // self.batch_size))
+
+	def position(self, batches: int) -> Dict:
+		"""
+		Cursor after the first batches batches, counted over all epochs: epoch, batch in the epoch,
+		shuffle seed and, for sequential reads, file, dataset and offset of the next batch.
+		"""
+		epoch, batch = divmod(batches, max(self.batches_per_epoch(), 1))
+		cursor = {"epoch": epoch, "batch": batch, "seed": self.seed, "file": None, "dataset": None, "offset": None}
+		if not self.shuffle and not self.native:
+			dataset_batches = self._dataset_lengths // self.batch_size
+			index = int(np.searchsorted(np.cumsum(dataset_batches), batch, side='right'))
+			if index < len(self._datasets):
+				cursor["file"], cursor["dataset"] = self._datasets[index]
+				cursor["offset"] = int(self._dataset_starts[index] + (batch - np.sum(dataset_batches[:index])) * self.batch_size)
+		return cursor
+
+	def set_position(self, batches: int) -> Dict:
+		"""
+		Start the next pass over the samples at position(batches), without reading the skipped samples.
+		The native pipeline skips exactly in sequential mode, in shuffle mode it skips as many batches of a new order.
+		"""
+		cursor = self.position(batches)
+		self._epoch, self._skip_batches = cursor["epoch"], cursor["batch"]
+		return cursor
+
 	def _get_generator_signature(self):
-		sample = next(self.generator_function())
+		# The preprocessor only needs a batch of the right shape, nothing is read
+		sample = self.sample_preprocessor(np.zeros((self.batch_size, *self.sample_shape), dtype=self.sample_type))
 		out_shape = None
 		if isinstance(sample, np.ndarray):
 			out_shape = sample.shape
@@ -50,6 +277,12 @@ class SampleGenerator():
 		return out_shape
 
 	def get_tf_dataset(self):
+		import tensorflow as tf
+		# Workers read their own shard, tf.distribute must not shard the dataset again
+		options = tf.data.Options()
+		options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+		if self.native:
+			return self._native_tf_dataset().with_options(options)
 		out_shape = self._get_generator_signature()
 		output_signature = []
 		for s in out_shape:
@@ -58,8 +291,141 @@ class SampleGenerator():
 		return tf.data.Dataset.from_generator(
 			self.generator_function,
 			output_signature=tuple(output_signature)
+		).with_options(options)
+
+
+	def _dataset(self, index: int) -> Union[h5py.Dataset, np.ndarray]:
+		"""Dataset of the global index, files stay open for all reads of the native pipeline"""
+		file, key = self._datasets[index]
+		with self._open_files_lock:
+			if file not in self._open_files:
+				self._open_files[file] = self._open_sample_file(file)
+			return self._open_files[file][key]
+
+	def _read_block(self, index: np.ndarray, start: np.ndarray, stop: np.ndarray) -> np.ndarray:
+		"""Read raw samples, as stored, called from tf.numpy_function"""
+		return np.asarray(self._dataset(int(index))[int(start):int(stop)])
+
+	def _decode_tensor(self, raw: 'tf.Tensor', packed: bool) -> 'tf.Tensor':
+		"""Unpack, cast and reshape a batch of raw samples with tf ops"""
+		import tensorflow as tf
+		if packed:
+			shifts = tf.constant([7, 6, 5, 4, 3, 2, 1, 0], dtype=raw.dtype)
+			bits = tf.bitwise.bitwise_and(tf.bitwise.right_shift(raw[..., tf.newaxis], shifts), 1)
+			raw = tf.reshape(bits, [tf.shape(raw)[0], -1])[:, :int(np.prod(self.sample_shape))]
+		return tf.reshape(tf.cast(raw, self.sample_type), [-1, *self.sample_shape])
+
+	def _native_tf_dataset(self) -> 'tf.data.Dataset':
+		"""
+		Build a tf.data pipeline that interleaves block reads of parallel_reads datasets at a time.
+		Samples are only decoded and preprocessed inside the graph, under AUTOTUNE. h5 datasets are read
+		through tf.numpy_function and h5py, which hold the GIL, flat files only with tf ops, see _flat_batches.
+		"""
+		import tensorflow as tf
+		packed = {description["codec"] == PACKBITS for description in self._descriptions}
+		if len(packed) != 1:
+			raise ValueError("The native pipeline requires all datasets to be either bit-packed or not")
+		packed = packed.pop()
+		raw_dtype, raw_shape = np.dtype(self._descriptions[0]["dtype"]), tuple(self._descriptions[0]["shape"][1:])
+		if all(file.endswith(FLAT_ENCODINGS) for file, _ in self._datasets):
+			return self._native_samples(self._flat_batches(raw_dtype, raw_shape), packed)
+
+		block_size = self.shuffle_block_size if self.shuffle else self.read_batches * self.batch_size
+		block_datasets, block_starts, block_stops = self._blocks(block_size)
+		counts = np.bincount(block_datasets, minlength=len(self._datasets))
+		block_counts = tf.constant(counts, dtype=tf.int64)
+		first_blocks = tf.constant(np.cumsum(counts) - counts, dtype=tf.int64)
+		block_datasets, block_starts, block_stops = (tf.constant(a, dtype=tf.int64) for a in (block_datasets, block_starts, block_stops))
+
+		def read_block(block):
+			raw = tf.numpy_function(
+				self._read_block,
+				[tf.gather(block_datasets, block), tf.gather(block_starts, block), tf.gather(block_stops, block)],
+				tf.as_dtype(raw_dtype)
+			)
+			raw.set_shape([None, *raw_shape])
+			return raw
+
+		def dataset_blocks(index):
+			blocks = tf.data.Dataset.range(first_blocks[index], first_blocks[index] + block_counts[index])
+			if self.shuffle:
+				blocks = blocks.shuffle(self.shuffle_buffer_blocks, seed=self.seed)
+			return blocks.map(read_block)
+
+		dataset_indices = tf.data.Dataset.range(len(self._datasets))
+		if self.shuffle:
+			dataset_indices = dataset_indices.shuffle(len(self._datasets), seed=self.seed)
+		blocks = dataset_indices.interleave(
+			dataset_blocks,
+			cycle_length=min(self.parallel_reads, len(self._datasets)),
+			num_parallel_calls=tf.data.AUTOTUNE,
+			deterministic=not self.shuffle
 		)
 
+		if self.shuffle:
+			raw_batches = blocks.unbatch().shuffle(self.shuffle_buffer_blocks * self.shuffle_block_size, seed=self.seed)
+			raw_batches = raw_batches.batch(self.batch_size, drop_remainder=True)
+		else:
+			# Split blocks into batches without a per-sample step, samples that do not fill a batch are dropped
+			def block_batches(raw):
+				number_batches = tf.shape(raw)[0] // self.batch_size
+				raw = tf.reshape(raw[:number_batches * self.batch_size], [number_batches, self.batch_size, *raw_shape])
+				return tf.data.Dataset.from_tensor_slices(raw)
+			raw_batches = blocks.flat_map(block_batches)
+		return self._native_samples(raw_batches, packed)
+
+	def _flat_batches(self, raw_dtype: np.dtype, raw_shape: Tuple[int, ...]) -> 'tf.data.Dataset':
+		"""
+		Raw batches of flat files, read as fixed length records by tf ops that do not hold the GIL.
+		Records can only be read in order, skipping bytes reads them, in shuffle mode batches instead of
+		block indices pass through a buffer of shuffle_buffer_blocks blocks before their samples are mixed.
+		"""
+		import tensorflow as tf
+		row_bytes = raw_dtype.itemsize * int(np.prod(raw_shape))
+		files = tf.constant([file for file, _ in self._datasets])
+		starts = tf.constant(self._dataset_starts, dtype=tf.int64)
+		# Samples that do not fill a batch are left out, like blocks of the other datasets do
+		stops = tf.constant(self._dataset_starts + self._dataset_lengths // self.batch_size * self.batch_size, dtype=tf.int64)
+		lengths = tf.constant([description["length"] for description in self._descriptions], dtype=tf.int64)
+
+		def dataset_batches(index):
+			records = tf.data.FixedLengthRecordDataset(
+				tf.gather(files, index), record_bytes=self.batch_size * row_bytes,
+				header_bytes=HEADER_SIZE + tf.gather(starts, index) * row_bytes,
+				footer_bytes=(tf.gather(lengths, index) - tf.gather(stops, index)) * row_bytes
+			)
+			raw_batches = records.map(lambda record: tf.reshape(tf.io.decode_raw(record, tf.as_dtype(raw_dtype)), [self.batch_size, *raw_shape]))
+			if self.shuffle:
+				raw_batches = raw_batches.shuffle(self.shuffle_buffer_blocks * self.shuffle_block_size // self.batch_size, seed=self.seed)
+			return raw_batches
+
+		dataset_indices = tf.data.Dataset.range(len(self._datasets))
+		if self.shuffle:
+			dataset_indices = dataset_indices.shuffle(len(self._datasets), seed=self.seed)
+		raw_batches = dataset_indices.interleave(
+			dataset_batches,
+			cycle_length=min(self.parallel_reads, len(self._datasets)),
+			num_parallel_calls=tf.data.AUTOTUNE,
+			deterministic=not self.shuffle
+		)
+		if self.shuffle:
+			raw_batches = raw_batches.unbatch().shuffle(self.shuffle_buffer_blocks * self.shuffle_block_size, seed=self.seed)
+			raw_batches = raw_batches.batch(self.batch_size, drop_remainder=True)
+		return raw_batches
+
+	def _native_samples(self, raw_batches: 'tf.data.Dataset', packed: bool) -> 'tf.data.Dataset':
+		"""Skip the batches set by set_position, then decode and preprocess raw batches in the graph"""
+		import tensorflow as tf
+		skip, self._skip_batches = self._skip_batches, 0
+		if skip > 0:
+			raw_batches = raw_batches.skip(skip)
+
+		samples = raw_batches.map(
+			lambda raw: self.tf_preprocessor(self._decode_tensor(raw, packed)),
+			num_parallel_calls=tf.data.AUTOTUNE,
+			deterministic=not self.shuffle
+		)
+		return samples.prefetch(tf.data.AUTOTUNE)
 
 	def get_generator(self):
 		return self.generator_function()
@@ -69,17 +435,11 @@ class SampleGenerator():
 		"""
 		Return the number of samples (first dimension) and the shape of the samples (other dimensions).
 		"""
-		samples = 0
+		samples = int(np.sum(self._dataset_lengths))
 		shape = None
-		sample_files = files_from_directory(os.path.abspath(self.sample_dir), file_type="h5")
-		for i, file in enumerate(sample_files):
-			fname = correct_file_ending(file, 'h5')
-			with h5py.File(fname, 'r') as hf:
-				for key in hf.keys():
-					if self.H5_COL_KEY in key:
-						samples += hf[key].shape[0]
-						if i == 0:
-							shape = hf[key].shape[1:]
-						else:
-							assert(shape == hf[key].shape[1:], "Shape of samples in file {} does not match shape of samples in file {}".format(i, i-1))
+		for (file, key), description in zip(self._datasets, self._descriptions):
+			if shape is None:
+				shape = tuple(description["encoding_shape"])
+			else:
+				assert shape == tuple(description["encoding_shape"]), "Shape of samples in dataset {} of file {} does not match shape of other samples".format(key, file)
 		return samples, shape
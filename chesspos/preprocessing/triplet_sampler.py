@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+import numpy as np
+
+# maps a batch of encodings to a batch of embeddings, e.g. a keras encoder
+Encoder = Callable[[np.ndarray], np.ndarray]
+
+@dataclass
+class TripletSampler():
+	"""
+	Sample anchor, positive, negative row indices of extracted positions from their game_id column.
+	Rows of a game are consecutive and in ply order, as PgnExtractor writes them. Positives are at
+	most max_distance rows away from the anchor in the same game, negatives are rows of other games.
+	"""
+	game_ids: np.ndarray
+	max_distance: int = 4
+	seed: int = None
+
+	def __post_init__(self):
+		game_ids = np.asarray(self.game_ids)
+		boundaries = np.flatnonzero(game_ids[1:] != game_ids[:-1]) + 1
+		starts = np.concatenate([[0], boundaries]).astype(np.int64)
+		lengths = np.diff(np.concatenate([starts, [game_ids.shape[0]]]))
+		self._row_game = np.repeat(np.arange(starts.shape[0]), lengths)
+		self._starts, self._lengths = starts, lengths
+		# Only positions of games with at least two positions have a positive
+		self._anchors = np.flatnonzero(lengths[self._row_game] > 1)
+		if self._anchors.shape[0] == 0 or starts.shape[0] < 2:
+			raise ValueError("Triplets require at least two games and a game with more than one position")
+		self._rng = np.random.default_rng(self.seed)
+
+	def sample(self, number_triplets: int) -> np.ndarray:
+		"""Array of shape (number_triplets, 3) of anchor, positive and negative rows"""
+		anchors = self._anchors[self._rng.integers(0, self._anchors.shape[0], number_triplets)]
+		games = self._row_game[anchors]
+		starts, lengths = self._starts[games], self._lengths[games]
+
+		# Positives are drawn in a random direction and mirrored or clipped into the game
+		distances = self._rng.integers(1, np.minimum(self.max_distance, lengths - 1) + 1)
+		distances *= self._rng.choice([-1, 1], number_triplets)
+		positives = anchors + distances
+		outside = (positives < starts) | (positives >= starts + lengths)
+		positives[outside] = anchors[outside] - distances[outside]
+		positives = np.clip(positives, starts, starts + lengths - 1)
+
+		# Draw from all rows but the ones of the anchor game and shift draws past them
+		negatives = self._rng.integers(0, self._row_game.shape[0] - lengths)
+		negatives += lengths * (negatives >= starts)
+		return np.stack([anchors, positives, negatives], axis=1)
+
+	def hard_negatives(self, triplets: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+		"""
+		Replace the negatives of a batch of triplets by rows of the batch, that are of other games and
+		closest to the anchor while farther than the positive. Anchors without such a row get the closest
+		row of another game. embeddings has shape (triplets, 3, embedding size).
+		"""
+		rows = triplets.reshape(-1)
+		candidates = embeddings.reshape(rows.shape[0], -1)
+		anchors = embeddings[:, 0].reshape(triplets.shape[0], -1)
+		distances = (
+			np.sum(np.square(anchors), axis=1, keepdims=True) + np.sum(np.square(candidates), axis=1)
+			- 2 * anchors @ candidates.T
+		)
+		positive_distances = distances[np.arange(triplets.shape[0]), 3 * np.arange(triplets.shape[0]) + 1]
+
+		other_game = self._row_game[rows][np.newaxis, :] != self._row_game[triplets[:, 0]][:, np.newaxis]
+		hardest = np.where(other_game, distances, np.inf)
+		semi_hard = np.where(hardest > positive_distances[:, np.newaxis], hardest, np.inf)
+		choice = np.where(np.isfinite(semi_hard.min(axis=1)), semi_hard.argmin(axis=1), hardest.argmin(axis=1))
+
+		hard_triplets = triplets.copy()
+		hard_triplets[:, 2] = rows[choice]
+		return hard_triplets
+
+	def triplet_batches(self, encodings: np.ndarray, batch_size: int, encoder: Encoder = None) -> Iterator[np.ndarray]:
+		"""
+		Endlessly yield batches of shape (batch_size, 3, *encoding shape) of encodings, e.g. read from a flat
+		file with np.load(mmap_mode='r'). With an encoder, negatives are mined from the batch with hard_negatives.
+		The inputs of deprecated_models.triplet_network are list(batch.swapaxes(0, 1)).
+		"""
+		while True:
+			triplets = self.sample(batch_size)
+			batch = np.asarray(encodings[triplets.reshape(-1)]).reshape((batch_size, 3, *encodings.shape[1:]))
+			if encoder is not None:
+				embeddings = np.asarray(encoder(batch.reshape((-1, *encodings.shape[1:]))))
+				triplets = self.hard_negatives(triplets, embeddings.reshape((batch_size, 3, -1)))
+				batch[:, 2] = encodings[triplets[:, 2]]
+			yield batch
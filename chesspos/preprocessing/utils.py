@@ -6,6 +6,7 @@ import numpy as np
 import chess
 
 from chesspos.utils.file_utils import correct_file_ending
+from chesspos.preprocessing.packing import read_encodings
 
 def samples_from_file(file, table_id_prefix, dtype=np.float32):
 	'''
@@ -17,7 +18,7 @@ def samples_from_file(file, table_id_prefix, dtype=np.float32):
 		print(f"keys in {fname}: {hf.keys()}")
 		for key in hf.keys():
 			if table_id_prefix in key:
-				samples.extend(hf[key][:])
+				samples.extend(read_encodings(hf[key]))
 	return np.asarray(samples, dtype=dtype)
 
 def samples_from_file_array(files, table_id_prefix, dtype=np.float32):
@@ -42,7 +43,7 @@ def samples_generator_from_file(file, table_id_prefix, dtype=np.float32):
 	with h5py.File(fname, 'r') as hf:
 		for key in hf.keys():
 			if table_id_prefix in key:
-				yield np.asarray(hf[key][:], dtype=dtype)
+				yield np.asarray(read_encodings(hf[key]), dtype=dtype)
 
 def sample_generator_from_file_array(files, table_id_prefix, dtype=np.float32):
 	'''
@@ -0,0 +1,46 @@
+"""
+Run encoders exported by chesspos.models.export.convert_to_tflite without tensorflow. The interpreter comes
+from ai_edge_litert or tflite_runtime, and from tf.lite only if neither is installed. Encoders converted with
+select_tf_ops need the Flex delegate, that only the tf.lite interpreter of the full tensorflow package has.
+"""
+from typing import Type
+
+import numpy as np
+
+TFLITE_FILE = "encoder.tflite"
+
+def _interpreter_class() -> Type:
+	try:
+		from ai_edge_litert.interpreter import Interpreter
+	except ImportError:
+		try:
+			from tflite_runtime.interpreter import Interpreter
+		except ImportError:
+			import tensorflow as tf
+			Interpreter = tf.lite.Interpreter
+	return Interpreter
+
+class TFLiteEncoder():
+	"""Run an encoder exported by convert_to_tflite, on inputs of any size"""
+	def __init__(self, path: str, num_threads: int = None, max_batch_size: int = 256):
+		self.interpreter = _interpreter_class()(model_path=path, num_threads=num_threads)
+		# the interpreter holds all intermediate tensors of a batch at once, larger inputs are split
+		self.max_batch_size = max_batch_size
+		self._input = self.interpreter.get_input_details()[0]
+		self._output = self.interpreter.get_output_details()[0]
+		self._batch_size = None
+
+	def embed(self, inputs: np.ndarray) -> np.ndarray:
+		"""Embeddings of an array of inputs"""
+		inputs = np.asarray(inputs, dtype=np.float32).reshape((-1, *self._input["shape_signature"][1:]))
+		return np.concatenate([self._embed_batch(inputs[i:i + self.max_batch_size]) for i in range(0, inputs.shape[0], self.max_batch_size)])
+
+	def _embed_batch(self, inputs: np.ndarray) -> np.ndarray:
+		# Tensors are only reallocated when the batch size changes
+		if inputs.shape[0] != self._batch_size:
+			self.interpreter.resize_tensor_input(self._input["index"], inputs.shape)
+			self.interpreter.allocate_tensors()
+			self._batch_size = inputs.shape[0]
+		self.interpreter.set_tensor(self._input["index"], inputs)
+		self.interpreter.invoke()
+		return self.interpreter.get_tensor(self._output["index"])
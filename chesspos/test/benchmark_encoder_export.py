@@ -0,0 +1,76 @@
+"""
+Compare latency percentiles at batch size 1, throughput at a large batch size and embedding fidelity of
+the exported encoder, float32, float16 and int8 TFLite, against keras.Model.predict of the encoder.
+The weights are random, fidelity of a trained encoder is best checked on its own test set.
+
+Usage: python -m chesspos.test.benchmark_encoder_export [dense|cnn|resnet] [number_samples]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+import tensorflow as tf
+
+from chesspos.models import CnnAutoencoder, DenseAutoencoder, ResnetAutoencoder
+from chesspos.models.export import QUANTIZATIONS, SIGNATURE_KEY, embedding_fidelity
+from chesspos.preprocessing.sample_generator import SampleGenerator
+from chesspos.serving.tflite_encoder import TFLiteEncoder
+
+ARCHITECTURES = {"dense": DenseAutoencoder, "cnn": CnnAutoencoder, "resnet": ResnetAutoencoder}
+LATENCY_CALLS = 200
+THROUGHPUT_BATCH_SIZE = 1024
+
+def latency_percentiles(embed, samples) -> np.ndarray:
+	"""p50, p90 and p99 latency in ms of single sample calls"""
+	embed(samples[:1])
+	latencies = []
+	for i in range(LATENCY_CALLS):
+		start = time.perf_counter()
+		embed(samples[i % len(samples):i % len(samples) + 1])
+		latencies.append(1000 * (time.perf_counter() - start))
+	return np.percentile(latencies, [50, 90, 99])
+
+def samples_per_second(embed, samples) -> float:
+	embed(samples[:THROUGHPUT_BATCH_SIZE])
+	start = time.perf_counter()
+	for i in range(0, len(samples), THROUGHPUT_BATCH_SIZE):
+		embed(samples[i:i + THROUGHPUT_BATCH_SIZE])
+	return len(samples) / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+	architecture = sys.argv[1] if len(sys.argv) > 1 else "dense"
+	number_samples = int(sys.argv[2]) if len(sys.argv) > 2 else 8192
+	save_dir = tempfile.mkdtemp()
+
+	samples = np.random.default_rng(0).random((number_samples, 8, 8, 15, 1)) < 0.05
+	os.makedirs(f"{save_dir}/samples")
+	with h5py.File(f"{save_dir}/samples/samples.h5", 'w') as hf:
+		hf.create_dataset("encodings", data=samples)
+	samples = samples.astype(np.float32)
+	generator = lambda: SampleGenerator(f"{save_dir}/samples", lambda x: (x, x), batch_size=32)
+	model = ARCHITECTURES[architecture](
+		save_dir=save_dir, train_generator=generator(), test_generator=generator(),
+		train_steps_per_epoch=1, test_steps_per_epoch=1, loss="binary_crossentropy"
+	)
+
+	reference = model.encoder.predict(samples, batch_size=THROUGHPUT_BATCH_SIZE, verbose=0)
+	serve = tf.saved_model.load(model.export_encoder()).signatures[SIGNATURE_KEY]
+	embed_functions = {
+		"keras predict": lambda x: model.encoder.predict(x, verbose=0),
+		"saved model": lambda x: serve(inputs=tf.constant(x))["embeddings"].numpy()
+	}
+	for quantization in QUANTIZATIONS:
+		path = model.export_encoder(quantization=quantization, export_dir=f"{save_dir}/{quantization}")
+		embed_functions[f"tflite {quantization} ({os.path.getsize(path) / 1e6:.1f} MB)"] = TFLiteEncoder(path).embed
+
+	print(f"{architecture} encoder, {number_samples} random positions")
+	print(f"{'':>26} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'samples/s':>10} {'mean cos':>8} {'rel err':>8}")
+	for name, embed in embed_functions.items():
+		p50, p90, p99 = latency_percentiles(embed, samples)
+		throughput = samples_per_second(embed, samples)
+		embeddings = np.concatenate([embed(samples[i:i + THROUGHPUT_BATCH_SIZE]) for i in range(0, number_samples, THROUGHPUT_BATCH_SIZE)])
+		fidelity = embedding_fidelity(reference, embeddings)
+		print(f"{name:>26} {p50:8.2f} {p90:8.2f} {p99:8.2f} {throughput:10.0f} {fidelity['mean_cosine']:8.4f} {fidelity['relative_error']:8.4f}")
@@ -0,0 +1,47 @@
+"""
+Measure extraction throughput of PgnExtractor for different numbers of worker processes.
+
+Usage: python -m chesspos.test.benchmark_pgn_extractor [pgn_path] [number_games]
+Without a pgn_path a synthetic file with random games is generated.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import chesspos.preprocessing.game_filters as gf
+import chesspos.preprocessing.game_processors as gp
+import chesspos.preprocessing.position_filters as pf
+import chesspos.preprocessing.position_processors as pp
+from chesspos.preprocessing.pgn_extractor import PgnExtractor
+from chesspos.test.conftest import write_pgn
+
+def benchmark(pgn_path: str, number_games: int, processes: int, save_dir: str) -> float:
+	game_processor = gp.GameProcessor(
+		is_process_position=pf.no_filter,
+		position_processor=pp.board_to_bitboard
+	)
+	extractor = PgnExtractor(
+		pgn_path=pgn_path,
+		save_path=f"{save_dir}/processes_{processes}.h5",
+		is_process_game=gf.no_filter,
+		game_processor=game_processor,
+		processes=processes,
+		games_per_task=100
+	)
+	start = time.perf_counter()
+	extractor.extract(number_games)
+	return extractor._game_counter / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+	with tempfile.TemporaryDirectory() as save_dir:
+		pgn_path = sys.argv[1] if len(sys.argv) > 1 else write_pgn(f"{save_dir}/games.pgn", number_games=2000)
+		number_games = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+		baseline = None
+		for processes in [1, 2, 4, 8]:
+			if processes > os.cpu_count():
+				break
+			games_per_second = benchmark(pgn_path, number_games, processes, save_dir)
+			baseline = baseline or games_per_second
+			print(f"processes: {processes:2d}   games/s: {games_per_second:9.1f}   speedup: {games_per_second / baseline:5.2f}")
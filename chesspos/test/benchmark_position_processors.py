@@ -0,0 +1,42 @@
+"""
+Compare positions/s of the single board encoders with their batched counterparts.
+
+Usage: python -m chesspos.test.benchmark_position_processors [number_positions]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+import chesspos.preprocessing.position_processors as pp
+from chesspos.test.conftest import random_game
+
+def random_positions(number_positions: int):
+	rng = random.Random(0)
+	boards = []
+	while len(boards) < number_positions:
+		game = random_game(rng, len(boards))
+		board = game.board()
+		for move in game.mainline_moves():
+			board.push(move)
+			boards.append(board.copy(stack=False))
+	return boards[:number_positions]
+
+def positions_per_second(encode, boards) -> float:
+	start = time.perf_counter()
+	encode(boards)
+	return len(boards) / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+	number_positions = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	boards = random_positions(number_positions)
+
+	for single, batched in [
+		(pp.board_to_bitboard, pp.boards_to_bitboards),
+		(pp.board_to_tensor, pp.boards_to_tensors)
+	]:
+		single_speed = positions_per_second(lambda boards: np.stack([single(board) for board in boards]), boards)
+		batched_speed = positions_per_second(batched, boards)
+		print(f"{single.__name__:>18}: {single_speed:10.0f} positions/s")
+		print(f"{batched.__name__:>18}: {batched_speed:10.0f} positions/s   speedup: {batched_speed / single_speed:5.1f}x")
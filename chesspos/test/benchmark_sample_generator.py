@@ -0,0 +1,71 @@
+"""
+Measure batches/s of SampleGenerator with and without background prefetching and of its native
+tf.data pipeline, against the previous generator that read and decoded every block in the consumer
+and copied every batch. The same samples are also read from an uncompressed, memory mapped flat file.
+A training step is simulated by sleeping step_ms milliseconds per batch.
+
+Usage: python -m chesspos.test.benchmark_sample_generator [number_positions] [step_ms]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from chesspos.preprocessing.flat_storage import append_rows
+from chesspos.preprocessing.packing import decode_encodings
+from chesspos.preprocessing.sample_generator import SampleGenerator
+from chesspos.test.benchmark_storage_codecs import random_encodings
+from chesspos.utils.file_utils import correct_file_ending, files_from_directory
+
+BATCH_SIZE = 256
+
+def previous_generator(sample_generator: SampleGenerator):
+	sample_files = files_from_directory(os.path.abspath(sample_generator.sample_dir), file_type="h5")
+	for file in sample_files:
+		with h5py.File(correct_file_ending(file, 'h5'), 'r') as hf:
+			for key in hf.keys():
+				if sample_generator.H5_COL_KEY not in key:
+					continue
+				dataset = hf[key]
+				number_batches = dataset.shape[0] // sample_generator.batch_size
+				for first_batch in range(0, number_batches, sample_generator.read_batches):
+					last_batch = min(first_batch + sample_generator.read_batches, number_batches)
+					samples = dataset[first_batch*sample_generator.batch_size:last_batch*sample_generator.batch_size]
+					for start in range(0, samples.shape[0], sample_generator.batch_size):
+						batch = decode_encodings(samples[start:start+sample_generator.batch_size], dataset)
+						yield sample_generator.sample_preprocessor(np.asarray(batch, dtype=sample_generator.sample_type))
+
+def batches_per_second(batches, step_ms: float) -> float:
+	start = time.perf_counter()
+	number_batches = 0
+	for _ in batches:
+		number_batches += 1
+		if step_ms > 0:
+			time.sleep(step_ms / 1000)
+	return number_batches / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+	number_positions = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+	step_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+
+	with tempfile.TemporaryDirectory() as sample_dir, tempfile.TemporaryDirectory() as flat_dir:
+		encodings = random_encodings(number_positions)
+		with h5py.File(f"{sample_dir}/samples.h5", 'w') as hf:
+			hf.create_dataset("encodings", data=encodings, chunks=(4096, 773), compression="gzip", compression_opts=1)
+		append_rows(f"{flat_dir}/samples.encodings.npy", encodings)
+
+		generator = SampleGenerator(sample_dir, lambda x: x, batch_size=BATCH_SIZE, read_batches=16, prefetch_blocks=0)
+		print(f"previous generator:   batches/s: {batches_per_second(previous_generator(generator), step_ms):8.1f}")
+		for prefetch_blocks in [0, 2, 4]:
+			generator.prefetch_blocks = prefetch_blocks
+			print(f"prefetch_blocks: {prefetch_blocks}    batches/s: {batches_per_second(generator.get_generator(), step_ms):8.1f}")
+		generator.native = True
+		print(f"native tf.data:       batches/s: {batches_per_second(generator.get_tf_dataset(), step_ms):8.1f}")
+
+		flat = SampleGenerator(flat_dir, lambda x: x, batch_size=BATCH_SIZE, read_batches=16)
+		print(f"flat memmap:          batches/s: {batches_per_second(flat.get_generator(), step_ms):8.1f}")
+		flat.native = True
+		print(f"flat memmap native:   batches/s: {batches_per_second(flat.get_tf_dataset(), step_ms):8.1f}")
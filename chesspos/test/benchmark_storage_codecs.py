@@ -0,0 +1,71 @@
+"""
+Measure write and read throughput of the single dataset layout of PgnExtractor for every codec.
+Throughput is given in MB/s of uncompressed encodings.
+
+Usage: python -m chesspos.test.benchmark_storage_codecs [number_positions]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import chess
+import h5py
+import numpy as np
+
+import chesspos.preprocessing.game_filters as gf
+import chesspos.preprocessing.game_processors as gp
+import chesspos.preprocessing.position_filters as pf
+import chesspos.preprocessing.position_processors as pp
+from chesspos.preprocessing.pgn_extractor import PgnExtractor
+from chesspos.test.conftest import random_game
+
+CODECS = ["none", "lzf", "gzip:1", "gzip:4", "gzip:9", "shuffle+gzip:1", "shuffle+gzip:4"]
+
+def random_encodings(number_positions: int) -> np.ndarray:
+	"""Bitboards of positions from random games, which compress like real extracted data"""
+	rng = random.Random(0)
+	boards = []
+	game_nr = 0
+	while len(boards) < number_positions:
+		board = chess.Board()
+		for move in random_game(rng, game_nr).mainline_moves():
+			board.push(move)
+			boards.append(board.copy(stack=False))
+		game_nr += 1
+	return pp.boards_to_bitboards(boards[:number_positions])
+
+def benchmark(encodings: np.ndarray, codec: str, save_path: str, chunk_size: int = 100000):
+	game_processor = gp.GameProcessor(is_process_position=pf.no_filter, position_processor=pp.board_to_bitboard)
+	extractor = PgnExtractor(
+		pgn_path="", save_path=save_path, is_process_game=gf.no_filter, game_processor=game_processor,
+		chunk_size=chunk_size, single_dataset=True, codec=codec
+	)
+	game_ids = np.zeros(chunk_size, dtype=np.int32)
+	start = time.perf_counter()
+	for position in range(0, encodings.shape[0], chunk_size):
+		chunk = encodings[position:position+chunk_size]
+		extractor._write_chunk_to_file(chunk, {"game_id": game_ids[:chunk.shape[0]]})
+	extractor._close_save_file()
+	write_time = time.perf_counter() - start
+
+	start = time.perf_counter()
+	with h5py.File(save_path, 'r') as hf:
+		for position in range(0, hf["encodings"].shape[0], chunk_size):
+			hf["encodings"][position:position+chunk_size]
+	read_time = time.perf_counter() - start
+	return write_time, read_time, os.path.getsize(save_path)
+
+if __name__ == "__main__":
+	number_positions = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+	encodings = random_encodings(number_positions)
+	megabytes = encodings.nbytes / 2**20
+
+	with tempfile.TemporaryDirectory() as save_dir:
+		for codec in CODECS:
+			write_time, read_time, file_size = benchmark(encodings, codec, f"{save_dir}/{codec}.h5")
+			print(
+				f"codec: {codec:15s} write MB/s: {megabytes / write_time:8.1f}   "
+				f"read MB/s: {megabytes / read_time:8.1f}   ratio: {encodings.nbytes / file_size:6.1f}"
+			)
@@ -0,0 +1,58 @@
+import random
+
+import chess
+import chess.pgn
+import pytest
+
+NUMBER_GAMES = 40
+TIME_CONTROLS = ["60+0", "180+0", "300+3", "600+5", "900+10", "1800+0"]
+RESULTS = ["1-0", "0-1", "1/2-1/2"]
+
+def random_game(rng: random.Random, game_nr: int, max_plies: int = 160) -> chess.pgn.Game:
+	"""Play random legal moves from the starting position, with lichess style headers"""
+	game = chess.pgn.Game()
+	game.headers["Event"] = f"Rated game {game_nr}"
+	game.headers["Site"] = f"https://lichess.org/{game_nr:08d}"
+	game.headers["WhiteElo"] = str(rng.randint(800, 2800))
+	game.headers["BlackElo"] = str(rng.randint(800, 2800))
+	game.headers["TimeControl"] = rng.choice(TIME_CONTROLS)
+	game.headers["Result"] = rng.choice(RESULTS)
+
+	node = game
+	board = game.board()
+	for _ in range(rng.randint(1, max_plies)):
+		moves = list(board.legal_moves)
+		if len(moves) == 0:
+			break
+		move = rng.choice(moves)
+		board.push(move)
+		node = node.add_variation(move)
+	return game
+
+def write_pgn(path, number_games: int = NUMBER_GAMES, seed: int = 0) -> str:
+	rng = random.Random(seed)
+	with open(path, "w") as pgn_file:
+		for i in range(number_games):
+			print(random_game(rng, i), file=pgn_file, end="\n\n")
+	return str(path)
+
+@pytest.fixture
+def pgn_path(tmp_path):
+	return write_pgn(tmp_path / "games.pgn")
+
+@pytest.fixture
+def random_boards():
+	"""All positions of a few random games, plus some hand picked edge cases"""
+	rng = random.Random(1)
+	boards = []
+	for i in range(10):
+		game = random_game(rng, i, max_plies=300)
+		board = game.board()
+		for move in game.mainline_moves():
+			board.push(move)
+			boards.append(board.copy())
+	boards.append(chess.Board("rnbqkbnr/pp1p1ppp/8/2pPp3/8/8/PPP1PPPP/RNBQKBNR w KQkq c6 0 3"))
+	boards.append(chess.Board("r3k2r/8/8/8/8/8/8/R3K2R b Qk - 0 1"))
+	boards.append(chess.Board("1r2k1r1/8/8/8/8/8/8/1R2K1R1 w GBgb - 0 1", chess960=True))
+	boards.append(chess.Board("8/8/8/8/8/8/8/8 w - - 0 1"))
+	return boards
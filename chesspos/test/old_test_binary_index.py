@@ -2,17 +2,17 @@ import numpy as np
 import chess
 
 from chesspos.preprocessing.position_processors import bitboard_to_board, board_to_bitboard
-import chesspos.search.binary_index as searchpos
+import chesspos.preprocessing.packing as packing
 
 def test_bitboard_to_uint8():
 	BITBOARD = np.round(np.random.random_sample((773,))).astype(bool)
 	BITBOARDS = np.round(np.random.random_sample((2,773))).astype(bool)
 
-	single = searchpos.bitboard_to_uint8(BITBOARD)
+	single = packing.bitboard_to_uint8(BITBOARD)
 	assert single.dtype == np.uint8
 	assert single.shape == (1+int(773/8),)
 
-	multiple = searchpos.bitboard_to_uint8(BITBOARDS)
+	multiple = packing.bitboard_to_uint8(BITBOARDS)
 	assert multiple.dtype == np.uint8
 	assert multiple.shape == (2,1+int(773/8))
 
@@ -20,14 +20,14 @@ def test_unit8_to_bitboard():
 	BITBOARD = np.round(np.random.random_sample((773,))).astype(bool)
 	BITBOARDS = np.round(np.random.random_sample((2,773))).astype(bool)
 
-	single_converted = searchpos.bitboard_to_uint8(BITBOARD)
-	multiple_converted = searchpos.bitboard_to_uint8(BITBOARDS)
+	single_converted = packing.bitboard_to_uint8(BITBOARD)
+	multiple_converted = packing.bitboard_to_uint8(BITBOARDS)
 
-	bitboard_restored = searchpos.uint8_to_bitboard(single_converted, trim_last_bits=3)
+	bitboard_restored = packing.uint8_to_bitboard(single_converted, trim_last_bits=3)
 	assert bitboard_restored.dtype == bool
 	assert np.all(bitboard_restored == BITBOARD)
 
-	bitboards_restored = searchpos.uint8_to_bitboard(multiple_converted, trim_last_bits=3)
+	bitboards_restored = packing.uint8_to_bitboard(multiple_converted, trim_last_bits=3)
 	assert bitboards_restored.dtype == bool
 	assert np.all(bitboards_restored == BITBOARDS)
 
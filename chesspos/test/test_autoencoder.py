@@ -0,0 +1,135 @@
+
+import h5py
+import numpy as np
+import pytest
+
+import chesspos.preprocessing.position_processors as pp
+from chesspos.models import CnnAutoencoder, DenseAutoencoder, ResnetAutoencoder
+from chesspos.preprocessing.flat_storage import append_rows, flat_path, open_flat, write_attributes
+from chesspos.preprocessing.packing import CODEC_ATTRIBUTE, PACKBITS, SHAPE_ATTRIBUTE, pack_encodings
+from chesspos.preprocessing.sample_generator import SampleGenerator
+
+def _write_samples(sample_dir):
+	sample_dir.mkdir()
+	with h5py.File(sample_dir / "samples.h5", 'w') as hf:
+		hf.create_dataset("encodings", data=np.random.default_rng(0).random((32, 8, 8, 15, 1)) < 0.1)
+	return str(sample_dir)
+
+def _generator(sample_dir):
+	return SampleGenerator(sample_dir, lambda x: (x, x), batch_size=4)
+
+@pytest.mark.parametrize("model_class", [DenseAutoencoder, CnnAutoencoder, ResnetAutoencoder])
+def test_graph_is_built_once(tmp_path, model_class):
+	(tmp_path / "samples").mkdir()
+	with h5py.File(tmp_path / "samples" / "samples.h5", 'w') as hf:
+		hf.create_dataset("encodings", data=np.random.default_rng(0).random((32, 8, 8, 15, 1)) < 0.1)
+	calls = []
+
+	class CountingAutoencoder(model_class):
+		def _model_helper(self):
+			calls.append(1)
+			return super()._model_helper()
+
+	sample_dir = str(tmp_path / "samples")
+	model = CountingAutoencoder(
+		save_dir=str(tmp_path), train_generator=_generator(sample_dir), test_generator=_generator(sample_dir),
+		train_steps_per_epoch=1, test_steps_per_epoch=1, loss="binary_crossentropy"
+	)
+	assert len(calls) == 1
+
+	# The autoencoder chains the encoder and decoder, training it trains them
+	assert model.model.get_layer('encoder') is model.get_encoder()
+	assert model.model.get_layer('decoder') is model.get_decoder()
+	shared = {id(weight) for weight in model.encoder.weights + model.decoder.weights}
+	assert {id(weight) for weight in model.model.weights} == shared
+
+@pytest.mark.parametrize("model_class", [DenseAutoencoder, CnnAutoencoder, ResnetAutoencoder])
+def test_shared_graph_builds_fewer_graphs(tmp_path, model_class):
+	sample_dir = _write_samples(tmp_path / "samples")
+	calls = []
+
+	class CountingAutoencoder(model_class):
+		def _model_helper(self):
+			calls.append(1)
+			return super()._model_helper()
+
+	class SeparateGraphs(CountingAutoencoder):
+		# Encoder, decoder and autoencoder built by a _model_helper call each
+		def _get_graph(self):
+			return self._model_helper()
+
+	def graph_builds(cls):
+		calls.clear()
+		cls(
+			save_dir=str(tmp_path), train_generator=_generator(sample_dir), test_generator=_generator(sample_dir),
+			train_steps_per_epoch=1, test_steps_per_epoch=1, loss="binary_crossentropy"
+		)
+		return len(calls)
+
+	assert graph_builds(CountingAutoencoder) == 1
+	assert graph_builds(SeparateGraphs) == 3
+
+def _dense_autoencoder(tmp_path):
+	sample_dir = _write_samples(tmp_path / "samples")
+	return DenseAutoencoder(
+		save_dir=str(tmp_path), train_generator=_generator(sample_dir), test_generator=_generator(sample_dir),
+		train_steps_per_epoch=1, test_steps_per_epoch=1, loss="binary_crossentropy"
+	)
+
+@pytest.mark.parametrize("storage,pack_bits", [("h5", False), ("h5", True), ("npy", False), ("npy", True)])
+def test_embed_array_matches_predict(random_boards, tmp_path, storage, pack_bits):
+	model = _dense_autoencoder(tmp_path)
+	tensors = pp.boards_to_tensors(random_boards)
+	reference = model.encoder.predict(tensors[..., np.newaxis], verbose=0)
+	# Stored as PgnExtractor stores tensor encodings
+	rows = pack_encodings(tensors) if pack_bits else tensors
+	attributes = {CODEC_ATTRIBUTE: PACKBITS, SHAPE_ATTRIBUTE: [8, 8, 15]} if pack_bits else {}
+
+	if storage == "npy":
+		path = flat_path(str(tmp_path / "samples.h5"), "encodings")
+		write_attributes(path, attributes)
+		append_rows(path, rows)
+		embeddings = np.concatenate(list(model.embed_array(open_flat(path), batch_size=100)))
+	else:
+		with h5py.File(tmp_path / "samples.h5", 'w') as hf:
+			hf.create_dataset("encodings", data=rows)
+			hf["encodings"].attrs.update(attributes)
+			embeddings = np.concatenate(list(model.embed_array(hf["encodings"], batch_size=100)))
+	assert embeddings.shape == reference.shape
+	assert np.allclose(embeddings, reference, atol=1e-5)
+
+def test_embed_packed_array_and_boards(random_boards, tmp_path):
+	model = _dense_autoencoder(tmp_path)
+	tensors = pp.boards_to_tensors(random_boards)
+	reference = model.encoder.predict(tensors[..., np.newaxis], verbose=0)
+
+	embeddings = model.embed_boards(random_boards, batch_size=100, boards_to_input=pp.boards_to_tensors)
+	assert np.allclose(np.concatenate(list(embeddings)), reference, atol=1e-5)
+	embeddings = model.embed_array(pack_encodings(tensors), batch_size=100, packed_shape=(8, 8, 15))
+	assert np.allclose(np.concatenate(list(embeddings)), reference, atol=1e-5)
+	# Packed rows read as unpacked ones are rejected instead of embedded as fewer rows
+	with pytest.raises(ValueError):
+		list(model.embed_array(pack_encodings(tensors[:8])))
+
+def test_sample_losses_match_evaluate(tmp_path):
+	model = _dense_autoencoder(tmp_path)
+	x, _ = next(model.test_generator.get_generator())
+	losses = model._sample_losses(x)
+	assert losses.shape == (x.shape[0],)
+	for i in range(x.shape[0]):
+		assert np.isclose(losses[i], model.model.evaluate(x[i:i+1], x[i:i+1], verbose=0), rtol=1e-4)
+
+@pytest.mark.parametrize("number_samples,test_samples", [(1, 32), (5, 32), (6, 12), (20, 8)])
+@pytest.mark.parametrize("worst", [False, True])
+def test_sorted_losses_match_full_sort(tmp_path, number_samples, test_samples, worst):
+	model = _dense_autoencoder(tmp_path)
+	test_generator = model.test_generator.get_generator()
+	inputs = np.concatenate([next(test_generator)[0] for _ in range(test_samples // model.test_generator.batch_size)])
+	losses = model._sample_losses(inputs)
+	order = np.argsort(-losses if worst else losses, kind="stable")[:number_samples]
+
+	samples = model._get_sorted_losses(number_samples, test_samples, worst=worst)
+	assert len(samples) == min(number_samples, test_samples)
+	assert np.allclose([sample['loss'] for sample in samples], losses[order])
+	for sample, i in zip(samples, order):
+		assert np.array_equal(sample['input'], inputs[i:i+1])
@@ -1,7 +1,9 @@
 import chess
+import numpy as np
 
 from chesspos.preprocessing.position_processors import (
-	board_to_bitboard, bitboard_to_board, board_to_tensor, tensor_to_board
+	board_to_bitboard, bitboard_to_board, board_to_tensor, tensor_to_board,
+	boards_to_bitboards, boards_to_tensors
 )
 
 start_board = chess.Board(chess.STARTING_FEN)
@@ -39,3 +41,21 @@ def test_full_tensor_conversion():
 	print(reconstructed_board.__str__())
 	assert ep_board_state == _get_board_state(reconstructed_board)
 	assert ep_board.board_fen() == reconstructed_board.board_fen()
+
+def test_boards_to_bitboards(random_boards):
+	bitboards = boards_to_bitboards(random_boards)
+	assert bitboards.shape == (len(random_boards), 773)
+	assert bitboards.dtype == 'bool'
+	for board, bitboard in zip(random_boards, bitboards):
+		assert np.array_equal(bitboard, board_to_bitboard(board))
+
+def test_boards_to_tensors(random_boards):
+	tensors = boards_to_tensors(random_boards)
+	assert tensors.shape == (len(random_boards), 8, 8, 15)
+	assert tensors.dtype == 'bool'
+	for board, tensor in zip(random_boards, tensors):
+		assert np.array_equal(tensor, board_to_tensor(board))
+
+def test_batch_encoders_empty_input():
+	assert boards_to_bitboards([]).shape == (0, 773)
+	assert boards_to_tensors([]).shape == (0, 8, 8, 15)
@@ -0,0 +1,94 @@
+import chess
+import chess.polyglot
+import h5py
+import numpy as np
+import pytest
+
+import chesspos.preprocessing.game_filters as gf
+import chesspos.preprocessing.game_processors as gp
+import chesspos.preprocessing.position_filters as pf
+import chesspos.preprocessing.position_processors as pp
+from chesspos.preprocessing.deduplication import BloomFilter, PositionDeduplicator, ZobristSet
+from chesspos.preprocessing.metadata import read_metadata
+from chesspos.preprocessing.pgn_extractor import PgnExtractor
+
+def _keep_first(hashes, keep_first):
+	"""Reference deduplication with a python dict"""
+	counts = {}
+	keep = []
+	for key in hashes.tolist():
+		keep.append(counts.get(key, 0) < keep_first)
+		if keep[-1]:
+			counts[key] = counts.get(key, 0) + 1
+	return np.array(keep)
+
+def _random_hashes(number_hashes, number_unique, seed=0):
+	rng = np.random.default_rng(seed)
+	unique = rng.integers(0, 2**64 - 1, number_unique, dtype=np.uint64, endpoint=True)
+	hashes = rng.choice(unique, number_hashes)
+	hashes[:3] = 0
+	return hashes
+
+def test_zobrist_hashes(random_boards):
+	boards = random_boards + [chess.Board("rnbqkbnr/ppp1pppp/8/3p4/8/8/PPPPPPPP/RNBQKBNR w KQkq d6 0 2")]
+	expected = np.array([chess.polyglot.zobrist_hash(board) for board in boards], dtype=np.uint64)
+	assert np.array_equal(pp.zobrist_hashes(boards), expected)
+
+@pytest.mark.parametrize("keep_first", [1, 3])
+def test_exact_deduplication(keep_first):
+	hashes = _random_hashes(50000, 20000)
+	deduplicator = PositionDeduplicator(keep_first=keep_first)
+	keep = np.concatenate([deduplicator(batch) for batch in np.array_split(hashes, 300)])
+	expected = _keep_first(hashes, keep_first)
+	assert np.array_equal(keep, expected)
+	assert deduplicator.dropped == np.count_nonzero(~expected)
+
+def test_zobrist_set_grows():
+	hashes = _random_hashes(10000, 5000)
+	zobrist_set = ZobristSet(capacity=16)
+	zobrist_set.add(hashes)
+	assert len(zobrist_set) == np.unique(hashes).shape[0]
+	assert np.array_equal(zobrist_set.counts(np.unique(hashes)), np.unique(hashes, return_counts=True)[1])
+
+def test_bloom_deduplication():
+	hashes = _random_hashes(50000, 20000)
+	deduplicator = PositionDeduplicator(exact=False, expected_positions=20000, false_positive_rate=1e-3)
+	keep = np.concatenate([deduplicator(batch) for batch in np.array_split(hashes, 300)])
+	expected = _keep_first(hashes, 1)
+	# Never keeps a duplicate, drops few unique positions
+	assert not np.any(keep & ~expected)
+	assert np.count_nonzero(expected & ~keep) < 0.01 * np.count_nonzero(expected)
+	assert BloomFilter(capacity=20000, false_positive_rate=1e-3).nbytes() < 20000 * 15
+
+def test_deduplicated_extraction(pgn_path, tmp_path):
+	results = []
+	for name, processes in [("serial", 1), ("parallel", 2)]:
+		extractor = PgnExtractor(
+			pgn_path=pgn_path,
+			save_path=str(tmp_path / f"{name}.h5"),
+			is_process_game=gf.no_filter,
+			game_processor=gp.GameProcessor(is_process_position=pf.no_filter, position_processor=pp.board_to_bitboard),
+			chunk_size=500,
+			processes=processes,
+			games_per_task=3,
+			deduplicator=PositionDeduplicator(keep_first=2)
+		)
+		extractor.extract()
+		results.append((read_metadata(str(tmp_path / f"{name}.h5"), ["game_id", "zobrist_hash"]), extractor))
+
+	(serial, extractor), (parallel, _) = results
+	for key in serial:
+		assert np.array_equal(serial[key], parallel[key])
+	_, counts = np.unique(serial["zobrist_hash"], return_counts=True)
+	assert counts.max() == 2
+	assert extractor.deduplicator.dropped > 0
+	with h5py.File(tmp_path / "serial.h5", 'r') as hf:
+		number_positions = sum(hf[key].shape[0] for key in hf.keys() if key.startswith("encoding_"))
+	assert number_positions + extractor.deduplicator.dropped == sum(
+		len(list(game.mainline_moves())) for game in _games(pgn_path)
+	)
+
+def _games(pgn_path):
+	with open(pgn_path, 'r') as pgn_file:
+		while (game := chess.pgn.read_game(pgn_file)) is not None:
+			yield game
@@ -0,0 +1,92 @@
+import json
+import multiprocessing as mp
+import os
+import socket
+
+import h5py
+import numpy as np
+import pytest
+from tensorflow import keras
+
+from chesspos.preprocessing.sample_generator import SampleGenerator
+
+NUMBER_WORKERS = 3
+
+def _write_samples(sample_dir):
+	"""Rows are the bits of their index, such that every row is unique"""
+	os.makedirs(sample_dir, exist_ok=True)
+	rows = np.arange(2000)
+	bits = (rows[:, np.newaxis] >> np.arange(12)) & 1 == 1
+	with h5py.File(f"{sample_dir}/first.h5", 'w') as hf:
+		hf.create_dataset("encoding_0", data=bits[:700])
+		hf.create_dataset("encoding_1", data=bits[700:1301])
+	with h5py.File(f"{sample_dir}/second.h5", 'w') as hf:
+		hf.create_dataset("encodings", data=bits[1301:])
+	return str(sample_dir)
+
+def _row_ids(batches):
+	return np.concatenate(batches).astype(np.int64) @ (1 << np.arange(12))
+
+@pytest.mark.parametrize("mode", [{}, {"shuffle": True, "seed": 0}, {"native": True}])
+def test_worker_shards_are_disjoint(tmp_path, mode):
+	sample_dir = _write_samples(tmp_path / "samples")
+	shards = []
+	for worker_index in range(NUMBER_WORKERS):
+		generator = SampleGenerator(
+			sample_dir, lambda x: x, batch_size=10, read_batches=4, shuffle_block_size=64,
+			worker_index=worker_index, num_workers=NUMBER_WORKERS, **mode
+		)
+		batches = [np.asarray(batch) for batch in (generator.get_tf_dataset() if mode.get("native") else generator.get_generator())]
+		shards.append(_row_ids(batches))
+		assert generator.number_samples == 700 // 3 + 601 // 3 + 699 // 3
+
+	# Every worker runs equally many steps on rows no other worker reads
+	assert len({shard.shape[0] for shard in shards}) == 1
+	all_rows = np.concatenate(shards)
+	assert np.unique(all_rows).shape[0] == all_rows.shape[0]
+
+def _free_port():
+	with socket.socket() as s:
+		s.bind(("localhost", 0))
+		return s.getsockname()[1]
+
+def _train_worker(task_index, ports, sample_dir, result_path):
+	os.environ["TF_CONFIG"] = json.dumps({
+		"cluster": {"worker": [f"localhost:{port}" for port in ports]},
+		"task": {"type": "worker", "index": task_index}
+	})
+	import tensorflow as tf
+	from chesspos.models.distributed import is_chief, worker_shard
+
+	strategy = tf.distribute.MultiWorkerMirroredStrategy()
+	worker_index, num_workers = worker_shard(strategy)
+	generator = SampleGenerator(
+		sample_dir, lambda x: (x, x), batch_size=16, worker_index=worker_index, num_workers=num_workers
+	)
+	with strategy.scope():
+		model = tf.keras.Sequential([tf.keras.layers.Input((12,)), tf.keras.layers.Dense(12)])
+		model.compile(optimizer="sgd", loss="mse")
+	model.fit(generator.get_tf_dataset().repeat(), steps_per_epoch=5, epochs=2, verbose=0)
+	np.save(result_path, np.concatenate([w.ravel() for w in model.get_weights()] + [[worker_index, num_workers, is_chief(strategy)]]))
+
+# keras 3 eagerly all-reduces the first distributed batch to build the model in fit, which the collective ops
+# of MultiWorkerMirroredStrategy reject
+@pytest.mark.skipif(int(keras.__version__.split(".")[0]) >= 3, reason="keras 3 fit fails on multiple workers")
+def test_multi_worker_training(tmp_path):
+	sample_dir = _write_samples(tmp_path / "samples")
+	ports = [_free_port(), _free_port()]
+	context = mp.get_context("spawn")
+	workers = [
+		context.Process(target=_train_worker, args=(i, ports, sample_dir, str(tmp_path / f"worker_{i}.npy")))
+		for i in range(2)
+	]
+	for worker in workers:
+		worker.start()
+	for worker in workers:
+		worker.join(timeout=300)
+		assert worker.exitcode == 0
+
+	first, second = np.load(tmp_path / "worker_0.npy"), np.load(tmp_path / "worker_1.npy")
+	assert list(first[-3:]) == [0, 2, 1] and list(second[-3:]) == [1, 2, 0]
+	# Gradients are all-reduced, both workers end with the same weights
+	assert np.allclose(first[:-3], second[:-3])
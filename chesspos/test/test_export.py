@@ -0,0 +1,66 @@
+import h5py
+import numpy as np
+import pytest
+import tensorflow as tf
+from tensorflow import keras
+
+from chesspos.models import CnnAutoencoder, DenseAutoencoder
+from chesspos.models.export import SIGNATURE_KEY, convert_to_tflite, embedding_fidelity, export_encoder
+from chesspos.preprocessing.sample_generator import SampleGenerator
+from chesspos.serving.tflite_encoder import TFLiteEncoder
+
+def _encoder():
+	keras.utils.set_random_seed(0)
+	inputs = keras.layers.Input((8, 8, 15, 1), dtype=tf.float16)
+	x = keras.layers.Reshape((8*8*15,))(inputs)
+	x = keras.layers.Dense(64, activation='relu')(x)
+	return keras.Model(inputs=inputs, outputs=keras.layers.Dense(32)(x), name='encoder')
+
+def _samples(tmp_path):
+	samples = np.random.default_rng(0).random((256, 8, 8, 15, 1)) < 0.1
+	(tmp_path / "samples").mkdir()
+	with h5py.File(tmp_path / "samples" / "samples.h5", 'w') as hf:
+		hf.create_dataset("encodings", data=samples)
+	return samples.astype(np.float32), SampleGenerator(str(tmp_path / "samples"), lambda x: (x, x), batch_size=16)
+
+def test_saved_model_signature(tmp_path):
+	encoder = _encoder()
+	samples, _ = _samples(tmp_path)
+	serve = tf.saved_model.load(export_encoder(encoder, str(tmp_path / "encoder"))).signatures[SIGNATURE_KEY]
+	embeddings = serve(inputs=tf.constant(samples[:10]))["embeddings"].numpy()
+	assert embeddings.dtype == np.float32
+	assert np.allclose(embeddings, encoder.predict(samples[:10], verbose=0), atol=1e-6)
+
+@pytest.mark.parametrize("quantization,min_cosine", [("float32", 0.9999), ("float16", 0.999), ("int8", 0.98)])
+def test_tflite_embeddings_match_encoder(tmp_path, quantization, min_cosine):
+	encoder = _encoder()
+	samples, generator = _samples(tmp_path)
+	path = convert_to_tflite(encoder, str(tmp_path / "encoder"), quantization=quantization, calibration_generator=generator)
+	tflite_encoder = TFLiteEncoder(path, max_batch_size=100)
+
+	reference = encoder.predict(samples, verbose=0)
+	# The batch size can change between calls, larger inputs are split into batches
+	embeddings = np.concatenate([tflite_encoder.embed(samples[:1]), tflite_encoder.embed(samples[1:])])
+	assert embeddings.shape == reference.shape
+	assert embedding_fidelity(reference, embeddings)["min_cosine"] > min_cosine
+
+@pytest.mark.parametrize("model_class", [DenseAutoencoder, CnnAutoencoder])
+def test_only_models_without_builtin_ops_use_tf_ops(tmp_path, model_class):
+	samples, generator = _samples(tmp_path)
+	model = model_class(
+		save_dir=str(tmp_path), train_generator=generator, test_generator=generator,
+		train_steps_per_epoch=1, test_steps_per_epoch=1, loss="binary_crossentropy"
+	)
+	path = model.export_encoder(quantization="float32")
+	# tensorflow ops are custom ops of the Flex delegate
+	with open(path, 'rb') as tflite_file:
+		assert (b"Flex" in tflite_file.read()) == model_class.tflite_select_tf_ops
+	reference = model.encoder.predict(samples[:32], verbose=0).reshape((32, -1))
+	try:
+		embeddings = TFLiteEncoder(path).embed(samples[:32]).reshape((32, -1))
+	except RuntimeError as error:
+		# The tf.lite interpreter of recent tensorflow releases is not linked with the Flex delegate
+		if "Flex" not in str(error):
+			raise
+		pytest.skip("The installed interpreter has no Flex delegate")
+	assert embedding_fidelity(reference, embeddings)["min_cosine"] > 0.9999
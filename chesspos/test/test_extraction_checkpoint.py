@@ -0,0 +1,195 @@
+import gzip
+import json
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+import chesspos.preprocessing.game_filters as gf
+import chesspos.preprocessing.game_processors as gp
+import chesspos.preprocessing.position_filters as pf
+import chesspos.preprocessing.position_processors as pp
+from chesspos.preprocessing.deduplication import PositionDeduplicator
+from chesspos.preprocessing.flat_storage import append_rows, flat_path, open_flat
+from chesspos.preprocessing.pgn_extractor import PgnExtractor
+
+class Crash(Exception):
+	pass
+
+def crash_after(number_positions):
+	"""Position filter that accepts all positions and raises after number_positions positions"""
+	calls = [0]
+	def filter(board):
+		calls[0] += 1
+		if calls[0] > number_positions:
+			raise Crash()
+		return True
+	return filter
+
+def _extractor(pgn_path, save_path, is_process_position=pf.no_filter, **kwargs):
+	game_processor = gp.GameProcessor(
+		is_process_position=is_process_position,
+		position_processor=pp.board_to_bitboard
+	)
+	return PgnExtractor(
+		pgn_path=pgn_path,
+		save_path=save_path,
+		is_process_game=gf.elo_filter((1000, 2600), (1000, 2600)),
+		game_processor=game_processor,
+		chunk_size=37,
+		**kwargs
+	)
+
+def _read(save_path):
+	with h5py.File(save_path, 'r') as hf:
+		number_chunks = sum(1 for key in hf.keys() if key.startswith("encoding_"))
+		encodings = np.concatenate([hf[f"encoding_{i}"][:] for i in range(number_chunks)])
+		game_ids = np.concatenate([hf[f"game_id_{i}"][:] for i in range(number_chunks)])
+	return encodings, game_ids
+
+def _reference(pgn_path, tmp_path):
+	extractor = _extractor(pgn_path, str(tmp_path / "reference.h5"))
+	extractor.extract()
+	return _read(tmp_path / "reference.h5"), extractor
+
+@pytest.mark.parametrize("crash_position", [10, 500, 1234])
+def test_resume_serial(pgn_path, tmp_path, crash_position):
+	(reference_encodings, reference_ids), reference = _reference(pgn_path, tmp_path)
+
+	save_path = str(tmp_path / "resumed.h5")
+	with pytest.raises(Crash):
+		_extractor(pgn_path, save_path, is_process_position=crash_after(crash_position)).extract()
+
+	chunk_counter = 0
+	if os.path.isfile(f"{save_path}.checkpoint.json"):
+		with open(f"{save_path}.checkpoint.json", 'r') as checkpoint_file:
+			chunk_counter = json.load(checkpoint_file)["chunk_counter"]
+	# A chunk that was written after the last checkpoint is rolled back
+	with h5py.File(save_path, 'a') as hf:
+		hf.create_dataset(f"encoding_{chunk_counter}", data=np.zeros((3, 773), dtype=bool))
+
+	resumed = _extractor(pgn_path, save_path)
+	resumed.extract(resume=True)
+	encodings, game_ids = _read(save_path)
+	assert np.array_equal(encodings, reference_encodings)
+	assert np.array_equal(game_ids, reference_ids)
+	assert resumed._game_counter == reference._game_counter
+	assert resumed._processed_games == reference._processed_games
+	assert resumed._discarded_games == reference._discarded_games
+
+def test_resume_parallel_compressed(pgn_path, tmp_path):
+	(reference_encodings, reference_ids), _ = _reference(pgn_path, tmp_path)
+	with open(pgn_path, 'rb') as pgn_file, open(f"{pgn_path}.gz", 'wb') as compressed_file:
+		compressed_file.write(gzip.compress(pgn_file.read()))
+
+	save_path = str(tmp_path / "resumed.h5")
+	with pytest.raises(Crash):
+		_extractor(f"{pgn_path}.gz", save_path, is_process_position=crash_after(700)).extract()
+	_extractor(f"{pgn_path}.gz", save_path, processes=2, games_per_task=3).extract(resume=True)
+
+	encodings, game_ids = _read(save_path)
+	assert np.array_equal(encodings, reference_encodings)
+	assert np.array_equal(game_ids, reference_ids)
+
+def test_resume_after_parallel_crash(pgn_path, tmp_path):
+	(reference_encodings, reference_ids), _ = _reference(pgn_path, tmp_path)
+
+	save_path = str(tmp_path / "resumed.h5")
+	with pytest.raises(Crash):
+		_extractor(pgn_path, save_path, is_process_position=crash_after(300), processes=2, games_per_task=2).extract()
+	_extractor(pgn_path, save_path).extract(resume=True)
+
+	encodings, game_ids = _read(save_path)
+	assert np.array_equal(encodings, reference_encodings)
+	assert np.array_equal(game_ids, reference_ids)
+
+def test_resume_finished_extraction(pgn_path, tmp_path):
+	(reference_encodings, _), _ = _reference(pgn_path, tmp_path)
+	_extractor(pgn_path, str(tmp_path / "reference.h5")).extract(resume=True)
+	encodings, _ = _read(tmp_path / "reference.h5")
+	assert np.array_equal(encodings, reference_encodings)
+
+@pytest.mark.parametrize("options", [{}, {"single_dataset": True, "metadata": True}])
+def test_extract_twice(pgn_path, tmp_path, options):
+	save_path = str(tmp_path / "samples.h5")
+	_extractor(pgn_path, save_path, **options).extract()
+	with h5py.File(save_path, 'r') as hf:
+		extracted = {key: hf[key][:] for key in hf.keys()}
+	# A new extraction does not append a second copy of the positions
+	with pytest.raises(FileExistsError):
+		_extractor(pgn_path, save_path, **options).extract()
+	with h5py.File(save_path, 'r') as hf:
+		assert hf.keys() == extracted.keys()
+		for key in extracted:
+			assert np.array_equal(hf[key][:], extracted[key])
+
+def test_extract_twice_flat_storage(pgn_path, tmp_path):
+	save_path = str(tmp_path / "samples.h5")
+	_extractor(pgn_path, save_path, storage="npy", metadata=True).extract()
+	encodings = np.array(open_flat(flat_path(save_path, "encodings")))
+	with pytest.raises(FileExistsError):
+		_extractor(pgn_path, save_path, storage="npy", metadata=True).extract()
+	assert np.array_equal(open_flat(flat_path(save_path, "encodings")), encodings)
+	assert open_flat(flat_path(save_path, "ply")).shape[0] == encodings.shape[0]
+
+def test_new_extraction_drops_stale_checkpoint(pgn_path, tmp_path):
+	(reference_encodings, reference_ids), _ = _reference(pgn_path, tmp_path)
+	save_path = str(tmp_path / "resumed.h5")
+	with pytest.raises(Crash):
+		_extractor(pgn_path, save_path, is_process_position=crash_after(500)).extract()
+	os.remove(save_path)
+	# The new extraction crashes before its first checkpoint, resuming it starts from the beginning
+	with pytest.raises(Crash):
+		_extractor(pgn_path, save_path, is_process_position=crash_after(10)).extract()
+	assert not os.path.isfile(f"{save_path}.checkpoint.json")
+	_extractor(pgn_path, save_path).extract(resume=True)
+
+	encodings, game_ids = _read(save_path)
+	assert np.array_equal(encodings, reference_encodings)
+	assert np.array_equal(game_ids, reference_ids)
+
+def test_resume_single_dataset(pgn_path, tmp_path):
+	(reference_encodings, reference_ids), _ = _reference(pgn_path, tmp_path)
+
+	save_path = str(tmp_path / "resumed.h5")
+	with pytest.raises(Crash):
+		_extractor(pgn_path, save_path, is_process_position=crash_after(500), single_dataset=True).extract()
+	# Rows appended after the last checkpoint are truncated
+	with h5py.File(save_path, 'a') as hf:
+		hf["encodings"].resize(hf["encodings"].shape[0] + 3, axis=0)
+	_extractor(pgn_path, save_path, single_dataset=True, codec="lzf").extract(resume=True)
+
+	with h5py.File(save_path, 'r') as hf:
+		assert np.array_equal(hf["encodings"][:], reference_encodings)
+		assert np.array_equal(hf["game_id"][:], reference_ids)
+
+def test_resume_flat_storage(pgn_path, tmp_path):
+	(reference_encodings, reference_ids), _ = _reference(pgn_path, tmp_path)
+
+	save_path = str(tmp_path / "resumed.h5")
+	with pytest.raises(Crash):
+		_extractor(pgn_path, save_path, is_process_position=crash_after(500), storage="npy").extract()
+	# Rows appended after the last checkpoint are truncated
+	append_rows(flat_path(save_path, "encodings"), np.zeros((3, 773), dtype=bool))
+	_extractor(pgn_path, save_path, storage="npy").extract(resume=True)
+
+	assert np.array_equal(open_flat(flat_path(save_path, "encodings")), reference_encodings)
+	assert np.array_equal(open_flat(flat_path(save_path, "game_id")), reference_ids)
+
+@pytest.mark.parametrize("crash_position", [200, 900])
+def test_resume_deduplicated(pgn_path, tmp_path, crash_position):
+	reference = _extractor(pgn_path, str(tmp_path / "reference.h5"), deduplicator=PositionDeduplicator())
+	reference.extract()
+	reference_encodings, reference_ids = _read(tmp_path / "reference.h5")
+
+	save_path = str(tmp_path / "resumed.h5")
+	with pytest.raises(Crash):
+		_extractor(
+			pgn_path, save_path, is_process_position=crash_after(crash_position), deduplicator=PositionDeduplicator()
+		).extract()
+	_extractor(pgn_path, save_path, deduplicator=PositionDeduplicator()).extract(resume=True)
+
+	encodings, game_ids = _read(save_path)
+	assert np.array_equal(encodings, reference_encodings)
+	assert np.array_equal(game_ids, reference_ids)
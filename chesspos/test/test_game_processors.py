@@ -0,0 +1,72 @@
+import io
+
+import chess
+import chess.pgn
+import numpy as np
+import pytest
+
+import chesspos.preprocessing.position_filters as pf
+import chesspos.preprocessing.position_processors as pp
+from chesspos.preprocessing.game_processors import GameProcessor
+
+# castling on both sides, en passant and a capturing underpromotion
+SPECIAL_MOVES_PGN = """
+1. e4 d5 2. e5 f5 3. exf6 Nc6 4. fxg7 Be6 5. gxh8=N Qd6 6. Nf3 O-O-O 7. Bc4 Qd7
+8. O-O Kb8 9. Nc3 dxc4 10. d3 cxd3 11. Qxd3 Ka8 *
+"""
+
+ENCODERS = [
+	(pp.board_to_bitboard, pp.update_bitboard),
+	(pp.board_to_tensor, pp.update_tensor)
+]
+
+def _read_games(pgn_path):
+	games = []
+	with open(pgn_path, 'r') as pgn_file:
+		while (game := chess.pgn.read_game(pgn_file)) is not None:
+			games.append(game)
+	return games
+
+@pytest.mark.parametrize("position_processor,position_updater", ENCODERS)
+def test_incremental_matches_full_encoding(pgn_path, position_processor, position_updater):
+	games = _read_games(pgn_path) + [chess.pgn.read_game(io.StringIO(SPECIAL_MOVES_PGN))]
+	full = GameProcessor(is_process_position=pf.no_filter, position_processor=position_processor)
+	incremental = GameProcessor(
+		is_process_position=pf.no_filter,
+		position_processor=position_processor,
+		position_updater=position_updater,
+		validate_updates=True
+	)
+	for game in games:
+		assert np.array_equal(full(game), incremental(game))
+
+@pytest.mark.parametrize("position_processor,position_updater", ENCODERS)
+def test_chess960_castling_update(position_processor, position_updater):
+	board = chess.Board("r3k2r/8/8/8/8/8/8/1R3KR1 w GBha - 0 1", chess960=True)
+	for move in ["f1g1", "e8a8", "b1b8"]:
+		encoding = position_processor(board)
+		board.push_uci(move)
+		position_updater(encoding, board, board.peek())
+		assert np.array_equal(encoding, position_processor(board))
+
+def test_game_processor_filters_positions(pgn_path):
+	game = _read_games(pgn_path)[0]
+	processor = GameProcessor(
+		is_process_position=lambda board: board.ply() % 2 == 0,
+		position_processor=pp.board_to_tensor,
+		position_updater=pp.update_tensor
+	)
+	encodings = processor(game)
+	assert encodings.shape == (len(list(game.mainline_moves())) // 2, 8, 8, 15)
+	assert np.all(encodings[:, 0, 0, 14])
+
+def test_validate_updates_detects_wrong_updater(pgn_path):
+	game = _read_games(pgn_path)[0]
+	processor = GameProcessor(
+		is_process_position=pf.no_filter,
+		position_processor=pp.board_to_bitboard,
+		position_updater=lambda encoding, board, move: None,
+		validate_updates=True
+	)
+	with pytest.raises(ValueError):
+		processor(game)
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["tensorflow", "keras", "matplotlib"]
+
+def _heavy_modules_loaded(module):
+	"""Heavy modules that importing module loads, in a fresh interpreter"""
+	code = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+	result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+	return result.stdout.split()
+
+@pytest.mark.parametrize("module", [
+	"chesspos.preprocessing.pgn_extractor",
+	"chesspos.preprocessing.sample_generator",
+	"chesspos.preprocessing.triplet_sampler"
+])
+def test_preprocessing_imports_without_tensorflow(module):
+	# Extraction workers never use tensorflow, it costs seconds and hundreds of MB per process
+	assert _heavy_modules_loaded(module) == []
+
+def test_tflite_encoder_imports_without_tensorflow():
+	# Exported encoders are served with a TFLite runtime alone
+	assert _heavy_modules_loaded("chesspos.serving.tflite_encoder") == []
@@ -0,0 +1,63 @@
+import os
+
+import h5py
+import numpy as np
+
+import chesspos.preprocessing.game_filters as gf
+import chesspos.preprocessing.game_processors as gp
+import chesspos.preprocessing.position_filters as pf
+import chesspos.preprocessing.position_processors as pp
+import chesspos.preprocessing.sample_generator as sg
+from chesspos.preprocessing.manifest import manifest_path, read_manifest, verify_manifest
+from chesspos.preprocessing.pgn_extractor import PgnExtractor
+
+def _extract(pgn_path, save_path, resume=False):
+	PgnExtractor(
+		pgn_path=pgn_path,
+		save_path=save_path,
+		is_process_game=gf.no_filter,
+		game_processor=gp.GameProcessor(is_process_position=pf.no_filter, position_processor=pp.board_to_bitboard),
+		chunk_size=500,
+		pack_bits=True
+	).extract(resume=resume)
+
+def test_extractor_writes_manifest(pgn_path, tmp_path):
+	save_path = str(tmp_path / "samples.h5")
+	_extract(pgn_path, save_path)
+	manifest = read_manifest(save_path)
+	assert manifest is not None and verify_manifest(save_path)
+	with h5py.File(save_path, 'r') as hf:
+		assert set(manifest["datasets"]) == set(hf.keys())
+		for key, description in manifest["datasets"].items():
+			assert description["length"] == hf[key].shape[0]
+	assert manifest["datasets"]["encoding_0"]["codec"] == "packbits"
+	assert manifest["datasets"]["encoding_0"]["encoding_shape"] == [773]
+
+def test_resume_finished_extraction_writes_manifest(pgn_path, tmp_path):
+	save_path = str(tmp_path / "samples.h5")
+	_extract(pgn_path, save_path)
+	# As if the extraction stopped after its last checkpoint, before the manifest
+	os.remove(manifest_path(save_path))
+	_extract(pgn_path, save_path, resume=True)
+	assert read_manifest(save_path) is not None and verify_manifest(save_path)
+
+def test_sample_generator_trusts_manifest(pgn_path, tmp_path, monkeypatch):
+	_extract(pgn_path, str(tmp_path / "samples.h5"))
+	scanned = sg.SampleGenerator(str(tmp_path), lambda x: (x, x), batch_size=16)
+
+	def no_file_access(*args, **kwargs):
+		raise AssertionError("h5 file opened despite an up to date manifest")
+	with monkeypatch.context() as m:
+		m.setattr(sg.h5py, "File", no_file_access)
+		generator = sg.SampleGenerator(str(tmp_path), lambda x: (x, x), batch_size=16)
+		generator.get_tf_dataset()
+	assert generator.number_samples == scanned.number_samples
+	assert generator.sample_shape == (773,)
+
+	# A changed file is scanned again
+	with h5py.File(tmp_path / "samples.h5", 'a') as hf:
+		hf.create_dataset("encoding_99", data=np.zeros((10, 773), dtype=bool))
+	assert read_manifest(str(tmp_path / "samples.h5")) is None
+	assert not verify_manifest(str(tmp_path / "samples.h5"))
+	generator = sg.SampleGenerator(str(tmp_path), lambda x: (x, x), batch_size=16)
+	assert generator.number_samples == scanned.number_samples + 10
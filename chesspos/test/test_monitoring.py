@@ -0,0 +1,40 @@
+import csv
+import json
+import time
+
+import h5py
+import numpy as np
+import pytest
+from tensorflow import keras
+
+from chesspos.evaluation.monitoring import StepTimeMonitor
+from chesspos.preprocessing.sample_generator import SampleGenerator
+
+BATCH_SIZE = 8
+
+@pytest.mark.parametrize("delay,verdict", [(0.02, "input bound"), (0.0, "compute bound")])
+def test_step_time_monitor(tmp_path, delay, verdict):
+	(tmp_path / "samples").mkdir()
+	with h5py.File(tmp_path / "samples" / "samples.h5", 'w') as hf:
+		hf.create_dataset("encodings", data=np.zeros((20 * BATCH_SIZE, 4), dtype=bool))
+
+	def slow_preprocessor(batch):
+		time.sleep(delay)
+		return batch, batch
+	generator = SampleGenerator(str(tmp_path / "samples"), slow_preprocessor, batch_size=BATCH_SIZE, prefetch_blocks=0)
+
+	model = keras.Sequential([keras.layers.Input((4,)), keras.layers.Dense(4)])
+	model.compile(optimizer="sgd", loss="mse")
+	monitor = StepTimeMonitor(str(tmp_path), BATCH_SIZE, input_generator=generator, input_bound_fraction=0.5)
+	model.fit(generator.get_tf_dataset().repeat(), steps_per_epoch=10, epochs=2, callbacks=[monitor], verbose=0)
+
+	with open(tmp_path / "step_times.csv", 'r') as step_file:
+		steps = list(csv.DictReader(step_file))
+	assert len(steps) == 20
+	assert all(float(step["input_seconds"]) <= float(step["step_seconds"]) for step in steps)
+	with open(tmp_path / "epoch_times.json", 'r') as epoch_file:
+		epochs = json.load(epoch_file)
+	assert [epoch["steps"] for epoch in epochs] == [10, 10]
+	# The first epoch includes tracing the train function
+	assert epochs[1]["verdict"] == verdict
+	assert epochs[1]["peak_rss_mb"] > 0 and epochs[1]["samples_per_second"] > 0
@@ -0,0 +1,64 @@
+import h5py
+import numpy as np
+
+import chesspos.preprocessing.game_filters as gf
+import chesspos.preprocessing.game_processors as gp
+import chesspos.preprocessing.position_filters as pf
+import chesspos.preprocessing.position_processors as pp
+from chesspos.preprocessing.packing import pack_encodings, unpack_encodings, read_encodings, is_packed
+from chesspos.preprocessing.pgn_extractor import PgnExtractor
+from chesspos.preprocessing.sample_generator import SampleGenerator
+
+def _extract(pgn_path, save_dir, pack_bits):
+	save_dir.mkdir()
+	game_processor = gp.GameProcessor(
+		is_process_position=pf.no_filter,
+		position_processor=pp.board_to_tensor
+	)
+	extractor = PgnExtractor(
+		pgn_path=pgn_path,
+		save_path=str(save_dir / "samples.h5"),
+		is_process_game=gf.no_filter,
+		game_processor=game_processor,
+		chunk_size=500,
+		pack_bits=pack_bits
+	)
+	extractor.extract()
+
+def test_pack_unpack_roundtrip(random_boards):
+	tensors = pp.boards_to_tensors(random_boards)
+	packed = pack_encodings(tensors)
+	assert packed.dtype == np.uint8
+	assert packed.shape == (len(random_boards), 960 // 8)
+	assert np.array_equal(unpack_encodings(packed, (8, 8, 15)), tensors)
+
+	bitboards = pp.boards_to_bitboards(random_boards)
+	packed = pack_encodings(bitboards)
+	assert packed.shape == (len(random_boards), 97)
+	assert np.array_equal(unpack_encodings(packed, (773,)), bitboards)
+
+def test_extract_packed(pgn_path, tmp_path):
+	_extract(pgn_path, tmp_path / "plain", pack_bits=False)
+	_extract(pgn_path, tmp_path / "packed", pack_bits=True)
+
+	with h5py.File(tmp_path / "plain" / "samples.h5", 'r') as plain, h5py.File(tmp_path / "packed" / "samples.h5", 'r') as packed:
+		assert plain.keys() == packed.keys()
+		assert is_packed(packed["encoding_0"]) and not is_packed(plain["encoding_0"])
+		assert packed["encoding_0"].shape[1] == 120
+		for key in plain.keys():
+			assert np.array_equal(read_encodings(plain[key]), read_encodings(packed[key]))
+
+def test_sample_generator_reads_packed(pgn_path, tmp_path):
+	_extract(pgn_path, tmp_path / "plain", pack_bits=False)
+	_extract(pgn_path, tmp_path / "packed", pack_bits=True)
+
+	plain = SampleGenerator(str(tmp_path / "plain"), lambda x: x, batch_size=64)
+	packed = SampleGenerator(str(tmp_path / "packed"), lambda x: x, batch_size=64)
+	assert plain.sample_shape == packed.sample_shape == (8, 8, 15)
+	assert plain.number_samples == packed.number_samples
+	plain_batches = list(plain.get_generator())
+	packed_batches = list(packed.get_generator())
+	assert len(plain_batches) == len(packed_batches) > 0
+	for plain_batch, packed_batch in zip(plain_batches, packed_batches):
+		assert plain_batch.dtype == packed_batch.dtype == np.float32
+		assert np.array_equal(plain_batch, packed_batch)
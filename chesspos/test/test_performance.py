@@ -0,0 +1,55 @@
+import h5py
+import numpy as np
+import pytest
+import tensorflow as tf
+from tensorflow import keras
+
+from chesspos.models import DenseAutoencoder
+from chesspos.models.performance import PROFILES, PerformanceProfile, get_profile
+from chesspos.preprocessing.sample_generator import SampleGenerator
+
+def test_get_profile():
+	assert get_profile(None) is PROFILES["default"]
+	assert get_profile("xla") is PROFILES["xla"]
+	profile = PerformanceProfile("custom", steps_per_execution=4)
+	assert get_profile(profile) is profile
+	with pytest.raises(ValueError):
+		get_profile("unknown")
+
+def test_policy_is_restored():
+	assert keras.mixed_precision.global_policy().name == "float32"
+	with PerformanceProfile(precision="mixed_bfloat16").policy():
+		assert keras.mixed_precision.global_policy().name == "mixed_bfloat16"
+	assert keras.mixed_precision.global_policy().name == "float32"
+
+	with pytest.raises(RuntimeError):
+		with PerformanceProfile(precision="mixed_float16").policy():
+			raise RuntimeError()
+	assert keras.mixed_precision.global_policy().name == "float32"
+
+def test_profile_reaches_compiled_models(tmp_path, monkeypatch):
+	compile_options = {}
+	compile = keras.Model.compile
+	def recording_compile(model, *args, **kwargs):
+		compile_options[model.name] = kwargs
+		return compile(model, *args, **kwargs)
+	monkeypatch.setattr(keras.Model, "compile", recording_compile)
+
+	(tmp_path / "samples").mkdir()
+	with h5py.File(tmp_path / "samples" / "samples.h5", 'w') as hf:
+		hf.create_dataset("encodings", data=np.random.default_rng(0).random((32, 8, 8, 15, 1)) < 0.1)
+	sample_dir = str(tmp_path / "samples")
+	generator = lambda: SampleGenerator(sample_dir, lambda x: (x, x), batch_size=4)
+	profile = PerformanceProfile("test", precision="mixed_bfloat16", jit_compile=True, steps_per_execution=3)
+	model = DenseAutoencoder(
+		save_dir=str(tmp_path), train_generator=generator(), test_generator=generator(),
+		train_steps_per_epoch=1, test_steps_per_epoch=1, loss="binary_crossentropy", performance_profile=profile
+	)
+	assert keras.mixed_precision.global_policy().name == "float32"
+	assert set(compile_options) == {"autoencoder", "encoder", "decoder"}
+	for options in compile_options.values():
+		assert options["steps_per_execution"] == 3
+		assert options["jit_compile"] is True
+	assert model.encoder.layers[-1].dtype_policy.name == "mixed_bfloat16"
+	for output in [model.model.outputs[0], model.decoder.outputs[0]]:
+		assert tf.as_dtype(output.dtype) == tf.float32
@@ -0,0 +1,185 @@
+import io
+import os
+
+import h5py
+import numpy as np
+import pytest
+import chess.pgn
+
+import chesspos.preprocessing.game_filters as gf
+import chesspos.preprocessing.game_processors as gp
+import chesspos.preprocessing.position_filters as pf
+import chesspos.preprocessing.position_processors as pp
+from chesspos.preprocessing.flat_storage import describe_flat, flat_path, open_flat
+from chesspos.preprocessing.metadata import BLITZ, RESULT_CODES, read_metadata, time_control_bucket
+from chesspos.preprocessing.packing import read_encodings, unpack_encodings
+from chesspos.preprocessing.pgn_extractor import PgnExtractor, compression_options
+from chesspos.preprocessing.pgn_scanner import game_offsets, iter_games, read_headers
+
+def _extract(pgn_path, save_path, number_games=int(1e18), is_process_game=gf.no_filter, **kwargs):
+	game_processor = gp.GameProcessor(
+		is_process_position=pf.no_filter,
+		position_processor=pp.board_to_bitboard
+	)
+	extractor = PgnExtractor(
+		pgn_path=pgn_path,
+		save_path=save_path,
+		is_process_game=is_process_game,
+		game_processor=game_processor,
+		chunk_size=500,
+		**kwargs
+	)
+	extractor.extract(number_games)
+	return extractor
+
+def _read(save_path):
+	with h5py.File(save_path, 'r') as hf:
+		return {key: hf[key][:] for key in hf.keys()}
+
+def test_game_offsets(pgn_path):
+	offsets = game_offsets(pgn_path)
+	with open(pgn_path, 'r') as pgn_file:
+		for offset in offsets:
+			pgn_file.seek(offset)
+			assert pgn_file.readline().startswith("[Event")
+	assert np.all(game_offsets(pgn_path, block_size=5) == offsets)
+
+def test_iter_games(pgn_path):
+	offsets = game_offsets(pgn_path)
+	for block_size in [7, 2**20]:
+		with open(pgn_path, 'rb') as pgn_file:
+			games = list(iter_games(pgn_file, block_size=block_size))
+		assert [offset for offset, _ in games] == list(offsets)
+
+	with open(pgn_path, 'r') as pgn_file:
+		for _, raw_game in games:
+			game = chess.pgn.read_game(pgn_file)
+			assert str(chess.pgn.read_game(io.StringIO(raw_game.decode()))) == str(game)
+
+def test_read_headers(pgn_path):
+	with open(pgn_path, 'rb') as pgn_file:
+		raw_games = [raw_game for _, raw_game in iter_games(pgn_file)]
+	with open(pgn_path, 'r') as pgn_file:
+		for raw_game in raw_games:
+			assert read_headers(raw_game) == chess.pgn.read_headers(pgn_file)
+
+	crlf_game = b'[Event "Rated \xc3\xa9v\xc3\xa9nement"]\r\n[WhiteElo "1500"]\r\n\r\n1. e4 e5 *\r\n'
+	assert dict(read_headers(crlf_game)) == {"Event": "Rated \u00e9v\u00e9nement", "WhiteElo": "1500"}
+
+def test_filtered_extraction(pgn_path, tmp_path):
+	elo_filter = gf.elo_filter((1200, 2400), (1000, 2600))
+	_extract(pgn_path, str(tmp_path / "filtered.h5"), is_process_game=elo_filter)
+	data = _read(tmp_path / "filtered.h5")
+
+	expected_ids = []
+	with open(pgn_path, 'r') as pgn_file:
+		game_id = 0
+		while (header := chess.pgn.read_headers(pgn_file)) is not None:
+			game_id += 1
+			if 1200 < int(header["WhiteElo"]) < 2400 and 1000 < int(header["BlackElo"]) < 2600:
+				expected_ids.append(game_id)
+	game_ids = np.concatenate([data[key] for key in data if "game_id" in key])
+	assert 0 < len(expected_ids) < game_id
+	assert list(np.unique(game_ids)) == expected_ids
+
+def test_game_ids(pgn_path, tmp_path):
+	_extract(pgn_path, str(tmp_path / "serial.h5"))
+	data = _read(tmp_path / "serial.h5")
+
+	with open(pgn_path, 'r') as pgn_file:
+		game = chess.pgn.read_game(pgn_file)
+	first_game_encodings = data["encoding_0"][data["game_id_0"] == 1]
+	assert first_game_encodings.shape[0] == len(list(game.mainline_moves()))
+	assert np.all(first_game_encodings[-1] == pp.board_to_bitboard(game.end().board()))
+
+def test_parallel_extraction_matches_serial(pgn_path, tmp_path):
+	serial = _extract(pgn_path, str(tmp_path / "serial.h5"))
+	parallel = _extract(pgn_path, str(tmp_path / "parallel.h5"), processes=2, games_per_task=3)
+
+	serial_data = _read(tmp_path / "serial.h5")
+	parallel_data = _read(tmp_path / "parallel.h5")
+	assert serial_data.keys() == parallel_data.keys()
+	for key in serial_data:
+		assert np.all(serial_data[key] == parallel_data[key])
+	assert serial._game_counter == parallel._game_counter
+
+def test_parallel_number_games(pgn_path, tmp_path):
+	_extract(pgn_path, str(tmp_path / "serial.h5"), number_games=7)
+	_extract(pgn_path, str(tmp_path / "parallel.h5"), number_games=7, processes=2, games_per_task=2)
+
+	serial_data = _read(tmp_path / "serial.h5")
+	parallel_data = _read(tmp_path / "parallel.h5")
+	game_ids = np.concatenate([parallel_data[key] for key in parallel_data if "game_id" in key])
+	assert np.all(np.unique(game_ids) == np.arange(1, 8))
+	for key in serial_data:
+		assert np.all(serial_data[key] == parallel_data[key])
+
+@pytest.mark.parametrize("codec,pack_bits", [("none", False), ("lzf", True), ("shuffle+gzip:1", False)])
+def test_single_dataset_matches_chunks(pgn_path, tmp_path, codec, pack_bits):
+	_extract(pgn_path, str(tmp_path / "chunks.h5"))
+	_extract(pgn_path, str(tmp_path / "single.h5"), single_dataset=True, codec=codec, pack_bits=pack_bits)
+
+	chunks = _read(tmp_path / "chunks.h5")
+	number_chunks = len(chunks) // 2
+	with h5py.File(tmp_path / "single.h5", 'r') as hf:
+		assert set(hf.keys()) == {"encodings", "game_id"}
+		assert hf["encodings"].maxshape[0] is None
+		encodings = read_encodings(hf["encodings"])
+		game_ids = hf["game_id"][:]
+	assert np.array_equal(encodings, np.concatenate([chunks[f"encoding_{i}"] for i in range(number_chunks)]))
+	assert np.array_equal(game_ids, np.concatenate([chunks[f"game_id_{i}"] for i in range(number_chunks)]))
+
+@pytest.mark.parametrize("pack_bits", [False, True])
+def test_flat_storage_matches_h5(pgn_path, tmp_path, pack_bits):
+	_extract(pgn_path, str(tmp_path / "single.h5"), single_dataset=True, metadata=True)
+	_extract(pgn_path, str(tmp_path / "flat.h5"), storage="npy", metadata=True, pack_bits=pack_bits, processes=2, games_per_task=3)
+	assert not os.path.isfile(tmp_path / "flat.h5")
+
+	path = flat_path(str(tmp_path / "flat.h5"), "encodings")
+	assert path == str(tmp_path / "flat.encodings.npy")
+	description = describe_flat(path)
+	assert description["encoding_shape"] == [773]
+	assert description["codec"] == ("packbits" if pack_bits else None)
+	encodings = open_flat(path)
+	if pack_bits:
+		encodings = unpack_encodings(encodings, (773,))
+	with h5py.File(tmp_path / "single.h5", 'r') as hf:
+		assert np.array_equal(encodings, hf["encodings"][:])
+
+	metadata = read_metadata(str(tmp_path / "single.h5"))
+	flat_metadata = read_metadata(str(tmp_path / "flat.h5"))
+	for key in metadata:
+		assert np.array_equal(metadata[key], flat_metadata[key])
+
+def test_compression_options():
+	assert compression_options("none") == {}
+	assert compression_options("gzip:1") == {"compression": "gzip", "compression_opts": 1}
+	assert compression_options("shuffle+gzip") == {"compression": "gzip", "compression_opts": 4, "shuffle": True}
+	for codec in ["zstd", "gzip:10"]:
+		with pytest.raises(ValueError):
+			compression_options(codec)
+
+@pytest.mark.parametrize("single_dataset", [False, True])
+def test_metadata_columns(pgn_path, tmp_path, single_dataset):
+	_extract(pgn_path, str(tmp_path / "serial.h5"), metadata=True, single_dataset=single_dataset)
+	_extract(pgn_path, str(tmp_path / "parallel.h5"), metadata=True, single_dataset=single_dataset, processes=2, games_per_task=3)
+	metadata = read_metadata(str(tmp_path / "serial.h5"))
+	parallel_metadata = read_metadata(str(tmp_path / "parallel.h5"))
+	for key in metadata:
+		assert np.array_equal(metadata[key], parallel_metadata[key])
+
+	offsets = game_offsets(pgn_path)
+	with open(pgn_path, 'r') as pgn_file:
+		for game_id, offset in enumerate(offsets, start=1):
+			game = chess.pgn.read_game(pgn_file)
+			rows = metadata["game_id"] == game_id
+			assert np.array_equal(metadata["ply"][rows], np.arange(1, len(list(game.mainline_moves())) + 1))
+			assert np.all(metadata["white_elo"][rows] == int(game.headers["WhiteElo"]))
+			assert np.all(metadata["black_elo"][rows] == int(game.headers["BlackElo"]))
+			assert np.all(metadata["result"][rows] == RESULT_CODES[game.headers["Result"]])
+			assert np.all(metadata["time_control"][rows] == time_control_bucket(game.headers["TimeControl"]))
+			assert np.all(metadata["game_offset"][rows] == offset)
+
+def test_time_control_bucket():
+	assert time_control_bucket("300+3") == BLITZ
+	assert [time_control_bucket(tc) for tc in ["15+0", "60+1", "900+10", "5400+30", "-", "?"]] == [1, 2, 4, 5, 6, 0]
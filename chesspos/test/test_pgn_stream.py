@@ -0,0 +1,85 @@
+import bz2
+import gzip
+import io
+import lzma
+
+import h5py
+import numpy as np
+import pytest
+
+import chesspos.preprocessing.game_filters as gf
+import chesspos.preprocessing.game_processors as gp
+import chesspos.preprocessing.position_filters as pf
+import chesspos.preprocessing.position_processors as pp
+from chesspos.preprocessing.pgn_extractor import PgnExtractor
+from chesspos.preprocessing.pgn_stream import BackgroundReader, open_pgn
+
+COMPRESSORS = {"gz": gzip.compress, "bz2": bz2.compress, "xz": lzma.compress}
+
+def _compress(pgn_path, ending):
+	with open(pgn_path, 'rb') as pgn_file:
+		data = pgn_file.read()
+	compressed_path = f"{pgn_path}.{ending}"
+	with open(compressed_path, 'wb') as compressed_file:
+		compressed_file.write(COMPRESSORS[ending](data))
+	return compressed_path
+
+def _extract(pgn_path, save_path, **kwargs):
+	game_processor = gp.GameProcessor(
+		is_process_position=pf.no_filter,
+		position_processor=pp.board_to_bitboard
+	)
+	extractor = PgnExtractor(
+		pgn_path=pgn_path,
+		save_path=save_path,
+		is_process_game=gf.no_filter,
+		game_processor=game_processor,
+		chunk_size=500,
+		**kwargs
+	)
+	extractor.extract()
+	with h5py.File(save_path, 'r') as hf:
+		return {key: hf[key][:] for key in hf.keys()}
+
+def test_background_reader():
+	data = bytes(range(256)) * 1000
+	with BackgroundReader(io.BytesIO(data), block_size=1000, max_blocks=2) as reader:
+		chunks = []
+		while chunk := reader.read(777):
+			chunks.append(chunk)
+			assert reader.tell() == sum(len(c) for c in chunks)
+	assert b"".join(chunks) == data
+	assert reader.closed
+
+def test_background_reader_close_early():
+	reader = BackgroundReader(io.BytesIO(b"x" * 10**6), block_size=10, max_blocks=2)
+	assert reader.read(5) == b"xxxxx"
+	reader.close()
+	assert reader.closed
+
+@pytest.mark.parametrize("ending", COMPRESSORS.keys())
+def test_open_compressed_pgn(pgn_path, ending):
+	with open(pgn_path, 'rb') as pgn_file, open_pgn(_compress(pgn_path, ending), block_size=100) as compressed_file:
+		assert compressed_file.read() == pgn_file.read()
+
+@pytest.mark.parametrize("ending", COMPRESSORS.keys())
+def test_extract_compressed_pgn(pgn_path, tmp_path, ending):
+	compressed_path = _compress(pgn_path, ending)
+	plain = _extract(pgn_path, str(tmp_path / "plain.h5"))
+	serial = _extract(compressed_path, str(tmp_path / "serial.h5"))
+	parallel = _extract(compressed_path, str(tmp_path / "parallel.h5"), processes=2, games_per_task=3)
+	assert plain.keys() == serial.keys() == parallel.keys()
+	for key in plain:
+		assert np.array_equal(plain[key], serial[key])
+		assert np.array_equal(plain[key], parallel[key])
+
+def test_extract_zstd_pgn(pgn_path, tmp_path):
+	zstandard = pytest.importorskip("zstandard")
+	with open(pgn_path, 'rb') as pgn_file:
+		data = pgn_file.read()
+	with open(f"{pgn_path}.zst", 'wb') as compressed_file:
+		compressed_file.write(zstandard.ZstdCompressor().compress(data))
+	plain = _extract(pgn_path, str(tmp_path / "plain.h5"))
+	compressed = _extract(f"{pgn_path}.zst", str(tmp_path / "zstd.h5"))
+	for key in plain:
+		assert np.array_equal(plain[key], compressed[key])
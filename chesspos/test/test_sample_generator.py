@@ -0,0 +1,191 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import chesspos.preprocessing.game_filters as gf
+import chesspos.preprocessing.game_processors as gp
+import chesspos.preprocessing.position_filters as pf
+import chesspos.preprocessing.position_processors as pp
+from chesspos.preprocessing.pgn_extractor import PgnExtractor
+from chesspos.preprocessing.sample_generator import SampleGenerator
+
+BATCH_SIZE = 32
+
+def _extract_samples(pgn_path, sample_dir, pack_bits=False):
+	"""Two files of extracted bitboards, one with many chunk datasets and one with a single dataset"""
+	sample_dir.mkdir()
+	for name, single_dataset in [("chunks", False), ("single", True)]:
+		extractor = PgnExtractor(
+			pgn_path=pgn_path,
+			save_path=str(sample_dir / f"{name}.h5"),
+			is_process_game=gf.no_filter,
+			game_processor=gp.GameProcessor(is_process_position=pf.no_filter, position_processor=pp.board_to_bitboard),
+			chunk_size=300,
+			single_dataset=single_dataset,
+			pack_bits=pack_bits
+		)
+		extractor.extract()
+	return str(sample_dir)
+
+@pytest.fixture
+def sample_dir(pgn_path, tmp_path):
+	return _extract_samples(pgn_path, tmp_path / "samples")
+
+def _rows(batches):
+	return Counter(row.tobytes() for row in np.packbits(np.concatenate(batches).astype(bool), axis=1))
+
+def _shuffled(sample_dir, seed):
+	return SampleGenerator(
+		sample_dir, lambda x: x, batch_size=BATCH_SIZE, shuffle=True, seed=seed,
+		shuffle_block_size=50, shuffle_buffer_blocks=4
+	)
+
+def test_shuffled_epoch_covers_samples(sample_dir):
+	sequential = list(SampleGenerator(sample_dir, lambda x: x, batch_size=1).get_generator())
+	generator = _shuffled(sample_dir, seed=0)
+	batches = list(generator.get_generator())
+	assert all(batch.shape == (BATCH_SIZE, 773) for batch in batches)
+	assert len(batches) == generator.number_samples // BATCH_SIZE
+
+	# Only the last incomplete batch is dropped
+	shuffled_rows = _rows(batches)
+	all_rows = _rows(sequential)
+	assert len(shuffled_rows - all_rows) == 0
+	assert sum((all_rows - shuffled_rows).values()) < BATCH_SIZE
+
+def test_shuffle_is_seeded_per_epoch(sample_dir):
+	first, second = _shuffled(sample_dir, seed=1), _shuffled(sample_dir, seed=1)
+	first_epoch = np.concatenate(list(first.get_generator()))
+	assert np.array_equal(first_epoch, np.concatenate(list(second.get_generator())))
+	assert not np.array_equal(first_epoch, np.concatenate(list(first.get_generator())))
+
+	sequential = np.concatenate(list(SampleGenerator(sample_dir, lambda x: x, batch_size=BATCH_SIZE).get_generator()))
+	assert not np.array_equal(first_epoch[:BATCH_SIZE], sequential[:BATCH_SIZE])
+
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_prefetched_batches_match(sample_dir, shuffle):
+	batches = {}
+	for prefetch_blocks in [0, 3]:
+		generator = SampleGenerator(
+			sample_dir, lambda x: x, batch_size=BATCH_SIZE, read_batches=5, shuffle=shuffle, seed=2,
+			shuffle_block_size=50, shuffle_buffer_blocks=4, prefetch_blocks=prefetch_blocks
+		)
+		batches[prefetch_blocks] = list(generator.get_generator())
+	assert len(batches[0]) == len(batches[3]) > 0
+	for batch, prefetched_batch in zip(batches[0], batches[3]):
+		assert np.array_equal(batch, prefetched_batch)
+		# Batches are views into the decoded blocks
+		assert prefetched_batch.base is not None
+
+@pytest.mark.parametrize("pack_bits", [False, True])
+def test_native_pipeline_matches_generator(pgn_path, tmp_path, pack_bits):
+	sample_dir = _extract_samples(pgn_path, tmp_path / "samples", pack_bits=pack_bits)
+	generator = SampleGenerator(sample_dir, lambda x: x, batch_size=BATCH_SIZE, read_batches=3)
+	native = SampleGenerator(sample_dir, lambda x: (x, x), batch_size=BATCH_SIZE, read_batches=3, native=True)
+
+	native_batches = [inputs.numpy() for inputs, _ in native.get_tf_dataset()]
+	assert all(batch.dtype == np.float32 and batch.shape == (BATCH_SIZE, 773) for batch in native_batches)
+	# Reads of several datasets are interleaved, the batches are the same
+	key = lambda batch: batch.tobytes()
+	assert sorted(map(key, native_batches)) == sorted(map(key, generator.get_generator()))
+
+def test_native_pipeline_shuffles(sample_dir):
+	native = SampleGenerator(
+		sample_dir, lambda x: x, batch_size=BATCH_SIZE, native=True, shuffle=True, seed=3,
+		shuffle_block_size=50, shuffle_buffer_blocks=4
+	)
+	dataset = native.get_tf_dataset()
+	first_epoch = [batch.numpy() for batch in dataset]
+	second_epoch = [batch.numpy() for batch in dataset]
+	assert len(first_epoch) == len(second_epoch) == native.number_samples // BATCH_SIZE
+	all_rows = _rows(list(SampleGenerator(sample_dir, lambda x: x, batch_size=1).get_generator()))
+	for epoch in [first_epoch, second_epoch]:
+		assert len(_rows(epoch) - all_rows) == 0
+	assert not np.array_equal(first_epoch[0], second_epoch[0])
+
+@pytest.mark.parametrize("pack_bits", [False, True])
+def test_flat_files_match_h5(pgn_path, tmp_path, pack_bits):
+	sample_dir = _extract_samples(pgn_path, tmp_path / "samples")
+	flat_dir = tmp_path / "flat"
+	flat_dir.mkdir()
+	PgnExtractor(
+		pgn_path=pgn_path,
+		save_path=str(flat_dir / "flat.h5"),
+		is_process_game=gf.no_filter,
+		game_processor=gp.GameProcessor(is_process_position=pf.no_filter, position_processor=pp.board_to_bitboard),
+		chunk_size=300,
+		pack_bits=pack_bits,
+		storage="npy"
+	).extract()
+	# The file of encodings is indexed, not the files of the other columns
+	single = SampleGenerator(str(tmp_path / "samples"), lambda x: x, batch_size=BATCH_SIZE)
+	flat = SampleGenerator(str(flat_dir), lambda x: x, batch_size=BATCH_SIZE)
+	assert flat._datasets == [(str(flat_dir / "flat.encodings.npy"), "encodings")]
+	assert flat.sample_shape == (773,) and 2 * flat.number_samples == single.number_samples
+
+	batches = list(flat.get_generator())
+	assert len(batches) == flat.number_samples // BATCH_SIZE
+	all_rows = _rows(list(SampleGenerator(str(flat_dir), lambda x: x, batch_size=1).get_generator()))
+	# The h5 sample directory holds every row twice
+	assert all_rows + all_rows == _rows(list(SampleGenerator(str(tmp_path / "samples"), lambda x: x, batch_size=1).get_generator()))
+	assert len(_rows(list(_shuffled(str(flat_dir), seed=0).get_generator())) - all_rows) == 0
+	native = SampleGenerator(str(flat_dir), lambda x: x, batch_size=BATCH_SIZE, native=True)
+	native_batches = [batch.numpy() for batch in native.get_tf_dataset()]
+	assert len(native_batches) == len(batches)
+	assert all(np.array_equal(batch, native_batch) for batch, native_batch in zip(batches, native_batches))
+
+@pytest.mark.parametrize("pack_bits", [False, True])
+@pytest.mark.parametrize("mode", [{"read_batches": 3}, {"shuffle": True, "seed": 2, "shuffle_block_size": 50, "shuffle_buffer_blocks": 4}])
+def test_native_pipeline_reads_flat_files_with_tf_ops(pgn_path, tmp_path, monkeypatch, pack_bits, mode):
+	for name, chunk_size, number_games in [("first", 300, int(1e18)), ("second", 170, 40)]:
+		PgnExtractor(
+			pgn_path=pgn_path,
+			save_path=str(tmp_path / f"{name}.h5"),
+			is_process_game=gf.no_filter,
+			game_processor=gp.GameProcessor(is_process_position=pf.no_filter, position_processor=pp.board_to_bitboard),
+			chunk_size=chunk_size,
+			pack_bits=pack_bits,
+			storage="npy"
+		).extract(number_games)
+	native = SampleGenerator(str(tmp_path), lambda x: x, batch_size=BATCH_SIZE, native=True, **mode)
+	# Only h5 datasets are read through tf.numpy_function
+	def no_numpy_reads(*args):
+		raise AssertionError("flat file read through tf.numpy_function")
+	monkeypatch.setattr(native, "_read_block", no_numpy_reads)
+
+	native_batches = [batch.numpy() for batch in native.get_tf_dataset()]
+	batches = list(SampleGenerator(str(tmp_path), lambda x: x, batch_size=BATCH_SIZE, **mode).get_generator())
+	assert len(native_batches) == len(batches) > 0
+	if mode.get("shuffle"):
+		all_rows = _rows(list(SampleGenerator(str(tmp_path), lambda x: x, batch_size=1).get_generator()))
+		assert len(_rows(native_batches) - all_rows) == 0
+	else:
+		key = lambda batch: batch.tobytes()
+		assert sorted(map(key, native_batches)) == sorted(map(key, batches))
+		native.set_position(7)
+		assert all(np.array_equal(batch, native_batch.numpy()) for batch, native_batch in zip(native_batches[7:], native.get_tf_dataset()))
+
+@pytest.mark.parametrize("mode", [{}, {"shuffle": True, "seed": 4}, {"native": True}])
+def test_set_position_skips_batches(sample_dir, mode):
+	def generator():
+		return SampleGenerator(
+			sample_dir, lambda x: x, batch_size=BATCH_SIZE, read_batches=3,
+			shuffle_block_size=50, shuffle_buffer_blocks=4, **mode
+		)
+	def batches(generator):
+		if mode.get("native"):
+			return [batch.numpy() for batch in generator.get_tf_dataset()]
+		return list(generator.get_generator())
+
+	reference = generator()
+	epochs = [batches(reference) for _ in range(2)]
+	assert len(epochs[0]) == reference.batches_per_epoch()
+	for position in [0, 7, len(epochs[0]) + 20]:
+		resumed = generator()
+		cursor = resumed.set_position(position)
+		epoch, batch = divmod(position, len(epochs[0]))
+		assert (cursor["epoch"], cursor["batch"]) == (epoch, batch)
+		remaining = batches(resumed)
+		assert len(remaining) == len(epochs[epoch]) - batch
+		assert all(np.array_equal(a, b) for a, b in zip(remaining, epochs[epoch][batch:]))
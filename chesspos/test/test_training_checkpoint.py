@@ -0,0 +1,79 @@
+import json
+
+import h5py
+import numpy as np
+import pytest
+from tensorflow import keras
+
+from chesspos.models.training_checkpoint import STATE_FILE, TrainingCheckpoint, fit_resumable
+from chesspos.preprocessing.sample_generator import SampleGenerator
+
+STEPS_PER_EPOCH = 6
+EPOCHS = 3
+
+class Preemption(Exception):
+	pass
+
+class PreemptAt(keras.callbacks.Callback):
+	def __init__(self, epoch, step):
+		super(PreemptAt, self).__init__()
+		self.epoch, self.step = epoch, step
+
+	def on_epoch_begin(self, epoch, logs=None):
+		self._epoch = epoch
+
+	def on_train_batch_end(self, batch, logs=None):
+		if (self._epoch, batch + 1) == (self.epoch, self.step):
+			raise Preemption()
+
+def _generator(sample_dir):
+	return SampleGenerator(sample_dir, lambda x: (x, x), batch_size=8, shuffle=True, seed=5, shuffle_block_size=16)
+
+def _model():
+	keras.utils.set_random_seed(0)
+	model = keras.Sequential([keras.layers.Input((6,)), keras.layers.Dense(6)])
+	model.compile(optimizer=keras.optimizers.Adam(0.01), loss="mse")
+	return model
+
+def _slots(model) -> list:
+	"""
+	Values of the optimizer slots of the model weights. Scalar optimizer variables, like the step counter and,
+	since keras 3, the learning rate, are left out. variables is a method of legacy optimizers.
+	"""
+	optimizer = model.optimizer
+	variables = optimizer.variables() if callable(optimizer.variables) else optimizer.variables
+	weight_shapes = {tuple(weight.shape) for weight in model.trainable_weights}
+	return [np.asarray(variable) for variable in variables if len(variable.shape) > 0 and tuple(variable.shape) in weight_shapes]
+
+def _fit(sample_dir, directory, resume=False, callbacks=None):
+	generator = _generator(sample_dir)
+	model = _model()
+	checkpoint = TrainingCheckpoint(directory, generator, STEPS_PER_EPOCH, save_steps=2)
+	fit_resumable(model, generator, STEPS_PER_EPOCH, EPOCHS, checkpoint=checkpoint, resume=resume, callbacks=callbacks, verbose=0)
+	return model
+
+@pytest.mark.parametrize("epoch,step", [(1, 3), (2, 1)])
+def test_resume_continues_training(tmp_path, epoch, step):
+	(tmp_path / "samples").mkdir()
+	with h5py.File(tmp_path / "samples" / "samples.h5", 'w') as hf:
+		hf.create_dataset("encodings", data=np.random.default_rng(0).random((200, 6)) < 0.5)
+	sample_dir = str(tmp_path / "samples")
+	reference = _fit(sample_dir, str(tmp_path / "reference"))
+
+	with pytest.raises(Preemption):
+		_fit(sample_dir, str(tmp_path / "resumed"), callbacks=[PreemptAt(epoch, step)])
+	with open(tmp_path / "resumed" / STATE_FILE, 'r') as state_file:
+		state = json.load(state_file)
+	# The last state was saved at the last multiple of save_steps, or at the end of the epoch before
+	assert (state["epoch"], state["step"]) == (epoch, step // 2 * 2)
+	assert state["input"]["seed"] == 5
+
+	resumed = _fit(sample_dir, str(tmp_path / "resumed"), resume=True)
+	for weights, reference_weights in zip(resumed.get_weights(), reference.get_weights()):
+		assert np.allclose(weights, reference_weights, atol=1e-6)
+	assert int(resumed.optimizer.iterations.numpy()) == int(reference.optimizer.iterations.numpy()) == EPOCHS * STEPS_PER_EPOCH
+	# Restored slots are created in a different order and their names depend on the keras version, they are matched by value
+	resumed_slots, reference_slots = _slots(resumed), _slots(reference)
+	assert len(resumed_slots) == len(reference_slots) == 2 * len(reference.trainable_weights)
+	for value in resumed_slots:
+		assert any(value.shape == slot.shape and np.allclose(value, slot, atol=1e-6) for slot in reference_slots)
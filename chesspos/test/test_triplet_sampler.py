@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from chesspos.preprocessing.triplet_sampler import TripletSampler
+
+def _game_ids():
+	# Games of 1 to 30 positions, game 3 has a single position and no positive
+	rng = np.random.default_rng(0)
+	return np.repeat(np.arange(1, 201), rng.integers(1, 31, 200)).astype(np.int32)
+
+def test_triplets_respect_games():
+	game_ids = _game_ids()
+	sampler = TripletSampler(game_ids, max_distance=3, seed=1)
+	triplets = sampler.sample(20000)
+	anchors, positives, negatives = triplets.T
+
+	assert triplets.shape == (20000, 3)
+	assert np.all(game_ids[anchors] == game_ids[positives])
+	assert np.all((np.abs(positives - anchors) >= 1) & (np.abs(positives - anchors) <= 3))
+	assert np.all(game_ids[anchors] != game_ids[negatives])
+	# Positives come from both sides and negatives from everywhere
+	assert np.any(positives < anchors) and np.any(positives > anchors)
+	assert np.unique(game_ids[negatives]).shape[0] == 200
+	assert np.array_equal(TripletSampler(game_ids, max_distance=3, seed=1).sample(20000), triplets)
+
+def test_hard_negatives():
+	game_ids = np.repeat(np.arange(4), 4)
+	sampler = TripletSampler(game_ids, seed=0)
+	triplets = np.array([[0, 1, 8], [4, 5, 12]])
+	# One dimensional embeddings: the row index, positives are one row away
+	embeddings = triplets[..., np.newaxis].astype(np.float32)
+
+	hard = sampler.hard_negatives(triplets, embeddings)
+	assert np.array_equal(hard[:, :2], triplets[:, :2])
+	# Closest rows of another game that are farther than the positive
+	assert np.array_equal(hard[:, 2], [4, 1])
+
+def test_triplet_batches():
+	game_ids = _game_ids()
+	encodings = np.arange(game_ids.shape[0], dtype=np.float32)[:, np.newaxis].repeat(5, axis=1)
+	sampler = TripletSampler(game_ids, seed=2)
+	batch = next(sampler.triplet_batches(encodings, 64, encoder=lambda x: x[:, :2]))
+	assert batch.shape == (64, 3, 5)
+	rows = batch[..., 0].astype(np.int64)
+	assert np.all(game_ids[rows[:, 0]] == game_ids[rows[:, 1]])
+	assert np.all(game_ids[rows[:, 0]] != game_ids[rows[:, 2]])
+
+def test_triplets_need_two_games():
+	with pytest.raises(ValueError):
+		TripletSampler(np.ones(10))
@@ -1,5 +1,33 @@
+import threading
+
+import pytest
+
 import chesspos.utils.file_utils as ut
+from chesspos.utils.prefetch import prefetch
 
 def test_correct_file_ending():
 	assert ut.correct_file_ending("data/hello", "txt") == "data/hello.txt"
 	assert ut.correct_file_ending("one_file.pyc", "pyc") == "one_file.pyc"
+
+def test_prefetch():
+	for depth in [0, 1, 4]:
+		assert list(prefetch(iter(range(100)), depth)) == list(range(100))
+
+	def failing():
+		yield 1
+		raise ValueError("read error")
+	with pytest.raises(ValueError):
+		list(prefetch(failing(), 2))
+
+	# Stopping early ends the background thread and closes the iterator
+	closed = threading.Event()
+	def endless():
+		try:
+			while True:
+				yield 0
+		finally:
+			closed.set()
+	items = prefetch(endless(), 2)
+	next(items)
+	items.close()
+	assert closed.is_set()
@@ -0,0 +1,55 @@
+import queue
+import threading
+from typing import Iterator, TypeVar
+
+T = TypeVar("T")
+
+_END = object()
+
+def prefetch(iterator: Iterator[T], depth: int = 2) -> Iterator[T]:
+	"""
+	Advance iterator on a background thread, at most depth items ahead of the consumer.
+	With depth 0 the iterator is consumed directly. Exceptions are raised in the consumer.
+	"""
+	if depth <= 0:
+		yield from iterator
+		return
+
+	items = queue.Queue(maxsize=depth)
+	stop = threading.Event()
+
+	def put(item) -> bool:
+		while not stop.is_set():
+			try:
+				items.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				continue
+		return False
+
+	def fill() -> None:
+		try:
+			for item in iterator:
+				if not put(item):
+					return
+			put(_END)
+		except BaseException as e:
+			put(e)
+		finally:
+			# Release resources of generators on this thread, e.g. open files
+			if hasattr(iterator, "close"):
+				iterator.close()
+
+	thread = threading.Thread(target=fill, daemon=True)
+	thread.start()
+	try:
+		while True:
+			item = items.get()
+			if item is _END:
+				return
+			if isinstance(item, BaseException):
+				raise item
+			yield item
+	finally:
+		stop.set()
+		thread.join()